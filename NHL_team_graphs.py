@@ -1,12 +1,10 @@
-import unittest
-import sqlite3
-import json
-import os
 import numpy as np
-from scipy import stats
-import seaborn as sns
 import matplotlib.pyplot as plt
-import csv
+import seasons
+import schema
+import NHL_team_success
+import export
+import render
 
 def read_team_csv(filename):
     """
@@ -22,21 +20,49 @@ def read_team_csv(filename):
     data: list of lists
         A list of lists, each representing a row of the CSV file.
     """
-    data = []
-
-    with open(filename, 'r') as csvfile:
-        csvreader = csv.reader(csvfile)
-        
-        header = next(csvreader)
-        data.append(header)
-        
-        for row in csvreader:
-            data.append(row)
-    
-    print(data)
+    return list(export.iter_csv(filename))
+
+def read_team_arrow(filename):
+    """
+    Reads team-related player information from an Arrow IPC file written by
+    NHL_team_success.write_csv("arrow"). The file is memory-mapped, not parsed.
+
+    Parameters
+    -----------------------
+    filename: str
+        The name of the Arrow file to read data from.
+
+    Returns
+    -----------------------
+    data: list of lists
+        The header row followed by one row per team, in the same shape as read_team_csv.
+    """
+    table = export.read_arrow(filename)
+    return [table.column_names] + [list(row) for row in zip(*table.to_pydict().values())]
+
+def read_team_summary(cur, conn):
+    """
+    Reads the team totals from the Team_Summary table in the same shape as read_team_csv.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    conn: Connection
+        The database connection object.
+
+    Returns
+    -----------------------
+    data: list of lists
+        The header row followed by one row per team, with per-million values rounded like the CSV.
+    """
+    data = [NHL_team_success.HEADER]
+    for row in NHL_team_success.get_team_totals(cur, conn):
+        data.append(NHL_team_success.format_team_row(row))
     return data
 
-def goals_per_mil_graph(data):
+def goals_per_mil_graph(data, out_path=None):
     """
     Reads team-related player information from a CSV file.
 
@@ -45,6 +71,9 @@ def goals_per_mil_graph(data):
     data: list of lists
         A list of lists, each representing a row of the CSV file.
 
+    out_path: str
+        File to save the graph to, like "goals.png". If None, the graph is shown instead.
+
     Returns
     -----------------------
     None
@@ -61,7 +90,7 @@ def goals_per_mil_graph(data):
     sorted_data = sorted(zip(teams, goals_per_million), key=lambda x: x[1], reverse=True)
     sorted_teams, sorted_goals_per_million = zip(*sorted_data)
 
-    plt.figure(figsize=(10, 6))
+    render.figure((10, 6))
     plt.bar(sorted_teams, sorted_goals_per_million, color='skyblue')
     plt.xlabel('Team')
     plt.ylabel('Goals per Million $')
@@ -70,9 +99,9 @@ def goals_per_mil_graph(data):
     plt.ylim(0, max(sorted_goals_per_million) + 1)
 
     plt.tight_layout() 
-    plt.show()
+    render.finish(out_path)
 
-def penalties_per_mil_graph(data):
+def penalties_per_mil_graph(data, out_path=None):
     """
     Reads team-related player information from a CSV file.
 
@@ -81,6 +110,9 @@ def penalties_per_mil_graph(data):
     data: list of lists
         A list of lists, each representing a row of the CSV file.
 
+    out_path: str
+        File to save the graph to, like "goals.png". If None, the graph is shown instead.
+
     Returns
     -----------------------
     None
@@ -97,7 +129,7 @@ def penalties_per_mil_graph(data):
     sorted_data = sorted(zip(teams, penalties_per_million), key=lambda x: x[1], reverse=True)
     sorted_teams, sorted_penalties_per_million = zip(*sorted_data)
 
-    plt.figure(figsize=(10, 6))
+    render.figure((10, 6))
     plt.bar(sorted_teams, sorted_penalties_per_million, color='skyblue')
     plt.xlabel('Team')
     plt.ylabel('Penalties per Million $')
@@ -106,10 +138,10 @@ def penalties_per_mil_graph(data):
     plt.ylim(0, max(sorted_penalties_per_million) + 1)
 
     plt.tight_layout() 
-    plt.show()
+    render.finish(out_path)
 
 
-def penalties_vs_goals_per_mil_graph(data):
+def penalties_vs_goals_per_mil_graph(data, out_path=None):
     """
     Graphs penalties per million in salary against goals per million in salary.
 
@@ -118,6 +150,9 @@ def penalties_vs_goals_per_mil_graph(data):
     data: list of lists
         A list of lists, each representing a row of the CSV file.
 
+    out_path: str
+        File to save the graph to, like "goals.png". If None, the graph is shown instead.
+
     Returns
     -----------------------
     None
@@ -131,7 +166,7 @@ def penalties_vs_goals_per_mil_graph(data):
         goals_per_million.append(float(team[4]))
         penalties_per_million.append(float(team[5]))
 
-    plt.figure(figsize=(10, 6))
+    render.figure((10, 6))
     plt.scatter(goals_per_million, penalties_per_million, color='skyblue')
 
     for i, team in enumerate(teams):
@@ -149,22 +184,49 @@ def penalties_vs_goals_per_mil_graph(data):
     plt.plot(goals_per_million, p(goals_per_million), 'r', label=f'Pens = {z[1]:.2f} + {z[0]:.2f} * Goals')
     plt.legend(fontsize=9)
 
-    plt.show()
+    render.finish(out_path)
 
-def team_graphs():
+TEAM_CHARTS = [
+    ("goals_per_million", goals_per_mil_graph),
+    ("penalties_per_million", penalties_per_mil_graph),
+    ("penalties_vs_goals_per_million", penalties_vs_goals_per_mil_graph),
+]
+
+def team_graphs(filename=None, out_dir=None, file_format="png", workers=None):
     """
     Calls all the functions to do what this file does.
 
     Parameters
     -----------------------
-    None
+    filename: str
+        Optional .csv or .arrow file to graph. If None, the precomputed Team_Summary
+        table in the current season's database is read instead.
+
+    out_dir: str
+        If given, the graphs are rendered to files in this folder in worker processes
+        instead of being shown.
+
+    file_format: str
+        "png" or "svg", used with out_dir.
+
+    workers: int
+        Number of worker processes, used with out_dir.
 
     Returns
     -----------------------
     None
     """
-    filename = 'NHL_teams.csv'
-    data = read_team_csv(filename)
-    goals_per_mil_graph(data)
-    penalties_per_mil_graph(data)
-    penalties_vs_goals_per_mil_graph(data)
+    if filename and filename.endswith('.arrow'):
+        data = read_team_arrow(filename)
+    elif filename:
+        data = read_team_csv(filename)
+    else:
+        cur, conn = NHL_team_success.set_up_database(seasons.season_db_name())
+        schema.migrate(cur, conn)
+        data = read_team_summary(cur, conn)
+        conn.close()
+    if out_dir:
+        render.render_charts([(name, graph, (data,)) for name, graph in TEAM_CHARTS], out_dir, file_format, workers)
+        return
+    for _, graph in TEAM_CHARTS:
+        graph(data)
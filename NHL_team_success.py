@@ -1,13 +1,10 @@
-import unittest
 import sqlite3
-import json
 import os
-import numpy as np
-from scipy import stats
-import seaborn as sns
-import matplotlib.pyplot as plt
-import csv
+import seasons
+import schema
+import export
 
+HEADER = ['Team', 'Goals', 'Penalties', 'Salary', 'Goals/million', 'Penalties/million']
 
 def set_up_database(db_name):
     """
@@ -55,82 +52,120 @@ def get_info(cur, conn):
     return result
 
 
+def iter_team_totals(cur, conn, batch_size=export.BATCH_SIZE):
+    """
+    Yields the goals, penalty minutes and salary for each team, along with goals and
+    penalty minutes per million dollars of salary, from the Team_Summary table.
+    Only reads: the writers refresh Team_Summary, so an ingest still running
+    shows up once it finishes.
+    Players traded during the season count toward every team they played for,
+    and players without a salary are left out.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    conn: Connection
+        The database connection object.
+
+    batch_size: int
+        Rows fetched from SQLite at a time.
+
+    Returns
+    -----------------------
+    Generator of tuples:
+        (team, goals, penalties, salary, goals_per_million, penalties_per_million) for each team,
+        in the order each team first shows up in the Players table.
+    """
+    query = '''
+    SELECT team, goals, penalties, salary, goals_per_million, penalties_per_million
+    FROM Team_Summary
+    ORDER BY first_seen
+    '''
+
+    yield from export.iter_query(cur, query, batch_size=batch_size)
+
+
+def get_team_totals(cur, conn):
+    """
+    Gets every row from iter_team_totals as a list.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    conn: Connection
+        The database connection object.
+
+    Returns
+    -----------------------
+    Result: List of tuples
+        (team, goals, penalties, salary, goals_per_million, penalties_per_million) for each team.
+    """
+    return list(iter_team_totals(cur, conn))
+
+
+def format_team_row(row):
+    """
+    Rounds the per-million columns of a get_team_totals row the way the CSV stores them.
+
+    Parameters
+    -----------------------
+    row: tuple
+        (team, goals, penalties, salary, goals_per_million, penalties_per_million)
+
+    Returns
+    -----------------------
+    List:
+        The row with both per-million values rounded to 2 places.
+    """
+    team, goals, penalties, salary, goals_per_million, penalties_per_million = row
+    return [team, goals, penalties, salary, round(goals_per_million, 2), round(penalties_per_million, 2)]
+
+
 def write_team_csv(data, filename):
     """
-    Creates a list with all player points for players with at least a minimum number of games played
+    Writes the team totals to a CSV file row by row as they come in.
 
     Parameters
     -----------------------
-    data: List of tuples
-        Each tuple contains player details including team name, goals, penalty minutes, and salary.
+    data: iterable of tuples
+        Rows from iter_team_totals or get_team_totals. Each tuple contains team name,
+        goals, penalty minutes, salary, goals per million and penalties per million.
 
     filename: str
         The name of the CSV file to write data to.
 
-
-
     Returns
     -----------------------
     None
 
     """
-    header = ['Team', 'Goals', 'Penalties', 'Salary', 'Goals/million', 'Penalties/million']
-
-    with open(filename, 'w', newline='') as csvfile:
-        csvwriter = csv.writer(csvfile)
-
-        csvwriter.writerow(header)
-
-
-        team_dict = {}
-        processed_data = []
-
-        for row in data:
-            if row[3]:
-                teams = row[0].split(',')
-                goals = row[1]
-                penalties = row[2]
-                salary = row[3]
-
-                for team in teams:
-                    if team not in team_dict:
-                        team_dict[team] = {'Goals': 0, 'Penalties': 0, 'Salary': 0}
-                
-                    team_dict[team]['Goals'] += goals
-                    team_dict[team]['Penalties'] += penalties
-                    team_dict[team]['Salary'] += salary
-            
-        for team, stats in team_dict.items():
-            if stats['Salary'] > 0:
-                team_dict[team]['goals_per_million'] = stats['Goals'] / (stats['Salary'] / 1000000)
-                team_dict[team]['penalty_minutes_per_million'] = stats['Penalties'] / (stats['Salary'] / 1000000)
-            else:
-                team_dict[team]['goals_per_million'] = 0
-                team_dict[team]['penalty_minutes_per_million'] = 0
-            
-            
-        
-        for team in team_dict:    
-            row = [team, team_dict[team]['Goals'], team_dict[team]['Penalties'], team_dict[team]['Salary'],
-                    round(team_dict[team]['goals_per_million'], 2), round(team_dict[team]['penalty_minutes_per_million'], 2)]
-            csvwriter.writerow(row)
-
-
-
-
-def write_csv():
+    export.write_csv_rows((format_team_row(row) for row in data), filename, HEADER)
+
+
+def write_csv(file_format="csv"):
     """
-    Writes CSV with team calculations
+    Writes a file with team calculations
 
     Parameters
     -----------------------
-    None
+    file_format: str
+        "csv" writes NHL_teams.csv. "arrow" writes NHL_teams.arrow, which
+        NHL_team_graphs can memory-map, and "parquet" writes NHL_teams.parquet.
+        Both need pyarrow.
 
     Returns
     -----------------------
     None
     """
-    cur, conn = set_up_database('players2324.db')
-    data = get_info(cur, conn)
-    write_team_csv(data, 'NHL_teams.csv')
-    conn.close()
\ No newline at end of file
+    cur, conn = set_up_database(seasons.season_db_name())
+    schema.migrate(cur, conn)
+    data = (format_team_row(row) for row in iter_team_totals(cur, conn))
+    if file_format == "csv":
+        export.write_csv_rows(data, 'NHL_teams.csv', HEADER)
+    else:
+        export.write_columnar(data, f'NHL_teams.{file_format}', HEADER, file_format)
+    conn.close()
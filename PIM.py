@@ -1,36 +1,41 @@
 import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+import crawl_pipeline
+import rate_limit
+import html_parsers
+import bulk_loader
+import seasons
+import schema
 import sqlite3
-import re
 
 # Function to get page content with headers
-def get_page_content(url):
+def get_page_text(url, scheduler=None):
     """
-    Takes a URL and returns a BeautifulSoup object from the response.
+    Takes a URL and returns the page's HTML as text.
+    Requests are queued at NCAA priority on the shared rate_limit scheduler.
 
     Parameters
     -----------------------
     URL:
         A website URL
 
+    scheduler:
+        Optional rate_limit.RequestScheduler. Uses the shared one if None.
+
     Returns
     -----------------------
-    A BeautifulSoup object or nothing.
+    The page text or nothing. Pages that kept failing are listed in the scheduler's dead_letters.
     """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36'
-    }
+    scheduler = scheduler or rate_limit.get_scheduler()
     try:
-        response = requests.get(url, headers=headers)
+        response = scheduler.request(url, "ncaa")
         response.raise_for_status()
-        return BeautifulSoup(response.text, 'html.parser')
+        return response.text
     except requests.exceptions.RequestException as e:
         print(f"Request failed for {url}: {e}")
         return None
 
 # Function to get all team links from the main NCAA page
-def get_team_links(base_url):
+def get_team_links(base_url, scheduler=None):
     """
     Gets all of the team URLs from the NCAA stats page with the teams listed.
 
@@ -39,25 +44,23 @@ def get_team_links(base_url):
     base_url:
         The page URL for the NCAA team stats page.
 
+    scheduler:
+        Optional rate_limit.RequestScheduler passed through to get_page_text.
+
     Returns
     -----------------------
     team_links:
         A list of URLs for the teams.
     """
-    soup = get_page_content(base_url)
-    if not soup:
+    text = get_page_text(base_url, scheduler)
+    if text is None:
         return []
-    team_links = []
-    for td in soup.find_all('td', class_='tp'):
-        link_tag = td.find('a')
-        if link_tag and 'href' in link_tag.attrs:
-            team_links.append("https://www.hockeydb.com" + link_tag['href'])
-    return team_links
-
-# Function to check if a team has an active 2023-2024 season and return the season link
-def get_season_link(team_url):
+    return ["https://www.hockeydb.com" + href for href in html_parsers.extract_team_links(text)]
+
+# Function to check if a team has an active season (2023-2024 by default) and return the season link
+def get_season_link(team_url, scheduler=None, season=seasons.CURRENT_SEASON):
     """
-    Checks a team's URL to see if they have a team listed for the 2023-2024 season
+    Checks a team's URL to see if they have a team listed for the season
     and returns the link to that season's stats for the team.
 
     Parameters
@@ -65,23 +68,29 @@ def get_season_link(team_url):
     team_url:
         A NCAA team's URL.
 
+    scheduler:
+        Optional rate_limit.RequestScheduler passed through to get_page_text.
+
+    season:
+        Season ID, like "20232024".
+
     Returns
     -----------------------
-    Nothing or a string with the URL for the 2023-2024 season for that team.
+    Nothing or a string with the URL for the season for that team.
     """
-    soup = get_page_content(team_url)
-    if not soup:
+    label = seasons.hockeydb_label(season)
+    text = get_page_text(team_url, scheduler)
+    if text is None:
         return None
-    for row in soup.find_all('tr'):
-        season_link = row.find('a', href=True)
-        if season_link and '2023-24' in season_link.text.lower():  # Case-insensitive
-            return "https://www.hockeydb.com" + season_link['href']
-    return None
-
-# Function to scrape player data from the 2023-2024 season page
-def scrape_players(season_url, team_name):
+    href = html_parsers.extract_season_link(text, label)
+    if href is None:
+        return None
+    return "https://www.hockeydb.com" + href
+
+# Function to scrape player data from a team's season page
+def scrape_players(season_url, team_name, scheduler=None):
     """
-    Scrapes the player data from the 2023-2024 season stats for a team.
+    Scrapes the player data from a season's stats page for a team.
 
     Parameters
     -----------------------
@@ -91,37 +100,44 @@ def scrape_players(season_url, team_name):
     team_name:
         The team this data is for
 
+    scheduler:
+        Optional rate_limit.RequestScheduler passed through to get_page_text.
+
     Returns
     -----------------------
     players_data:
         A list of player dictionaries with each player's stats.
     """
-    soup = get_page_content(season_url)
-    if not soup:
+    text = get_page_text(season_url, scheduler)
+    if text is None:
         return []
-    players_data = []
-    table = soup.find('table')
-    if table:
-        for row in table.find_all('tr')[1:]:
-            cells = row.find_all('td')
-            if cells and len(cells) >= 8:  # Ensure sufficient columns
-                player = {
-                    'Team': team_name,
-                    'Name': cells[1].get_text(strip=True),
-                    'Position': cells[2].get_text(strip=True),
-                    'GP': int(cells[3].get_text(strip=True) or 0),
-                    'G': int(cells[4].get_text(strip=True) or 0),
-                    'A': int(cells[5].get_text(strip=True) or 0),
-                    'PTS': int(cells[6].get_text(strip=True) or 0),
-                    'PIM': int(cells[7].get_text(strip=True) or 0)
-                }
-                players_data.append(player)
-    return players_data
+    return parse_players(text, team_name)
+
+def parse_players(text, team_name):
+    """
+    Reads the player rows out of a team's season stats page with the configured
+    html_parsers backend.
+
+    Parameters
+    -----------------------
+    text:
+        The page HTML from get_page_text.
+
+    team_name:
+        The team this data is for
+
+    Returns
+    -----------------------
+    players_data:
+        A list of player dictionaries with each player's stats.
+    """
+    return html_parsers.extract_players(text, team_name)
 
 # Function to handle database interactions
 def set_up_ncaa_table(cur, conn):
     """
-    Creates the NCAA_Teams and NCAA_Players tables in the DB if they don't exist.
+    Creates the NCAA_Teams and NCAA_Players tables in the DB if they don't exist,
+    along with the rest of the schema from schema.py.
 
     Parameters
     -----------------------
@@ -136,25 +152,11 @@ def set_up_ncaa_table(cur, conn):
     Nothing
     """
     # Create tables if not exist
-    cur.execute("CREATE TABLE IF NOT EXISTS NCAA_Teams (team_id INTEGER PRIMARY KEY, name TEXT UNIQUE)")
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS NCAA_Players (
-            player_id INTEGER PRIMARY KEY,
-            name TEXT,
-            team_id INTEGER,
-            games INTEGER,
-            points INTEGER,
-            penalty_min INTEGER,
-            goals INTEGER,
-            assists INTEGER,
-            FOREIGN KEY(team_id) REFERENCES NCAA_Teams(team_id)
-        )
-    """)
-    conn.commit()
-
-def insert_player_data(players, cur, conn):
+    schema.migrate(cur, conn)
+
+def insert_player_data(players, cur, conn, prune=False, pages=None):
     """
-    Iterates through the player data and adds any new data to the NCAA_Players table.
+    Adds or updates the player data in the NCAA_Players table in one batch through bulk_loader.
 
     Parameters
     -----------------------
@@ -167,42 +169,25 @@ def insert_player_data(players, cur, conn):
     conn:
         The database connection
 
+    prune:
+        If True, players of these teams who are no longer on the page are deleted.
+
+    pages:
+        Optional {team name: (season_url, content_hash)} stored along with the players.
+
     Returns
     -----------------------
     Nothing
     """
-    # Track team IDs
-    team_ids = {}
-
-    # Insert team data and players
-    for player in players:
-        team_name = player['Team']
-        # Check if team exists; if not, insert it
-        if team_name not in team_ids:
-            cur.execute("INSERT OR IGNORE INTO NCAA_Teams (name) VALUES (?)", (team_name,))
-            cur.execute("SELECT team_id FROM NCAA_Teams WHERE name = ?", (team_name,))
-            team_ids[team_name] = cur.fetchone()[0]
-
-        # Insert player data
-        cur.execute("""
-            INSERT OR IGNORE INTO NCAA_Players (name, team_id, games, points, penalty_min, goals, assists)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            player['Name'],
-            team_ids[team_name],
-            player['GP'],
-            player['PTS'],
-            player['PIM'],
-            player['G'],
-            player['A']
-        ))
-
-    conn.commit()
+    bulk_loader.bulk_insert_ncaa_players(players, cur, conn, prune, pages)
 
 # Main function to scrape and save data to the database
-def get_college_players(cur, conn):
+def get_college_players(cur, conn, max_workers=8, season=seasons.CURRENT_SEASON, scheduler=None,
+                        parse_workers=None, queue_size=crawl_pipeline.QUEUE_SIZE, batch_size=crawl_pipeline.BATCH_SIZE):
     """
     Utilizes the prior defined functions in PIM.py to scrape and add player data.
+    Pages are fetched by a thread pool, parsed by a process pool and written here
+    on the calling thread in batches, see crawl_pipeline.py.
 
     Parameters
     -----------------------
@@ -212,40 +197,50 @@ def get_college_players(cur, conn):
     conn:
         database connection
 
+    max_workers: int
+        Number of pages fetched at the same time. 1 crawls one page at a time.
+
+    season: str
+        Season ID to scrape, like "20232024".
+
+    scheduler: RequestScheduler
+        Optional rate_limit scheduler. If None, the shared one is used, which
+        paces hockeydb.com by rate_limit.HOST_LIMITS and sends these pages after
+        any queued salary or skater stats requests.
+
+    parse_workers: int
+        Number of processes parsing pages. None uses one per CPU.
+
+    queue_size: int
+        Pages or rosters allowed to wait between two stages before the earlier one pauses.
+
+    batch_size: int
+        Players written per insert.
+
     Returns
     -----------------------
-    Nothing
+    metrics: dict
+        Items, busy seconds and largest queue for the fetch, parse and write stages.
     """
-    base_url = "https://www.hockeydb.com/ihdb/stats/team_data.php?x=99&y=16&tname=&tcity=&tstate=&tleague=NCAA&y1=2023&y2=2024&college=on"
+    base_url = f"https://www.hockeydb.com/ihdb/stats/team_data.php?x=99&y=16&tname=&tcity=&tstate=&tleague=NCAA&y1={season[:4]}&y2={season[4:]}&college=on"
     proxies = None  # Set proxy if needed
+    scheduler = scheduler or rate_limit.get_scheduler()
     set_up_ncaa_table(cur, conn)
 
-    team_links = get_team_links(base_url)
-
-    for team_url in team_links:
-        team_name = team_url.split("/")[-1].replace("-", " ").title()
-        print(f"Checking team: {team_name}...")
-
-        # Check if the team is already in the database
-        cur.execute("SELECT team_id FROM NCAA_Teams WHERE name = ?", (team_name,))
-        if cur.fetchone():
-            print(f"Skipping {team_name} (already in database).")
-            continue
-
-        season_url = get_season_link(team_url)
-        if not season_url:
-            print(f"No active season found for {team_name}.")
-            continue
+    team_links = get_team_links(base_url, scheduler)
+    teams = [(team_url.split("/")[-1].replace("-", " ").title(), team_url) for team_url in team_links]
 
-        print(f"Active season found for {team_name}. Scraping player data...")
-        players_data = scrape_players(season_url, team_name)
+    # Hashes of the roster pages already stored, so unchanged teams are skipped
+    # without parsing. Pages come from the HTTP cache until its TTL runs out.
+    known_hashes = bulk_loader.get_team_page_hashes(cur)
 
-        # Save data to the database
-        if players_data:
-            insert_player_data(players_data, cur, conn)
-            print(f"Data for {team_name} added to the database.")
-        else:
-            print(f"No player data found for {team_name}.")
+    return crawl_pipeline.crawl(
+        teams, seasons.hockeydb_label(season),
+        fetch_text=lambda url: get_page_text(url, scheduler),
+        write=lambda players, pages: insert_player_data(players, cur, conn, prune=True, pages=pages),
+        known_hashes=known_hashes, fetch_workers=max_workers, parse_workers=parse_workers,
+        queue_size=queue_size, batch_size=batch_size,
+    )
 
 # Connect to the SQLite database and run the scraper
 """if __name__ == "__main__":
@@ -1,15 +1,14 @@
-import unittest
+import argparse
 import sqlite3
-import json
 import os
 import numpy as np
-from scipy import stats
-import seaborn as sns
-import NHL_team_graphs
-import NHL_team_success
-import players_api
+import seasons
+import schema
+import query_cache
 
-import matplotlib.pyplot as plt
+# matplotlib, seaborn and the scraping modules take most of the start-up time,
+# so they are imported inside the functions and commands that use them. Importing
+# this module has no side effects; run it as a script for the command line.
 
 
 def set_up_database(db_name):
@@ -32,9 +31,10 @@ def set_up_database(db_name):
     return cur, conn
 
 
-def get_player_points_pens(table, min_gp, min_pts, min_pen, cur, conn):
+def get_player_points_pens(table, min_gp, min_pts, min_pen, cur, conn, season_ids=None, game_type="2"):
     """
-    Creates a list with all player points for players with at least a minimum number of games played
+    Creates a list with all player points for players with at least a minimum number of games played.
+    Results are reused from query_cache until the database is written to.
 
     Parameters
     -----------------------
@@ -56,41 +56,42 @@ def get_player_points_pens(table, min_gp, min_pts, min_pen, cur, conn):
     conn: Connection
         The database connection object.
 
+    season_ids: list
+        Optional season IDs to read from their own database files. If None, only the connected database is read.
+
+    game_type: str
+        "2" for the regular season, "3" for playoffs. Used with season_ids.
+
     Returns
     -----------------------
-    Points (list):
-        A list containing entries for each player's point total.
+    Points (ndarray):
+        An array containing entries for each player's point total.
     
-    Penalty_min (list):
-        A list containing entries for each player's penalty minute total.
+    Penalty_min (ndarray):
+        An array containing entries for each player's penalty minute total.
 
-    Names (list):
-        A list containing entries for each player's name.
+    Names (ndarray):
+        An array containing entries for each player's name.
     """
 
     query = f'''
     SELECT name, points, penalty_min, games 
-    FROM {table}
+    FROM {{schema}}.{table}
     WHERE games >= ? AND (points >= ? OR penalty_min >= ?)
     '''
     
-    cur.execute(query, (min_gp, min_pts, min_pen))
-    result = cur.fetchall()
-    
-    Points = []
-    Penalty_min = []
-    Names = []
-    for player in result:
-        Points.append(player[1])
-        Penalty_min.append(player[2])
-        Names.append(player[0])
-    
+    columns = query_cache.fetch_columns(cur, query, (min_gp, min_pts, min_pen),
+                                        [("name", object), ("points", np.int64), ("penalty_min", np.int64), ("games", np.int64)],
+                                        season_ids, game_type)
 
-    return Points, Penalty_min, Names
+    return columns["points"], columns["penalty_min"], columns["name"]
 
-def get_pts_per_penalty_minute(table, min_gp, min_pts, min_pen, cur, conn):
+def get_pts_per_penalty_minute(table, min_gp, min_pts, min_pen, cur, conn, season_ids=None, game_type="2"):
     """
-    Creates a list with all player points for players with at least a minimum number of games played
+    Reads points per penalty minute for players over the games, points and penalty minute thresholds
+    from the precomputed {table}_Metrics table, which the bulk loaders keep current. Players with
+    no penalty minutes are left out. Nothing is written here, and results are reused from
+    query_cache until the database is written to.
 
     Parameters
     -----------------------
@@ -112,43 +113,41 @@ def get_pts_per_penalty_minute(table, min_gp, min_pts, min_pen, cur, conn):
     conn: Connection
         The database connection object.
 
+    season_ids: list
+        Optional season IDs to read from their own database files. If None, only the connected database is read.
+
+    game_type: str
+        "2" for the regular season, "3" for playoffs. Used with season_ids.
+
     Returns
     -----------------------
-    pts_per_pen: List
-        list of values for points per penalty minute
+    pts_per_pen: ndarray
+        array of values for points per penalty minute
     """
 
     query = f'''
-    SELECT points, penalty_min
-    FROM {table}
-    WHERE games >= ? AND (points >= ? AND penalty_min >= ?)
+    SELECT pts_per_pim
+    FROM {{schema}}.{table}_Metrics
+    WHERE games >= ? AND points >= ? AND penalty_min >= ? AND pts_per_pim IS NOT NULL
     '''
     
-    cur.execute(query, (min_gp, min_pts, min_pen))
-    result = cur.fetchall()
-    
-    Points_per_pen = []
-    for player in result:
-        print(player)
-        Points_per_pen.append(player[0]/player[1])
-    
-
-    return Points_per_pen
+    return query_cache.fetch_columns(cur, query, (min_gp, min_pts, min_pen), [("pts_per_pim", np.float64)],
+                                     season_ids, game_type)["pts_per_pim"]
 
-def graph_points_pens(points, pens, names, min_pts, min_pens, league):
+def graph_points_pens(points, pens, names, min_pts, min_pens, league, out_path=None):
     """
     Creates graphs of points against penalty minutes for NHL and NCAA players
 
     Parameters
     -----------------------
-    points: list
-        list of points by each player
+    points: ndarray
+        points by each player
 
-    pens: list
-        list of penalty minutes by each player
+    pens: ndarray
+        penalty minutes by each player
 
-    names: list
-        list of player names
+    names: ndarray
+        player names
     
     min_pts: int
         minimum number of points to display names
@@ -156,27 +155,36 @@ def graph_points_pens(points, pens, names, min_pts, min_pens, league):
     min_pens: int
         minimum number of penalty minutes to display names
 
+    out_path: str
+        file to save the graph to, if None the graph is shown
+
     Returns
     -----------------------
     Nothing
     
     """
+    import matplotlib.pyplot as plt
+    import render
+
+    render.figure()
     plt.scatter(pens, points)
     plt.xlabel('Penalty Minutes')
     plt.ylabel('Points')
     plt.title(f'2023-24 {league} Players Points vs. Penalty Minutes')
-    for i, txt in enumerate(names):
-        if pens[i] >= min_pens or points[i] >= min_pts:
-            plt.annotate(txt, (pens[i], points[i]))
+    points = np.asarray(points)
+    pens = np.asarray(pens)
+    labeled = np.flatnonzero((pens >= min_pens) | (points >= min_pts))
+    for i in labeled:
+        plt.annotate(names[i], (pens[i], points[i]))
     
     z = np.polyfit(pens, points, 1).round(2)
     p = np.poly1d(z)
     plt.plot(pens, p(pens), 'r', label=f'Points = {z[1]} + {z[0]} * Penalty Minutes'.format(z[1],z[0]))
     plt.legend(fontsize=9)
 
-    plt.show()
+    render.finish(out_path)
 
-def graph_points_per_pen(Points_per_pen, league):
+def graph_points_per_pen(Points_per_pen, league, out_path=None):
     """
     Creates graphs of points per penalty minute for the NHL and NCAA players
 
@@ -185,15 +193,22 @@ def graph_points_per_pen(Points_per_pen, league):
     league: string
         NHL or NCAA
 
-    pts_per_pen: List
-        list of values for points per penalty minute
+    pts_per_pen: ndarray
+        array of values for points per penalty minute
+
+    out_path: str
+        file to save the graph to, if None the graph is shown
 
     Returns
     -----------------------
     Nothing
     
     """
-    plt.figure(figsize=(10, 6))
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    import render
+
+    render.figure((10, 6))
         
     sns.histplot(Points_per_pen, bins=50, kde=True, color='blue')
         
@@ -204,28 +219,272 @@ def graph_points_per_pen(Points_per_pen, league):
     plt.grid(True, linestyle='--', alpha=0.7)
     plt.xlim(left=0)
         
-    plt.show()
+    render.finish(out_path)
+
 
 
+def league_charts(cur, conn):
+    """
+    Reads the data for the NHL and NCAA player graphs.
 
-def main():
-    players_api.get_data()
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    conn: Connection
+        The database connection object.
 
-    cur, conn = set_up_database('players2324.db')
+    Returns
+    -----------------------
+    charts: list of tuples
+        (name, graph function, args) for each graph, in the order they are shown.
+    """
+    charts = []
     tables = {"Players": [41, 30, 40, 105, 130, "NHL"], "NCAA_Players": [16, 12, 15, 55, 70, "NCAA"]}
     for table, values in tables.items():
         points, penalty_min, names = get_player_points_pens(table, values[0], values[1], values[2], cur, conn)
-        graph_points_pens(points, penalty_min, names, values[3], values[4], values[5])
+        charts.append((f"{values[5]}_points_vs_penalties", graph_points_pens,
+                       (points, penalty_min, names, values[3], values[4], values[5])))
 
     tables2 = {"Players": [10, 5, 5, "NHL"], "NCAA_Players": [5, 2, 2, "NCAA"]}
     for table, values in tables2.items():
         pts_per_pen = get_pts_per_penalty_minute(table, values[0], values[1], values[2], cur, conn)
-        graph_points_per_pen(pts_per_pen, values[3])
+        charts.append((f"{values[3]}_points_per_penalty_minute", graph_points_per_pen, (pts_per_pen, values[3])))
+    return charts
+
+def plot(out_dir=None, file_format="png", workers=None):
+    """
+    Draws every graph from the current season's database.
+
+    Parameters
+    -----------------------
+    out_dir: str
+        If given, the graphs are saved to this folder in parallel instead of being shown.
+
+    file_format: str
+        "png" or "svg", used with out_dir.
+
+    workers: int
+        Number of worker processes, used with out_dir.
+
+    Returns
+    -----------------------
+    None
+    """
+    import NHL_team_graphs
+    import render
+
+    cur, conn = set_up_database(seasons.season_db_name())
+    schema.migrate(cur, conn)
+    charts = league_charts(cur, conn)
+    if out_dir:
+        # Headless: every graph, team graphs included, is saved to out_dir in parallel
+        team_data = NHL_team_graphs.read_team_summary(cur, conn)
+        charts += [(name, graph, (team_data,)) for name, graph in NHL_team_graphs.TEAM_CHARTS]
+        conn.close()
+        render.render_charts(charts, out_dir, file_format, workers)
+        return
+
+    for _, graph, args in charts:
+        graph(*args)
+    conn.close()
     
     NHL_team_graphs.team_graphs()
-    #NHL_team_success.write_csv()
 
-    
+def run_ingest(args):
+    """
+    Runs the ingest command: loads --season, or every season from --season to
+    --last-season, for the regular season or with --playoffs the playoffs.
+    With --last-season, a season ID that isn't a number raises ValueError.
+
+    Parameters
+    -----------------------
+    args: Namespace
+        Parsed arguments with season, last_season and playoffs.
+
+    Returns
+    -----------------------
+    None
+    """
+    import players_api
+
+    game_type = "3" if args.playoffs else "2"
+    if args.last_season:
+        players_api.ingest_seasons(args.season, args.last_season, game_types=(game_type,))
+    else:
+        players_api.ingest_season(args.season, game_type)
+
+def run_summarize(args):
+    """
+    Runs the summarize command: prints the team totals of the current season's database.
+
+    Parameters
+    -----------------------
+    args: Namespace
+        Parsed arguments, none are used.
+
+    Returns
+    -----------------------
+    None
+    """
+    import NHL_team_success
 
-main()
+    cur, conn = NHL_team_success.set_up_database(seasons.season_db_name())
+    schema.migrate(cur, conn)
+    print("{:<6} {:>6} {:>10} {:>12} {:>14} {:>18}".format(*NHL_team_success.HEADER))
+    for row in NHL_team_success.iter_team_totals(cur, conn):
+        print("{:<6} {:>6} {:>10} {:>12} {:>14} {:>18}".format(*NHL_team_success.format_team_row(row)))
+    conn.close()
 
+def run_link(args):
+    """
+    Runs the link command: matches the NCAA players of --season to the NHL
+    players of the seasons up to --last-season. A season ID that isn't a number raises ValueError.
+
+    Parameters
+    -----------------------
+    args: Namespace
+        Parsed arguments with season and last_season.
+
+    Returns
+    -----------------------
+    None
+    """
+    import identity
+
+    cur, conn = set_up_database(seasons.season_db_name(args.season))
+    schema.migrate(cur, conn)
+    identity.link_players(cur, conn, args.season, args.last_season)
+    conn.close()
+
+def run_sweep(args):
+    """
+    Runs the sweep command: prints one row per combination of the --gp, --pts
+    and --pen thresholds for --table in the --season database.
+
+    Parameters
+    -----------------------
+    args: Namespace
+        Parsed arguments with season, table, gp, pts and pen.
+
+    Returns
+    -----------------------
+    None
+    """
+    import threshold_sweep
+
+    cur, conn = set_up_database(seasons.season_db_name(args.season))
+    schema.migrate(cur, conn)
+    results = threshold_sweep.sweep_table(args.table, args.gp, args.pts, args.pen, cur)
+    conn.close()
+    print("{:>6} {:>7} {:>7} {:>7} {:>7} {:>9} {:>6} {:>7} {:>10}".format(
+        "min_gp", "min_pts", "min_pen", "players", "slope", "intercept", "r", "ratios", "mean_ratio"))
+    for row in threshold_sweep.iter_grid(results, args.gp, args.pts, args.pen):
+        print("{:>6} {:>7} {:>7} {:>7} {:>7.3f} {:>9.2f} {:>6.3f} {:>7} {:>10.3f}".format(*row))
+
+def int_list(text):
+    """
+    Parses a comma separated option like "0,10,20" for the sweep thresholds.
+    Raises ValueError on a value that isn't an integer, which argparse reports as a usage error.
+
+    Parameters
+    -----------------------
+    text: str
+        The option value.
+
+    Returns
+    -----------------------
+    values: list of int
+    """
+    return [int(value) for value in text.split(",")]
+
+def run_plot(args):
+    """
+    Runs the plot command: shows the graphs, or saves them to --out-dir as --format
+    with --workers processes.
+
+    Parameters
+    -----------------------
+    args: Namespace
+        Parsed arguments with out_dir, format and workers.
+
+    Returns
+    -----------------------
+    None
+    """
+    plot(args.out_dir, args.format, args.workers)
+
+def run_export(args):
+    """
+    Runs the export command: writes the team totals to NHL_teams.<--format>.
+    Arrow and Parquet raise ImportError if pyarrow isn't installed.
+
+    Parameters
+    -----------------------
+    args: Namespace
+        Parsed arguments with format.
+
+    Returns
+    -----------------------
+    None
+    """
+    import NHL_team_success
+
+    NHL_team_success.write_csv(args.format)
+
+def build_parser():
+    """
+    Builds the command line parser with the ingest, summarize, link, sweep, plot and export commands.
+
+    Parameters
+    -----------------------
+    None
+
+    Returns
+    -----------------------
+    ArgumentParser:
+        The parser. Each command sets func to the function that runs it.
+    """
+    parser = argparse.ArgumentParser(description="NHL and NCAA points and penalty minutes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="load player stats, salaries and NCAA rosters into the season database")
+    ingest.add_argument("--season", default=seasons.CURRENT_SEASON, help="season ID like 20232024, the first one with --last-season")
+    ingest.add_argument("--last-season", help="load every season from --season to this one")
+    ingest.add_argument("--playoffs", action="store_true", help="load playoff stats instead of the regular season")
+    ingest.set_defaults(func=run_ingest)
+
+    summarize = commands.add_parser("summarize", help="print goals, penalties and salary per team")
+    summarize.set_defaults(func=run_summarize)
+
+    link = commands.add_parser("link", help="match a season's NCAA players to the NHL players they became")
+    link.add_argument("--season", default=seasons.CURRENT_SEASON, help="season ID of the NCAA players")
+    link.add_argument("--last-season", default=seasons.CURRENT_SEASON, help="last NHL season to look for them in")
+    link.set_defaults(func=run_link)
+
+    sweep = commands.add_parser("sweep", help="print player counts and the points vs. penalty minutes fit for a grid of thresholds")
+    sweep.add_argument("--season", default=seasons.CURRENT_SEASON, help="season ID of the database to read")
+    sweep.add_argument("--table", default="Players", choices=["Players", "NCAA_Players"])
+    sweep.add_argument("--gp", type=int_list, default=[0, 10, 20, 41, 60], help="comma separated minimum games played")
+    sweep.add_argument("--pts", type=int_list, default=[0, 5, 12, 30], help="comma separated minimum points")
+    sweep.add_argument("--pen", type=int_list, default=[0, 5, 15, 40], help="comma separated minimum penalty minutes")
+    sweep.set_defaults(func=run_sweep)
+
+    plot_command = commands.add_parser("plot", help="draw the graphs, or save them with --out-dir")
+    plot_command.add_argument("--out-dir", help="save the graphs to this folder without a display")
+    plot_command.add_argument("--format", default="png", choices=["png", "svg"])
+    plot_command.add_argument("--workers", type=int, help="worker processes used with --out-dir")
+    plot_command.set_defaults(func=run_plot)
+
+    export_command = commands.add_parser("export", help="write the team totals to NHL_teams.<format>")
+    export_command.add_argument("--format", default="csv", choices=["csv", "arrow", "parquet"])
+    export_command.set_defaults(func=run_export)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1717 @@
+import difflib
+import http.server
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import numpy as np
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+import bulk_loader
+import columnar
+import crawl_pipeline
+import export
+import fetcher
+import html_parsers
+import http_cache
+import identity
+import metrics
+import players_api
+import PIM
+import rate_limit
+import schema
+
+# Benchmarks for the data pipeline. Run with `python benchmarks.py [name ...]`,
+# with no names every benchmark runs.
+
+TEAMS = ["TBL", "COL", "EDM", "NYR", "BOS", "TOR", "VAN", "MIN", "PIT", "NSH", "FLA", "CAR", "STL", "NJD", "WPG", "DET",
+         "ARI", "LAK", "CGY", "OTT", "VGK", "PHI", "WSH", "SEA", "CHI", "SJS", "CBJ", "ANA", "BUF", "MTL", "DAL", "NYI"]
+
+PLAYERS_TABLE = "CREATE TABLE IF NOT EXISTS Players (player_id INTEGER PRIMARY KEY, name TEXT, team_id INTEGER, salary INTEGER, games INTEGER, points INTEGER, penalty_min INTEGER, avg_icetime INTEGER, goals INTEGER, assists INTEGER, plus_minus INTEGER, shooting_perc FLOAT)"
+TEAMS_TABLE = "CREATE TABLE IF NOT EXISTS NHL_Teams (team_id INTEGER PRIMARY KEY, name TEXT)"
+
+def synthetic_players(count, seed=0):
+    """
+    Makes fake NHL API player dictionaries shaped like the summary report.
+
+    Parameters
+    -----------------------
+    count: int
+        Number of players to make.
+
+    seed: int
+        Random seed so runs are repeatable.
+
+    Returns
+    -----------------------
+    players: list
+        A list of player dictionaries.
+    """
+    rng = random.Random(seed)
+    players = []
+    for i in range(count):
+        games = rng.randint(1, 82)
+        goals = rng.randint(0, games // 2)
+        assists = rng.randint(0, games)
+        players.append({
+            'playerId': 8470000 + i,
+            'skaterFullName': f"Player {i}",
+            'teamAbbrevs': rng.choice(TEAMS),
+            'gamesPlayed': games,
+            'points': goals + assists,
+            'penaltyMinutes': rng.randint(0, 150),
+            'timeOnIcePerGame': rng.uniform(300, 1500),
+            'goals': goals,
+            'assists': assists,
+            'plusMinus': rng.randint(-30, 30),
+            'shootingPct': rng.random() / 4,
+        })
+    return players
+
+def temp_database():
+    """
+    Creates an empty database file with the Players and NHL_Teams tables.
+
+    Parameters
+    -----------------------
+    None
+
+    Returns
+    -----------------------
+    Tuple (path, Cursor, Connection):
+        Where the database file is, plus its cursor and connection.
+    """
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    cur.execute(PLAYERS_TABLE)
+    cur.execute(TEAMS_TABLE)
+    return path, cur, conn
+
+def remove_database(path):
+    """
+    Deletes a temporary database file along with its WAL and shared memory files.
+
+    Parameters
+    -----------------------
+    path: str
+        The database file.
+
+    Returns
+    -----------------------
+    None
+    """
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def row_by_row_insert(players, cur, conn):
+    """
+    The original set_up_player_table insert loop, kept as the benchmark baseline.
+
+    Parameters
+    -----------------------
+    players: list
+        Player dictionaries.
+
+    cur: Cursor
+        The database cursor object.
+
+    conn: Connection
+        The database connection object.
+
+    Returns
+    -----------------------
+    None
+    """
+    team_dict = {}
+    for player in players:
+        if player['teamAbbrevs'] not in team_dict.keys():
+            team_dict[player['teamAbbrevs']] = len(team_dict)
+        cur.execute(
+            "INSERT OR IGNORE INTO Players (player_id, name, team_id, games, points, penalty_min, avg_icetime, goals, assists, plus_minus, shooting_perc) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (player['playerId'], player['skaterFullName'], team_dict[player['teamAbbrevs']], player['gamesPlayed'], player['points'], player['penaltyMinutes'], player['timeOnIcePerGame'], player['goals'], player['assists'], player['plusMinus'], player['shootingPct'])
+        )
+    for name, id in team_dict.items():
+        cur.execute("INSERT OR IGNORE INTO NHL_Teams (team_id, name) VALUES (?, ?)", (id, name))
+    conn.commit()
+
+def bench_bulk_load(sizes=(1000, 10000, 100000), repeat=5, noise=0.1):
+    """
+    Compares the row-by-row insert loop with bulk_loader at several table sizes,
+    both on the migrated schema so they pay for the same indexes and triggers.
+    The refresh_players pass an ingest runs after its last page is timed on its
+    own. Fails if bulk_insert_players is slower than the loop by more than noise.
+
+    Parameters
+    -----------------------
+    sizes: tuple
+        Numbers of synthetic players to load.
+
+    repeat: int
+        Number of runs per size, the fastest of which is kept.
+
+    noise: float
+        Fraction by which bulk_insert_players may trail the loop before the
+        benchmark fails. Most of the time per row is SQLite updating the indexes
+        and running the triggers, which both approaches pay, so at small sizes
+        the two are within timing noise of each other.
+
+    Returns
+    -----------------------
+    results: list of tuples
+        (size, row_by_row_seconds, bulk_seconds, bulk_upsert_seconds, refresh_seconds) for each size.
+    """
+    results = []
+    print(f"{'players':>8} {'row-by-row':>11} {'bulk':>8} {'upsert':>8} {'refresh':>8} {'speedup':>8}")
+    for size in sizes:
+        players = synthetic_players(size)
+        row_time = bulk_time = upsert_time = refresh_time = float("inf")
+        for _ in range(repeat):
+            path, cur, conn = temp_database()
+            schema.migrate(cur, conn)
+            # WAL is a setting of the file that only the first bulk load pays for, so both start in it
+            conn.execute("PRAGMA journal_mode=WAL")
+            start = time.perf_counter()
+            row_by_row_insert(players, cur, conn)
+            row_time = min(row_time, time.perf_counter() - start)
+            conn.close()
+            remove_database(path)
+
+            path, cur, conn = temp_database()
+            schema.migrate(cur, conn)
+            conn.execute("PRAGMA journal_mode=WAL")
+            start = time.perf_counter()
+            team_dict = {}
+            rows = bulk_loader.stage_players(players, team_dict)
+            bulk_loader.bulk_insert_players(rows, team_dict, cur, conn)
+            bulk_time = min(bulk_time, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with conn:
+                refreshed = bulk_loader.refresh_players(cur)
+            refresh_time = min(refresh_time, time.perf_counter() - start)
+            assert refreshed == size, (refreshed, size)
+
+            # Second pass over the same players updates every row
+            start = time.perf_counter()
+            bulk_loader.bulk_insert_players(rows, team_dict, cur, conn, upsert=True)
+            upsert_time = min(upsert_time, time.perf_counter() - start)
+            conn.close()
+            remove_database(path)
+
+        print(f"{size:>8} {row_time:>10.3f}s {bulk_time:>7.3f}s {upsert_time:>7.3f}s {refresh_time:>7.3f}s {row_time / bulk_time:>7.1f}x")
+        results.append((size, row_time, bulk_time, upsert_time, refresh_time))
+        assert bulk_time <= row_time * (1 + noise), f"bulk_insert_players took {bulk_time:.3f}s for {size} players, the loop {row_time:.3f}s"
+    return results
+
+def stats_stub_server(players, latency=0.05, reports=None):
+    """
+    Starts a local HTTP server that answers like the NHL stats endpoint
+    (/stats/rest/en/skater/<report>?start=&limit=) from a list of players.
+
+    Parameters
+    -----------------------
+    players: list
+        Player dictionaries to serve, for example from synthetic_players.
+
+    latency: float
+        Seconds each response is held back to act like a remote server.
+
+    reports: dict
+        Optional {report type: rows} served for those reports instead of players.
+
+    Returns
+    -----------------------
+    Tuple (server, stats_url):
+        The running server (call shutdown() when done) and the URL to use as players_api.STATS_URL.
+    """
+    class StatsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            start = int(query.get("start", ["0"])[0])
+            limit = int(query.get("limit", ["25"])[0])
+            rows = (reports or {}).get(url.path.rsplit("/", 1)[-1], players)
+            body = json.dumps({"data": rows[start:start + limit], "total": len(rows)}).encode("utf-8")
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StatsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/stats/rest/en/skater/"
+
+def bench_http_cache(body_size=1000):
+    """
+    Checks http_cache.ResponseCache against a stub session that counts requests
+    and answers 304 when If-None-Match carries the current ETag: fresh entries
+    are served without a request, entries past their host's TTL are revalidated
+    and keep their body on 304 or take the new one on 200, the least recently
+    used bodies are evicted first, and offline mode serves stale entries and
+    answers 504 for the rest without touching the network.
+
+    Parameters
+    -----------------------
+    body_size: int
+        Bytes in each stub response body.
+
+    Returns
+    -----------------------
+    Dictionary:
+        The cache's counters after the checks.
+    """
+    class StubSession:
+        def __init__(self):
+            self.pages = {}
+            self.requests = []
+
+        def get(self, url, params=None, headers=None, timeout=None):
+            self.requests.append((url, dict(headers or {})))
+            etag, body = self.pages[url]
+            response = requests.Response()
+            response.url = url
+            if (headers or {}).get("If-None-Match") == etag:
+                response.status_code = 304
+                response._content = b""
+            else:
+                response.status_code = 200
+                response._content = body
+                response.headers["ETag"] = etag
+            return response
+
+    def body(name):
+        return name.encode("utf-8").ljust(body_size, b".")
+
+    session = StubSession()
+    with tempfile.TemporaryDirectory() as directory:
+        # fresh.test keeps responses for an hour, stale.test has to ask every time
+        cache = http_cache.ResponseCache(directory, ttls={"fresh.test": 3600, "stale.test": 0}, max_bytes=3 * body_size)
+        fresh, stale = "http://fresh.test/a", "http://stale.test/b"
+        session.pages = {fresh: ('"a1"', body("a1")), stale: ('"b1"', body("b1"))}
+        for url in (fresh, stale):
+            assert cache.get(session, url).content == session.pages[url][1]
+        assert len(session.requests) == 2
+
+        # Within its TTL: no request at all
+        response = cache.get(session, fresh)
+        assert response.from_cache and response.content == body("a1") and len(session.requests) == 2
+
+        # Past its TTL with the same ETag: a conditional GET, answered 304, serves the stored body
+        response = cache.get(session, stale)
+        assert session.requests[-1][1].get("If-None-Match") == '"b1"', session.requests[-1]
+        assert response.from_cache and response.content == body("b1")
+        assert cache.stats["revalidated"] == 1, cache.stats
+
+        # The page changed: the new body replaces the stored one
+        session.pages[stale] = ('"b2"', body("b2"))
+        assert cache.get(session, stale).content == body("b2")
+        session.pages[stale] = ('"b3"', body("b3"))
+        assert cache.get(session, stale).content == body("b3")
+        assert cache.stats["revalidated"] == 1 and len(session.requests) == 5, (cache.stats, session.requests)
+
+        # LRU: fill the cache past max_bytes after touching fresh, so stale's body goes first
+        others = [f"http://fresh.test/{name}" for name in ("c", "d")]
+        for url in others:
+            session.pages[url] = ('"x"', body(url))
+        time.sleep(0.01)
+        cache.get(session, others[0])
+        time.sleep(0.01)
+        assert cache.get(session, fresh).from_cache
+        time.sleep(0.01)
+        cache.get(session, others[1])
+        assert cache.stats["evicted"] >= 1, cache.stats
+        assert cache.lookup(fresh) is not None, "the most recently read entry was evicted"
+        assert not os.path.exists(cache._path(cache.key(stale), ".body")), "the least recently used entry was kept"
+
+        # Offline: stored entries are served whatever their age, anything else is a 504
+        offline = http_cache.ResponseCache(directory, ttls={"fresh.test": 0}, offline=True)
+        sent = len(session.requests)
+        assert offline.get(session, fresh).content == body("a1")
+        missing = offline.get(session, "http://fresh.test/never")
+        assert missing.status_code == 504 and missing.from_cache
+        assert len(session.requests) == sent, "offline mode used the network"
+
+    stats = dict(cache.stats)
+    print(f"online:  {stats}")
+    print(f"offline: {offline.stats}")
+    return stats
+
+def bench_stats_pages(players=2000, latency=0.05, workers=(1, 4, 8, 16)):
+    """
+    Times players_api.get_player_data against a local stub of the stats endpoint
+    with different numbers of page workers, and checks every run returns the same rows.
+
+    Parameters
+    -----------------------
+    players: int
+        Number of synthetic players served by the stub.
+
+    latency: float
+        Seconds of delay the stub adds to each page.
+
+    workers: tuple
+        Worker counts to compare.
+
+    Returns
+    -----------------------
+    results: list of tuples
+        (workers, seconds, pages_per_second) for each worker count.
+    """
+    data = synthetic_players(players)
+    server, stats_url = stats_stub_server(data, latency)
+    old_url, old_cache = players_api.STATS_URL, fetcher.cache
+    players_api.STATS_URL = stats_url
+    fetcher.configure_cache(enabled=False)
+    # The stub can take any rate, so only the page workers limit the requests
+    rate_limit.configure(default_limits=(1000, 1000, max(workers)))
+    pages = -(-players // players_api.PAGE_SIZE)
+    results = []
+    try:
+        for count in workers:
+            start = time.perf_counter()
+            rows = [row for _, page in players_api.get_player_data(workers=count) for row in page]
+            elapsed = time.perf_counter() - start
+            assert rows == data, "pages came back incomplete or out of order"
+            results.append((count, elapsed, pages / elapsed))
+    finally:
+        players_api.STATS_URL, fetcher.cache = old_url, old_cache
+        rate_limit.configure()
+        server.shutdown()
+    print(f"{'workers':>8} {'seconds':>8} {'pages/s':>8}")
+    for count, elapsed, rate in results:
+        print(f"{count:>8} {elapsed:>8.3f} {rate:>8.1f}")
+    return results
+
+def bench_reingest(players=2000, seed=0):
+    """
+    Ingests the same season twice through players_api.set_up_player_table, the
+    second time with every player's stats changed and some players traded, and
+    checks Team_Summary against team totals computed straight from Players.
+    The second ingest updates rows of players on the same team in one UPSERT,
+    which the Team_Summary_Dirty triggers have to survive.
+
+    Parameters
+    -----------------------
+    players: int
+        Number of synthetic players.
+
+    seed: int
+        Random seed so runs are repeatable.
+
+    Returns
+    -----------------------
+    Dictionary {ingest: seconds}:
+        Time for the "first" and "second" ingest.
+    """
+    roster = synthetic_players(players, seed)
+    rng = random.Random(seed)
+    path, cur, conn = temp_database()
+    results = {}
+
+    def pages(players):
+        size = players_api.PAGE_SIZE
+        return [(offset, players[offset:offset + size]) for offset in range(0, len(players), size)]
+
+    def expected_totals():
+        cur.execute("""
+            SELECT Player_Teams.team, SUM(goals), SUM(penalty_min), SUM(salary)
+            FROM Player_Teams JOIN Players ON Players.player_id = Player_Teams.player_id
+            WHERE salary GROUP BY Player_Teams.team ORDER BY Player_Teams.team""")
+        return cur.fetchall()
+
+    try:
+        start = time.perf_counter()
+        players_api.set_up_player_table(pages(roster), cur, conn)
+        results["first"] = time.perf_counter() - start
+        bulk_loader.bulk_update_salaries([(rng.randrange(775000, 13000000), player['playerId']) for player in roster], cur, conn)
+
+        for player in roster:
+            player['goals'] += 1
+            player['points'] += 1
+            player['penaltyMinutes'] += 2
+            if rng.random() < 0.05:
+                player['teamAbbrevs'] += "," + rng.choice(TEAMS)
+        start = time.perf_counter()
+        written = players_api.set_up_player_table(pages(roster), cur, conn)
+        results["second"] = time.perf_counter() - start
+        assert written == players, (written, players)
+
+        cur.execute("SELECT team, goals, penalties, salary FROM Team_Summary ORDER BY team")
+        assert cur.fetchall() == expected_totals(), "Team_Summary does not match Players after the second ingest"
+        cur.execute("SELECT COUNT(*) FROM Team_Summary_Dirty")
+        assert cur.fetchone()[0] == 0
+    finally:
+        conn.close()
+        remove_database(path)
+
+    print(f"first ingest {results['first']:.3f}s, second ingest {results['second']:.3f}s, Team_Summary matches Players")
+    return results
+
+def bench_streaming_ingest(players=20000, latency=0.01, crash_after=50):
+    """
+    Loads players from the stats stub the old way, every page in memory before
+    the first write, and through the streaming set_up_player_table. Compares the
+    time until the first page is committed and the peak memory, then stops a
+    streaming run part way and checks the resumed run picks up at the saved
+    offset and ends with every player stored.
+
+    Parameters
+    -----------------------
+    players: int
+        Number of synthetic players served by the stub.
+
+    latency: float
+        Seconds of delay the stub adds to each page.
+
+    crash_after: int
+        Pages stored before the interrupted run stops.
+
+    Returns
+    -----------------------
+    results: dict
+        {"all pages first" / "streaming": (seconds to first commit, total seconds, peak MB)}.
+    """
+    data = synthetic_players(players)
+    server, stats_url = stats_stub_server(data, latency)
+    old_url, old_cache = players_api.STATS_URL, fetcher.cache
+    players_api.STATS_URL = stats_url
+    fetcher.configure_cache(enabled=False)
+    rate_limit.configure(default_limits=(1000, 1000, players_api.PAGE_WORKERS))
+    results = {}
+
+    def first_commit_timer(pages, start, times):
+        # The loader asks for page n + 1 only after committing page n
+        for number, page in enumerate(pages):
+            if number == 1:
+                times.append(time.perf_counter() - start)
+            yield page
+
+    try:
+        for name in ("all pages first", "streaming"):
+            path, cur, conn = temp_database()
+            times = []
+            tracemalloc.start()
+            start = time.perf_counter()
+            pages = players_api.get_player_data()
+            if name == "all pages first":
+                # What ingest_players did before: one list of every row, then the load
+                rows = [row for _, page in pages for row in page]
+                pages = [(offset, rows[offset:offset + players_api.PAGE_SIZE]) for offset in range(0, len(rows), players_api.PAGE_SIZE)]
+            players_api.set_up_player_table(first_commit_timer(pages, start, times), cur, conn)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+            cur.execute("SELECT COUNT(*) FROM Players")
+            assert cur.fetchone()[0] == players
+            conn.close()
+            remove_database(path)
+            results[name] = (times[0], elapsed, peak)
+
+        # Interrupted run: the loader stops after crash_after pages
+        path, cur, conn = temp_database()
+
+        def crashing(pages):
+            for number, page in enumerate(pages):
+                if number == crash_after:
+                    raise KeyboardInterrupt
+                yield page
+
+        try:
+            players_api.set_up_player_table(crashing(players_api.get_player_data()), cur, conn)
+        except KeyboardInterrupt:
+            pass
+        offset, complete, _ = bulk_loader.get_checkpoint(cur, players_api.SKATER_SOURCE, players_api.SEASON)
+        assert offset == crash_after * players_api.PAGE_SIZE and not complete, (offset, complete)
+        resumed = players_api.set_up_player_table(players_api.get_player_data(offset), cur, conn)
+        cur.execute("SELECT COUNT(*) FROM Players")
+        stored = cur.fetchone()[0]
+        assert stored == players and resumed == players - offset, (stored, resumed)
+        assert bulk_loader.get_checkpoint(cur, players_api.SKATER_SOURCE, players_api.SEASON)[1]
+        conn.close()
+        remove_database(path)
+    finally:
+        players_api.STATS_URL, fetcher.cache = old_url, old_cache
+        rate_limit.configure()
+        server.shutdown()
+
+    print(f"{'load':<16} {'first commit':>13} {'total':>8} {'peak MB':>8}")
+    for name, (first, total, peak) in results.items():
+        print(f"{name:<16} {first:>12.2f}s {total:>7.2f}s {peak:>8.1f}")
+    print(f"interrupted after {offset} rows, resumed run stored the other {resumed}")
+    return results
+
+def synthetic_reports(players, seed=0):
+    """
+    Makes penalties, realtime and timeonice report rows for synthetic players,
+    with the API field names bulk_loader.REPORT_TABLES reads.
+
+    Parameters
+    -----------------------
+    players: list
+        Player dictionaries from synthetic_players.
+
+    seed: int
+        Seed for the random numbers.
+
+    Returns
+    -----------------------
+    reports: dict
+        {report type: rows}, each sorted by playerId like an ingest requests them.
+    """
+    rng = random.Random(seed)
+    reports = {report_type: [] for report_type in bulk_loader.REPORT_TABLES}
+    for player in sorted(players, key=lambda player: player['playerId']):
+        for report_type, (_, fields) in bulk_loader.REPORT_TABLES.items():
+            # A few players are missing from each report
+            if rng.random() < 0.02:
+                continue
+            row = {"playerId": player['playerId'], "skaterFullName": player['skaterFullName']}
+            row.update((field, rng.randint(0, 200) if "Per" not in field else rng.random() * 5) for _, field in fields)
+            reports[report_type].append(row)
+    return reports
+
+def bench_wide_reports(players=5000, latency=0.2, table_rows=200000):
+    """
+    Fetches the penalties, realtime and timeonice reports from the stats stub one
+    report after another and merged in a dict, like a straightforward version
+    would, and through players_api.iter_merged_reports, which streams the three
+    at once and merges them on playerId. Checks what ingest_reports stores, then
+    compares a scan of the Players columns get_info reads on one wide table
+    against the narrow Players table with the reports in their own tables.
+
+    Parameters
+    -----------------------
+    players: int
+        Number of synthetic players served by the stub.
+
+    latency: float
+        Seconds of delay the stub adds to each page.
+
+    table_rows: int
+        Rows in the tables for the scan comparison.
+
+    Returns
+    -----------------------
+    results: dict
+        Seconds for each load and each scan.
+    """
+    data = synthetic_players(players)
+    reports = synthetic_reports(data)
+    server, stats_url = stats_stub_server(data, latency, reports)
+    old_url, old_cache = players_api.STATS_URL, fetcher.cache
+    players_api.STATS_URL = stats_url
+    fetcher.configure_cache(enabled=False)
+    rate_limit.configure(default_limits=(1000, 1000, 3 * players_api.PAGE_WORKERS))
+    results = {}
+    try:
+        query_context = players_api.build_query_context()
+        start = time.perf_counter()
+        merged = {}
+        for report_type in bulk_loader.REPORT_TABLES:
+            for row in players_api.get_report_pages(query_context, report_type, sort=players_api.INGEST_SORT):
+                merged.setdefault(row["playerId"], {})[report_type] = row
+        results["one report at a time"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        streamed = sum(len(batch) for batch in players_api.iter_merged_reports(query_context))
+        results["merged streams"] = time.perf_counter() - start
+        assert streamed == len(merged), (streamed, len(merged))
+
+        path, cur, conn = temp_database()
+        start = time.perf_counter()
+        stored = players_api.ingest_reports(cur, conn)
+        results["ingest_reports"] = time.perf_counter() - start
+        assert stored == len(merged), (stored, len(merged))
+        for report_type, (table, fields) in bulk_loader.REPORT_TABLES.items():
+            cur.execute(f"SELECT * FROM {table} ORDER BY player_id")
+            expected = [(row["playerId"], *(row[field] for _, field in fields)) for row in reports[report_type]]
+            assert cur.fetchall() == expected, f"{table} does not match the {report_type} report"
+        conn.close()
+        remove_database(path)
+    finally:
+        players_api.STATS_URL, fetcher.cache = old_url, old_cache
+        rate_limit.configure()
+        server.shutdown()
+
+    # The same rows in one wide Players table and split by report
+    report_columns = [column for _, fields in bulk_loader.REPORT_TABLES.values() for column, _ in fields]
+    rng = random.Random(0)
+    base_rows = [(i, f"Player {i}", rng.randrange(32), rng.randrange(775000, 13000000), *(rng.randint(0, 82) for _ in range(7)))
+                 for i in range(table_rows)]
+    scan = "SELECT team_id, SUM(goals), SUM(penalty_min), SUM(salary) FROM Players NOT INDEXED GROUP BY team_id"
+    for layout in ("wide", "split"):
+        path, cur, conn = temp_database()
+        if layout == "wide":
+            cur.execute("DROP TABLE Players")
+            cur.execute(PLAYERS_TABLE.replace("shooting_perc FLOAT)", "shooting_perc FLOAT, " + ", ".join(f"{column} FLOAT" for column in report_columns) + ")"))
+            marks = ", ".join("?" for _ in range(12 + len(report_columns)))
+            cur.executemany(f"INSERT INTO Players VALUES ({marks})",
+                            [row + (0.5,) + tuple(rng.random() * 100 for _ in report_columns) for row in base_rows])
+        else:
+            schema.migrate(cur, conn)
+            cur.executemany(f"INSERT INTO Players VALUES ({', '.join('?' for _ in range(12))})", [row + (0.5,) for row in base_rows])
+            for table, fields in bulk_loader.REPORT_TABLES.values():
+                cur.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' for _ in range(len(fields) + 1))})",
+                                [(row[0], *(rng.random() * 100 for _ in fields)) for row in base_rows])
+        conn.commit()
+        conn.close()
+        # A fresh connection so the scan starts with a cold page cache
+        conn = sqlite3.connect(path)
+        start = time.perf_counter()
+        conn.execute(scan).fetchall()
+        results[f"scan {layout}"] = time.perf_counter() - start
+        try:
+            results[f"pages {layout}"] = conn.execute("SELECT COUNT(*) FROM dbstat WHERE name = 'Players'").fetchone()[0]
+        except sqlite3.OperationalError:
+            # SQLite built without the dbstat table
+            results[f"pages {layout}"] = "?"
+        conn.close()
+        remove_database(path)
+
+    print(f"fetched {len(merged)} players: {results['one report at a time']:.2f}s one report at a time, "
+          f"{results['merged streams']:.2f}s as merged streams, {results['ingest_reports']:.2f}s for ingest_reports with the writes")
+    print(f"Players scan: {results['scan wide']:.3f}s over {results['pages wide']} pages with every column in Players, "
+          f"{results['scan split']:.3f}s over {results['pages split']} pages with the reports in their own tables")
+    return results
+
+def synthetic_database(count, seed=0):
+    """
+    Builds an in-memory database with count synthetic Players rows, written straight
+    as rows so very large tables stay quick to make.
+
+    Parameters
+    -----------------------
+    count: int
+        Number of players.
+
+    seed: int
+        Random seed so runs are repeatable.
+
+    Returns
+    -----------------------
+    Tuple (Cursor, Connection):
+        Cursor and connection for the in-memory database.
+    """
+    rng = np.random.default_rng(seed)
+    games = rng.integers(1, 83, count)
+    goals = rng.integers(0, 40, count)
+    assists = rng.integers(0, 60, count)
+    pens = rng.integers(0, 150, count)
+    salary = rng.integers(775000, 13000000, count)
+    teams = rng.integers(0, len(TEAMS), count)
+    conn = sqlite3.connect(":memory:")
+    cur = conn.cursor()
+    cur.execute(PLAYERS_TABLE)
+    cur.execute(TEAMS_TABLE)
+    cur.executemany("INSERT INTO NHL_Teams (team_id, name) VALUES (?, ?)", list(enumerate(TEAMS)))
+    cur.executemany(
+        "INSERT INTO Players (player_id, name, team_id, salary, games, points, penalty_min, goals, assists) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        ((i, f"Player {i}", int(teams[i]), int(salary[i]), int(games[i]), int(goals[i] + assists[i]), int(pens[i]), int(goals[i]), int(assists[i]))
+         for i in range(count))
+    )
+    conn.commit()
+    return cur, conn
+
+def bench_query_plans(rows=100000):
+    """
+    Checks that none of schema.ANALYTIC_QUERIES reads a whole table, both on a
+    freshly migrated empty database and on one with synthetic players that was
+    analyzed after loading, since SQLite can plan differently once it has
+    statistics. Times each query on the loaded database.
+
+    Parameters
+    -----------------------
+    rows: int
+        Number of synthetic Players rows.
+
+    Returns
+    -----------------------
+    Dictionary {query name: seconds}:
+        Time to run each query on the loaded database.
+    """
+    empty = sqlite3.connect(":memory:")
+    schema.migrate(empty.cursor(), empty)
+    cur, conn = synthetic_database(rows)
+    schema.migrate(cur, conn)
+    cur.execute("ANALYZE")
+    results = {}
+    for name, (query, params, tables) in schema.ANALYTIC_QUERIES.items():
+        schema.assert_no_full_scan(empty.cursor(), query, params, tables)
+        schema.assert_no_full_scan(cur, query, params, tables)
+        start = time.perf_counter()
+        cur.execute(query, params).fetchall()
+        results[name] = time.perf_counter() - start
+        print(f"{name:<42} {results[name] * 1000:>8.1f} ms")
+    empty.close()
+    conn.close()
+    return results
+
+def bench_columnar(rows=1000000):
+    """
+    Compares building Python lists row by row with columnar.fetch_columns for the
+    get_player_points_pens query and the regression line fit on its result.
+    Reports time and peak Python memory for each approach, and fails unless
+    columnar peaks lower. Time is only reported: sqlite3 building each row
+    takes most of it either way, so neither approach is reliably faster.
+
+    Parameters
+    -----------------------
+    rows: int
+        Number of synthetic Players rows.
+
+    Returns
+    -----------------------
+    Dictionary {approach: (seconds, peak_bytes)}:
+        Results for "row lists" and "columnar".
+    """
+    cur, conn = synthetic_database(rows)
+    query = "SELECT name, points, penalty_min, games FROM Players WHERE games >= ? AND (points >= ? OR penalty_min >= ?)"
+    params = (10, 5, 5)
+
+    def row_lists():
+        cur.execute(query, params)
+        points, pens, names = [], [], []
+        for player in cur.fetchall():
+            points.append(player[1])
+            pens.append(player[2])
+            names.append(player[0])
+        return np.polyfit(pens, points, 1)
+
+    def columns():
+        result = columnar.fetch_columns(cur, query, params, [("name", object), ("points", np.int64), ("penalty_min", np.int64), ("games", np.int64)])
+        return np.polyfit(result["penalty_min"], result["points"], 1)
+
+    results = {}
+    fits = []
+    for name, run in (("row lists", row_lists), ("columnar", columns)):
+        start = time.perf_counter()
+        fits.append(run())
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = (elapsed, peak)
+        print(f"{name:>10}: {elapsed:.3f}s, peak {peak / 2 ** 20:.0f} MiB")
+    conn.close()
+    assert np.allclose(fits[0], fits[1])
+    assert results["columnar"][1] < results["row lists"][1], "columnar used more memory than row lists"
+    return results
+
+def bench_metrics(rows=1000000, changed=10000):
+    """
+    Compares the old get_pts_per_penalty_minute, which divided points by penalty
+    minutes in NumPy on every call, with reading pts_per_pim from Players_Metrics.
+    Also times a metrics refresh of every player and the incremental one after
+    changed players are updated.
+
+    Parameters
+    -----------------------
+    rows: int
+        Number of synthetic Players rows.
+
+    changed: int
+        Number of players updated before the incremental refresh.
+
+    Returns
+    -----------------------
+    Dictionary {step: seconds}:
+        Results for "full refresh", "incremental refresh", "divide per call" and "metrics table".
+    """
+    cur, conn = synthetic_database(rows)
+    schema.migrate(cur, conn)
+    params = (10, 5, 5)
+    results = {}
+
+    start = time.perf_counter()
+    with conn:
+        metrics.refresh_metrics(cur, "Players", "Players")
+    results["full refresh"] = time.perf_counter() - start
+
+    with conn:
+        cur.execute("UPDATE Players SET penalty_min = penalty_min + 2 WHERE player_id < ?", (changed,))
+    start = time.perf_counter()
+    with conn:
+        refreshed = metrics.refresh_metrics(cur, "Players", "Players_Pending")
+    results["incremental refresh"] = time.perf_counter() - start
+    assert refreshed == changed, (refreshed, changed)
+
+    def divide():
+        result = columnar.fetch_columns(cur, "SELECT points, penalty_min FROM Players WHERE games >= ? AND (points >= ? AND penalty_min >= ?)",
+                                        params, [("points", np.float64), ("penalty_min", np.float64)])
+        ratios = result["points"] / result["penalty_min"]
+        return ratios[np.isfinite(ratios)]
+
+    def stored():
+        return columnar.fetch_columns(cur, "SELECT pts_per_pim FROM Players_Metrics WHERE games >= ? AND points >= ? AND penalty_min >= ? AND pts_per_pim IS NOT NULL",
+                                      params, [("pts_per_pim", np.float64)])["pts_per_pim"]
+
+    values = []
+    for name, run in (("divide per call", divide), ("metrics table", stored)):
+        start = time.perf_counter()
+        values.append(run())
+        results[name] = time.perf_counter() - start
+    conn.close()
+    assert np.allclose(np.sort(values[0]), np.sort(values[1]))
+
+    for name, seconds in results.items():
+        print(f"{name:>20}: {seconds:.3f}s")
+    print(f"{'query speedup':>20}: {results['divide per call'] / results['metrics table']:.1f}x")
+    return results
+
+def bench_query_cache(rows=1000000, thresholds=((41, 30, 40), (30, 20, 30), (20, 10, 20), (10, 5, 5), (60, 40, 60))):
+    """
+    Runs get_player_points_pens and get_pts_per_penalty_minute over a list of
+    thresholds three times: with an empty query cache, again with every result
+    cached, and once more after a salary load bumps the database generation.
+    Then a fresh cache reads the same results back from its disk directory, as
+    the next process would.
+
+    Parameters
+    -----------------------
+    rows: int
+        Number of synthetic Players rows.
+
+    thresholds: tuple
+        (min_gp, min_pts, min_pen) tuples passed to both functions.
+
+    Returns
+    -----------------------
+    Dictionary {pass: (seconds, stats)}:
+        Time and cache counters for "cold", "warm", "after ingest" and "from disk".
+    """
+    import Penalty_vs_Points_Graph as graphs
+    import query_cache
+
+    memory_cur, memory_conn = synthetic_database(rows)
+    path, cur, conn = temp_database()
+    memory_conn.backup(conn)
+    memory_conn.close()
+    schema.migrate(cur, conn)
+    directory = tempfile.mkdtemp()
+    old_cache = query_cache.cache
+    results = {}
+
+    def sweep():
+        for min_gp, min_pts, min_pen in thresholds:
+            graphs.get_player_points_pens("Players", min_gp, min_pts, min_pen, cur, conn)
+            graphs.get_pts_per_penalty_minute("Players", min_gp, min_pts, min_pen, cur, conn)
+
+    try:
+        query_cache.configure(directory=directory)
+        for name in ("cold", "warm", "after ingest", "from disk"):
+            if name == "after ingest":
+                bulk_loader.bulk_update_salaries([(1000000, 0)], cur, conn)
+            elif name == "from disk":
+                query_cache.configure(directory=directory)
+            start = time.perf_counter()
+            sweep()
+            results[name] = (time.perf_counter() - start, dict(query_cache.cache.stats))
+    finally:
+        query_cache.cache = old_cache
+        conn.close()
+        remove_database(path)
+        for file in os.listdir(directory):
+            os.remove(os.path.join(directory, file))
+        os.rmdir(directory)
+
+    for name, (seconds, stats) in results.items():
+        print(f"{name:>12}: {seconds:.3f}s  {stats}")
+    # The queries only read, so the second pass must not miss
+    assert results["warm"][1]["misses"] == results["cold"][1]["misses"], results
+    return results
+
+def bench_threshold_sweep(rows=1000000, grid=(20, 20, 20), samples=10, seed=0):
+    """
+    Evaluates a grid of (min_gp, min_pts, min_pen) thresholds over synthetic
+    Players with threshold_sweep, and compares it with running the
+    get_player_points_pens and get_pts_per_penalty_minute queries, plus the
+    np.polyfit line, for a random sample of the combinations. The sampled results
+    must match the sweep.
+
+    Parameters
+    -----------------------
+    rows: int
+        Number of synthetic Players rows.
+
+    grid: tuple
+        Number of games, points and penalty minute thresholds.
+
+    samples: int
+        Number of grid combinations run as queries.
+
+    seed: int
+        Seed for picking the sampled combinations.
+
+    Returns
+    -----------------------
+    Dictionary {step: seconds}:
+        "load" and "sweep" for the grid, and "queries per combination" averaged over the samples.
+    """
+    import Penalty_vs_Points_Graph as graphs
+    import query_cache
+    import threshold_sweep
+
+    cur, conn = synthetic_database(rows)
+    schema.migrate(cur, conn)
+    min_gp = np.linspace(0, 82, grid[0]).astype(int).tolist()
+    min_pts = np.linspace(0, 90, grid[1]).astype(int).tolist()
+    min_pen = np.linspace(0, 140, grid[2]).astype(int).tolist()
+    results = {}
+    old_cache = query_cache.cache
+    query_cache.configure(enabled=False)
+    try:
+        start = time.perf_counter()
+        columns = threshold_sweep.load_columns("Players", cur)
+        results["load"] = time.perf_counter() - start
+        start = time.perf_counter()
+        swept = threshold_sweep.sweep(columns, min_gp, min_pts, min_pen)
+        results["sweep"] = time.perf_counter() - start
+
+        rng = random.Random(seed)
+        start = time.perf_counter()
+        for _ in range(samples):
+            i, j, k = (rng.randrange(size) for size in grid)
+            points, pens, _ = graphs.get_player_points_pens("Players", min_gp[i], min_pts[j], min_pen[k], cur, conn)
+            ratios = graphs.get_pts_per_penalty_minute("Players", min_gp[i], min_pts[j], min_pen[k], cur, conn)
+            slope, intercept = np.polyfit(pens, points, 1)
+            assert swept["count"][i, j, k] == len(points)
+            assert swept["ratio_count"][i, j, k] == len(ratios)
+            assert np.allclose([swept["slope"][i, j, k], swept["intercept"][i, j, k]], [slope, intercept])
+            assert np.isclose(swept["ratio_mean"][i, j, k], ratios.mean())
+        results["queries per combination"] = (time.perf_counter() - start) / samples
+    finally:
+        query_cache.cache = old_cache
+        conn.close()
+
+    combinations = grid[0] * grid[1] * grid[2]
+    print(f"{combinations} combinations over {rows} players")
+    print(f"{'load':>12}: {results['load']:.3f}s")
+    print(f"{'sweep':>12}: {results['sweep'] * 1000:.1f}ms")
+    print(f"{'queries':>12}: {results['queries per combination']:.3f}s per combination, "
+          f"about {results['queries per combination'] * combinations:.0f}s for the grid")
+    return results
+
+def bench_streaming_export(sizes=(10000, 100000, 1000000)):
+    """
+    Exports every Players row to CSV (and Arrow IPC if pyarrow is installed) through
+    the streaming export layer and reports peak Python memory, which should stay
+    about the same as the table grows.
+
+    Parameters
+    -----------------------
+    sizes: tuple
+        Numbers of synthetic players to export.
+
+    Returns
+    -----------------------
+    results: list of tuples
+        (size, seconds, peak_bytes) for each size, for the CSV export.
+    """
+    query = "SELECT player_id, name, team_id, salary, games, points, penalty_min, goals, assists FROM Players"
+    header = ["player_id", "name", "team_id", "salary", "games", "points", "penalty_min", "goals", "assists"]
+    try:
+        export.require_arrow()
+        formats = ["csv", "arrow"]
+    except ImportError:
+        formats = ["csv"]
+    results = []
+    for size in sizes:
+        cur, conn = synthetic_database(size)
+        for file_format in formats:
+            fd, path = tempfile.mkstemp(suffix="." + file_format)
+            os.close(fd)
+            tracemalloc.start()
+            start = time.perf_counter()
+            if file_format == "csv":
+                export.write_csv_rows(export.iter_query(cur, query), path, header)
+            else:
+                export.write_columnar(export.iter_query(cur, query), path, header)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            os.remove(path)
+            print(f"{size:>8} rows {file_format:>5}: {elapsed:.3f}s, peak {peak / 2 ** 20:.1f} MiB")
+            if file_format == "csv":
+                results.append((size, elapsed, peak))
+        conn.close()
+    return results
+
+FIRST_NAMES = ["Alexander", "Matthew", "Michael", "Nicholas", "Christopher", "Jacob", "Joshua", "Joseph", "William",
+               "Robert", "Thomas", "Daniel", "David", "Zachary", "Benjamin", "Samuel", "Anthony", "Andrew", "Ryan",
+               "Tyler", "Connor", "Logan", "Owen", "Ethan", "Liam", "Mason", "Carter", "Brady", "Cole", "Evan",
+               "Jack", "Luke", "Dylan", "Brandon", "Kyle", "Adam", "Patrick", "Nathan", "Cameron", "Gabriel"]
+SHORT_NAMES = {full: short for short, full in identity.NICKNAMES.items() if short[0] == full[0] and len(short) < len(full)}
+ONSETS = ["b", "br", "c", "ch", "d", "f", "g", "gr", "h", "j", "k", "kr", "l", "m", "n", "p", "r", "s", "sh", "st",
+          "t", "tr", "v", "w", "z"]
+VOWELS = ["a", "e", "i", "o", "u", "ai", "ou", "ee"]
+CODAS = ["", "n", "r", "s", "k", "l", "t", "m", "nd", "rt"]
+
+def synthetic_names(count, rng):
+    """
+    Makes made-up "First Last" player names with last names built from random syllables.
+
+    Parameters
+    -----------------------
+    count: int
+        Number of names.
+
+    rng: Random
+        Random number generator.
+
+    Returns
+    -----------------------
+    names: list of str
+    """
+    names = []
+    for _ in range(count):
+        surname = "".join(rng.choice(ONSETS) + rng.choice(VOWELS) + rng.choice(CODAS) for _ in range(rng.randint(2, 3)))
+        names.append(f"{rng.choice(FIRST_NAMES)} {surname.capitalize()}")
+    return names
+
+def misspell(name, rng):
+    """
+    Changes a name the way it might be written by another source: a nickname, a
+    dropped accent mark's worth of spelling, a typo in the last name or a suffix.
+
+    Parameters
+    -----------------------
+    name: str
+        The name to change.
+
+    rng: Random
+        Random number generator.
+
+    Returns
+    -----------------------
+    String:
+        The changed name.
+    """
+    first, last = name.split(" ", 1)
+    change = rng.random()
+    if change < 0.3:
+        first = SHORT_NAMES.get(first.lower(), first.lower()).capitalize()
+    elif change < 0.5:
+        i = rng.randrange(1, len(last))
+        last = last[:i] + rng.choice("aeiou") + last[i + 1:]
+    elif change < 0.6:
+        last += " Jr."
+    elif change < 0.7:
+        last = last.upper()
+    return f"{first} {last}"
+
+def bench_identity(nhl_count=20000, ncaa_count=20000, linked_share=0.3, naive_sample=10, seed=0):
+    """
+    Links synthetic NCAA names to synthetic NHL names with identity.resolve and
+    reports the time, precision and recall. Some NCAA names belong to NHL players
+    and are misspelled on the way, the rest are other people. A naive all-pairs
+    comparison is timed on a sample for contrast.
+
+    Parameters
+    -----------------------
+    nhl_count: int
+        Number of NHL players.
+
+    ncaa_count: int
+        Number of NCAA players.
+
+    linked_share: float
+        Share of NCAA players who are also NHL players.
+
+    naive_sample: int
+        NCAA names compared against every NHL name for the all-pairs timing.
+
+    seed: int
+        Random seed.
+
+    Returns
+    -----------------------
+    Dictionary:
+        "seconds", "precision", "recall" and "naive_seconds" (extrapolated to every NCAA name).
+    """
+    rng = random.Random(seed)
+    nhl_names = synthetic_names(nhl_count, rng)
+    nhl_players = [(player_id, name, "20232024") for player_id, name in enumerate(nhl_names)]
+    ncaa_players = []
+    truth = {}
+    for ncaa_id, name in enumerate(synthetic_names(ncaa_count, rng)):
+        if rng.random() < linked_share:
+            nhl_id = rng.randrange(nhl_count)
+            truth[ncaa_id] = nhl_id
+            name = misspell(nhl_names[nhl_id], rng)
+        ncaa_players.append((ncaa_id, name, "20222023"))
+
+    start = time.perf_counter()
+    index = identity.build_index(nhl_players)
+    links = identity.resolve(ncaa_players, index)
+    elapsed = time.perf_counter() - start
+    precision, recall = identity.evaluate(links, truth)
+
+    normalized = [identity.normalize_name(name) for _, name, _ in nhl_players]
+    start = time.perf_counter()
+    for _, name, _ in ncaa_players[:naive_sample]:
+        matcher = difflib.SequenceMatcher(b=identity.normalize_name(name), autojunk=False)
+        for other in normalized:
+            matcher.set_seq1(other)
+            matcher.ratio()
+    naive = (time.perf_counter() - start) * ncaa_count / naive_sample
+
+    print(f"{ncaa_count} NCAA x {nhl_count} NHL names: indexed {elapsed:.2f}s, all pairs ~{naive:.0f}s")
+    print(f"{len(links)} links, precision {precision:.3f}, recall {recall:.3f}")
+    return {"seconds": elapsed, "precision": precision, "recall": recall, "naive_seconds": naive}
+
+HOCKEYDB_HEAD = """<!DOCTYPE html><html><head><title>hockeydb</title>
+<script>var ads = "<table>"; function track() { return 1 < 2 && 3 > 2; }</script>
+<style>td.tp { font-weight: bold }</style></head><body>
+<!-- <table><tr><td>commented out</td></tr></table> -->
+<div id="nav">""" + "".join(f'<a href="/ihdb/menu{i}.html">Menu &amp; item {i}</a> ' for i in range(60)) + "</div>"
+HOCKEYDB_FOOT = "<div id=\"footer\">" + "<p>Copyright &copy; hockeydb.com</p>" * 40 + "</div></body></html>"
+
+def hockeydb_page(rng, team):
+    """
+    Makes a made-up page shaped like hockeydb.com's: a head with scripts and
+    comments, a menu, then a roster table, a season list and a team list, and
+    a long footer. Each extractor in html_parsers finds something on it.
+
+    Parameters
+    -----------------------
+    rng: Random
+        Random number generator.
+
+    team: int
+        Number used in the names and links.
+
+    Returns
+    -----------------------
+    String:
+        The page HTML.
+    """
+    rows = ['<TR class="hdr"><th>#</th><th>Player</th><th>Pos</th><th>GP</th><th>G</th><th>A</th><th>Pts</th><th>PIM</th><th>+/-</th></TR>']
+    for number in range(rng.randint(20, 35)):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(ONSETS).capitalize()}{rng.choice(VOWELS)}{rng.choice(CODAS)}"
+        stats = [rng.randint(0, 40) for _ in range(5)]
+        gp = "" if rng.random() < 0.05 else stats[0]
+        rows.append(
+            f'<tr class="{"odd" if number % 2 else "even"}"><td>{number}</td>'
+            f'<td><a href="/ihdb/stats/pdisplay.php?pid={team * 100 + number}">{name}</a>&nbsp;</td>'
+            f'<td>{rng.choice("CLRDG")}</td><td>{gp}</td><td> {stats[1]} </td><td>{stats[2]}</td>'
+            f'<td><b>{stats[3]}</b></td><td>{stats[4]}</td><td>{rng.randint(-9, 9)}</td></tr>'
+        )
+    rows.append('<tr><td colspan="3">Team Totals</td><td>40</td></tr>')
+    seasons_rows = [
+        f'<tr><td><a href="/ihdb/stats/leagues/seasons/ncaa{year}.html">{year}-{str(year + 1)[2:]}</a></td>'
+        f'<td><a href="/stte/team-{team}-{year}.html">Team {team}</a></td><td>NCAA</td></tr>'
+        for year in range(1990, 2024)
+    ]
+    team_rows = [
+        f'<tr><td class="tp{" wide" if i % 5 == 0 else ""}"><a href="/stte/team-{team}-{i}.html">Team {i}</a></td>'
+        f'<td class="tp">{"" if i % 7 else "<b>no link</b>"}</td><td>NCAA</td></tr>'
+        for i in range(80)
+    ]
+    return (HOCKEYDB_HEAD + '<table class="sortable">' + "\n".join(rows) + "</table>"
+            + "<table>" + "".join(seasons_rows) + "</table><table>" + "".join(team_rows) + "</table>" + HOCKEYDB_FOOT)
+
+def bench_html_parsers(directory=None, pages=50, repeat=3, seed=0):
+    """
+    Runs every html_parsers extractor over a corpus of hockeydb pages with each
+    installed backend, checks the results match the BeautifulSoup html.parser
+    output exactly and reports how long each backend takes.
+
+    Parameters
+    -----------------------
+    directory: str
+        Folder of saved hockeydb pages (*.html, or *.body files from the HTTP cache).
+        If None, made-up pages from hockeydb_page are used.
+
+    pages: int
+        Number of made-up pages when no directory is given.
+
+    repeat: int
+        Times the corpus is parsed per backend, the fastest run counts.
+
+    seed: int
+        Random seed for the made-up pages.
+
+    Returns
+    -----------------------
+    Dictionary {backend: seconds}:
+        Best time to run all three extractors over the corpus.
+    """
+    if directory:
+        corpus = []
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                if name.endswith((".html", ".body")):
+                    with open(os.path.join(root, name), encoding="utf-8", errors="replace") as page:
+                        corpus.append(page.read())
+    else:
+        rng = random.Random(seed)
+        corpus = [hockeydb_page(rng, team) for team in range(pages)]
+
+    def run(parser):
+        return [(html_parsers.extract_players(text, "Team", parser),
+                 html_parsers.extract_season_link(text, "2023-24", parser),
+                 html_parsers.extract_team_links(text, parser)) for text in corpus]
+
+    print(f"{len(corpus)} pages, {sum(len(text) for text in corpus) / 2 ** 20:.1f} MiB")
+    expected = run("html.parser")
+    results = {}
+    for parser in html_parsers.available_backends():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = run(parser)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        mismatches = sum(1 for got, want in zip(output, expected) if got != want)
+        results[parser] = best
+        print(f"{parser:>12}: {best:.3f}s, {results.get('html.parser', best) / best:.1f}x html.parser, {mismatches} pages differ")
+        assert not mismatches, f"{parser} output differs from html.parser on {mismatches} pages"
+    return results
+
+def hockeydb_stub_server(latency=0.05):
+    """
+    Starts a local HTTP server that answers every path with a hockeydb_page made
+    from that path, so a crawl sees a different roster for each team.
+
+    Parameters
+    -----------------------
+    latency: float
+        Seconds each response is held back to act like a remote server.
+
+    Returns
+    -----------------------
+    Tuple (server, base_url):
+        The running server (call shutdown() when done) and its http://127.0.0.1:<port> address.
+    """
+    class PageHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            seed = sum(ord(char) for char in self.path)
+            body = hockeydb_page(random.Random(seed), seed).encode("utf-8")
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def bench_crawl_pipeline(teams=60, latency=0.05, parse_workers=(1, 2, 4), parser="html.parser"):
+    """
+    Crawls made-up teams from a local stub server through crawl_pipeline into an
+    in-memory database with different numbers of parse processes, and prints the
+    per-stage metrics of each run. Uses the slow html.parser backend by default
+    so the parse stage has real work to spread over the processes.
+
+    Parameters
+    -----------------------
+    teams: int
+        Number of teams, each is a team page and a roster page.
+
+    latency: float
+        Seconds the stub server holds back each page.
+
+    parse_workers: tuple
+        Process counts to try.
+
+    parser: str
+        html_parsers backend the parse processes use.
+
+    Returns
+    -----------------------
+    Dictionary {parse_workers: seconds}:
+        Wall time of each crawl.
+    """
+    server, base = hockeydb_stub_server(latency)
+    team_list = [(f"Team {i}", f"{base}/stte/team-{i}.html") for i in range(teams)]
+    results = {}
+    try:
+        for workers in parse_workers:
+            conn = sqlite3.connect(":memory:")
+            cur = conn.cursor()
+            schema.migrate(cur, conn)
+            start = time.perf_counter()
+            crawl_pipeline.crawl(
+                team_list, "2023-24",
+                fetch_text=lambda url: fetcher.fetch(url.replace(crawl_pipeline.SITE, base), use_cache=False).text,
+                write=lambda players, pages: PIM.insert_player_data(players, cur, conn, prune=True, pages=pages),
+                fetch_workers=8, parse_workers=workers, parser=parser,
+            )
+            results[workers] = time.perf_counter() - start
+            stored = cur.execute("SELECT COUNT(*) FROM NCAA_Players").fetchone()[0]
+            print(f"{workers} parse processes: {results[workers]:.2f}s, {stored} players stored, {os.cpu_count()} CPUs")
+            conn.close()
+    finally:
+        server.shutdown()
+    return results
+
+def puckpedia_records(player_ids, rng, unknown=300, broken=50):
+    """
+    Makes records shaped like the Puckpedia contract feed, with some players the
+    database doesn't have and some records missing their cap hit or nhl_id.
+
+    Parameters
+    -----------------------
+    player_ids: list
+        player_ids to make records for.
+
+    rng: Random
+        Random number generator.
+
+    unknown: int
+        Extra records for players not in player_ids.
+
+    broken: int
+        Records made unreadable.
+
+    Returns
+    -----------------------
+    records: list
+        Records like the "data" list of the feed.
+    """
+    def contract(years):
+        cap_hit = rng.randrange(775000, 13000000, 5000)
+        return {'cap_hit': cap_hit, 'current_season_cap_hit': cap_hit, 'length': years, 'signing_date': "2022-07-13"}
+
+    records = []
+    for player_id in list(player_ids) + [10 ** 7 + i for i in range(unknown)]:
+        records.append({
+            'nhl_id': str(player_id),
+            'past': [contract(rng.randint(1, 8)) for _ in range(rng.randint(0, 3))],
+            'current': [contract(rng.randint(1, 8))],
+            'future': [contract(rng.randint(1, 8))] if rng.random() < 0.2 else [],
+        })
+    for record in rng.sample(records, broken):
+        if rng.random() < 0.5:
+            record['nhl_id'] = None
+        else:
+            record['current'] = []
+    return records
+
+def old_salary_join(records, cur, conn):
+    """
+    The original add_salary loop, kept as the benchmark baseline: a list
+    membership test per record and the rows written with one UPDATE each.
+
+    Parameters
+    -----------------------
+    records: list
+        Puckpedia records.
+
+    cur: Cursor
+        The database cursor object.
+
+    conn: Connection
+        The database connection object.
+
+    Returns
+    -----------------------
+    None
+    """
+    cur.execute("SELECT player_id FROM Players")
+    players = [x[0] for x in cur.fetchall()]
+    for player in records:
+        if player['nhl_id'] and int(player['nhl_id']) in players:
+            try:
+                cur.execute("UPDATE Players SET salary = ? WHERE player_id = ?",
+                            (int(player['current'][0]['current_season_cap_hit']), int(player['nhl_id'])))
+            except:
+                pass
+    conn.commit()
+
+def bench_salary_join(sizes=(1000, 5000), seed=0):
+    """
+    Compares the original add_salary loop with players_api.salary_rows and
+    bulk_loader.bulk_update_salaries, contracts history included.
+
+    Parameters
+    -----------------------
+    sizes: tuple
+        Numbers of players in the database, each with a record in the feed.
+
+    seed: int
+        Seed for the synthetic data.
+
+    Returns
+    -----------------------
+    results: list of tuples
+        (size, old_seconds, new_seconds) for each size.
+    """
+    rng = random.Random(seed)
+    results = []
+    print(f"{'players':>8} {'old':>8} {'new':>8} {'contracts':>10} {'failures':>9} {'speedup':>8}")
+    for size in sizes:
+        players = synthetic_players(size, seed)
+        records = puckpedia_records([player['playerId'] for player in players], rng)
+        times = []
+        for new in (False, True):
+            path, cur, conn = temp_database()
+            schema.migrate(cur, conn)
+            team_dict = {}
+            bulk_loader.bulk_insert_players(bulk_loader.stage_players(players, team_dict), team_dict, cur, conn)
+            with conn:
+                bulk_loader.refresh_players(cur)
+            start = time.perf_counter()
+            if new:
+                cur.execute("SELECT player_id FROM Players")
+                salaries, contracts, failures, _ = players_api.salary_rows(records, {row[0] for row in cur.fetchall()})
+                bulk_loader.bulk_update_salaries(salaries, cur, conn, contracts)
+            else:
+                old_salary_join(records, cur, conn)
+            times.append(time.perf_counter() - start)
+            cur.execute("SELECT SUM(salary) FROM Players")
+            times.append(cur.fetchone()[0])
+            conn.close()
+            remove_database(path)
+        old_time, old_total, new_time, new_total = times
+        assert old_total == new_total, f"salary totals differ: {old_total} != {new_total}"
+        print(f"{size:>8} {old_time:>7.3f}s {new_time:>7.3f}s {len(contracts):>10} {len(failures):>9} {old_time / new_time:>7.1f}x")
+        results.append((size, old_time, new_time))
+    return results
+
+def rate_limited_stub_server(rate=40, burst=10):
+    """
+    Starts a local HTTP server that answers 429 with a Retry-After header once
+    clients go over its own token bucket, like a throttling API. /blocked/...
+    paths always answer 429.
+
+    Parameters
+    -----------------------
+    rate: float
+        Requests per second the server accepts.
+
+    burst: int
+        Requests it accepts back to back.
+
+    Returns
+    -----------------------
+    Tuple (server, base_url, counts):
+        The running server (call shutdown() when done), its URL and a dict
+        counting the "ok" and "429" responses sent.
+    """
+    bucket = rate_limit.TokenBucket(rate, burst)
+    lock = threading.Lock()
+    counts = {"ok": 0, "429": 0}
+
+    class ThrottlingHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            with lock:
+                now = time.monotonic()
+                wait = bucket.wait_time(now)
+                if wait == 0 and not self.path.startswith("/blocked"):
+                    bucket.take(now)
+                    counts["ok"] += 1
+                else:
+                    counts["429"] += 1
+            if wait or self.path.startswith("/blocked"):
+                self.send_response(429)
+                self.send_header("Retry-After", "0" if self.path.startswith("/blocked") else str(max(1, round(wait))))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = self.path.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ThrottlingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", counts
+
+def bench_rate_limit(requests=120, rate=40, burst=10):
+    """
+    Sends the same pages to a throttling stub server without pacing, through a
+    scheduler allowed three times the server's rate (so it has to follow
+    Retry-After), and through one set to the server's rate. Also checks that
+    salary requests jump ahead of queued NCAA ones, that requests that never
+    get through end up in dead_letters and that other errors reach the caller.
+
+    Parameters
+    -----------------------
+    requests: int
+        Pages requested per run.
+
+    rate: float
+        Requests per second the stub accepts.
+
+    burst: int
+        Requests the stub accepts back to back.
+
+    Returns
+    -----------------------
+    results: dict
+        {run: (seconds, pages received, 429 responses sent)}.
+    """
+    old_cache = fetcher.cache
+    fetcher.configure_cache(enabled=False)
+    results = {}
+    try:
+        runs = {
+            "unpaced": None,
+            "3x server rate": (rate * 3, burst * 2, 8),
+            "server rate": (rate, burst, 8),
+        }
+        print(f"{'run':<16} {'seconds':>8} {'pages':>6} {'429s':>6} {'dead':>5}")
+        for name, limits in runs.items():
+            server, base, counts = rate_limited_stub_server(rate, burst)
+            urls = [f"{base}/page/{i}" for i in range(requests)]
+            start = time.perf_counter()
+            if limits is None:
+                with ThreadPoolExecutor(max_workers=16) as pool:
+                    responses = list(pool.map(lambda url: fetcher.fetch(url, use_cache=False), urls))
+                dead = 0
+            else:
+                scheduler = rate_limit.RequestScheduler(default_limits=limits, max_attempts=10)
+                responses = [future.result() for future in [scheduler.submit(url, "ncaa") for url in urls]]
+                dead = len(scheduler.dead_letters)
+            elapsed = time.perf_counter() - start
+            server.shutdown()
+            pages = sum(1 for response in responses if response.status_code == 200)
+            print(f"{name:<16} {elapsed:>8.2f} {pages:>6} {counts['429']:>6} {dead:>5}")
+            results[name] = (elapsed, pages, counts["429"])
+            if limits is not None:
+                assert pages == requests, f"{name}: only {pages} of {requests} pages came back"
+
+        # Priorities: 30 NCAA pages are queued before 5 salary requests on a slow host
+        server, base, counts = rate_limited_stub_server(rate, burst)
+        scheduler = rate_limit.RequestScheduler(default_limits=(20, 1, 1))
+        finished = []
+        futures = [scheduler.submit(f"{base}/ncaa/{i}", "ncaa") for i in range(30)]
+        futures += [scheduler.submit(f"{base}/salary/{i}", "salary") for i in range(5)]
+        for future in futures:
+            future.add_done_callback(lambda future: finished.append(future.result().url.split("/")[-2]))
+        for future in futures:
+            future.result()
+        salary_positions = [position for position, kind in enumerate(finished) if kind == "salary"]
+        print(f"salary requests finished at positions {salary_positions} of {len(finished)}")
+        assert max(salary_positions) < 10, "salary requests waited behind the NCAA pages"
+
+        # Dead letters: a path that is always throttled
+        scheduler = rate_limit.RequestScheduler(default_limits=(1000, 1000, 4), max_attempts=3)
+        responses = [future.result() for future in [scheduler.submit(f"{base}/blocked/{i}") for i in range(3)]]
+        assert all(response.status_code == 429 for response in responses)
+        assert len(scheduler.dead_letters) == 3, scheduler.dead_letters
+        retried = scheduler.retry_dead_letters()
+        for _, future in retried:
+            future.result()
+        scheduler.report()
+
+        # Errors that are not network failures: the caller gets them and the one
+        # connection allowed to the host is free for the next request
+        def broken_fetch(url, *args):
+            if "/broken/" in url:
+                raise ValueError(f"cannot read {url}")
+            return fetch(url, *args)
+
+        fetch = fetcher.fetch
+        fetcher.fetch = broken_fetch
+        try:
+            scheduler = rate_limit.RequestScheduler(default_limits=(1000, 1000, 1))
+            broken, after = scheduler.submit(f"{base}/broken/0"), scheduler.submit(f"{base}/page/0")
+            assert isinstance(broken.exception(timeout=5), ValueError), broken.exception()
+            assert after.result(timeout=5).status_code == 200
+        finally:
+            fetcher.fetch = fetch
+        server.shutdown()
+    finally:
+        fetcher.cache = old_cache
+    return results
+
+# Cold start limit for commands that don't draw graphs, and the libraries they must not load
+COLD_START_BUDGET = 0.5
+HEAVY_MODULES = ["matplotlib", "seaborn", "scipy", "pandas", "pyarrow"]
+
+def bench_cold_start(runs=5, budget=COLD_START_BUDGET):
+    """
+    Times a fresh interpreter importing what each non-plot command of
+    Penalty_vs_Points_Graph needs, and fails if the best of several runs is over
+    budget or if any plotting, stats or Arrow library gets imported on the way.
+
+    Parameters
+    -----------------------
+    runs: int
+        Fresh interpreters started per command, the fastest one counts.
+
+    budget: float
+        Largest allowed start-up time in seconds.
+
+    Returns
+    -----------------------
+    Dictionary {command: seconds}:
+        Best start-up time for each command.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    commands = {
+        "import": "import Penalty_vs_Points_Graph",
+        "--help": "import Penalty_vs_Points_Graph; Penalty_vs_Points_Graph.build_parser().format_help()",
+        "summarize": "import Penalty_vs_Points_Graph, NHL_team_success",
+        "export": "import Penalty_vs_Points_Graph, NHL_team_success, export",
+        "ingest": "import Penalty_vs_Points_Graph, players_api",
+    }
+    check = f"; import sys; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    results = {}
+    for name, code in commands.items():
+        best = None
+        for _ in range(runs):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, "-c", code + check], cwd=here, capture_output=True, text=True, check=True)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        loaded = output.stdout.strip()
+        results[name] = best
+        print(f"{name:>10}: {best:.3f}s" + (f", loaded {loaded}" if loaded else ""))
+        assert not loaded, f"{name} imports {loaded}"
+        assert best < budget, f"{name} cold start {best:.3f}s is over the {budget}s budget"
+    return results
+
+BENCHMARKS = {
+    "bulk_load": bench_bulk_load,
+    "http_cache": bench_http_cache,
+    "stats_pages": bench_stats_pages,
+    "streaming_ingest": bench_streaming_ingest,
+    "reingest": bench_reingest,
+    "wide_reports": bench_wide_reports,
+    "query_plans": bench_query_plans,
+    "columnar": bench_columnar,
+    "metrics": bench_metrics,
+    "query_cache": bench_query_cache,
+    "threshold_sweep": bench_threshold_sweep,
+    "streaming_export": bench_streaming_export,
+    "cold_start": bench_cold_start,
+    "identity": bench_identity,
+    "html_parsers": bench_html_parsers,
+    "crawl_pipeline": bench_crawl_pipeline,
+    "salary_join": bench_salary_join,
+    "rate_limit": bench_rate_limit,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
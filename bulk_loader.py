@@ -0,0 +1,506 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import metrics
+import schema
+
+# Bulk write path for the Players and NCAA_Players tables and the per-report
+# player tables. Rows are staged as tuples first and written with executemany
+# inside a single transaction.
+
+PLAYER_COLUMNS = ("player_id", "name", "team_id", "games", "points", "penalty_min", "avg_icetime", "goals", "assists", "plus_minus", "shooting_perc")
+NCAA_COLUMNS = ("name", "team_id", "games", "points", "penalty_min", "goals", "assists")
+
+# NHL stats API skater reports stored next to Players, see schema migration 8:
+# report type -> (table, ((column, API field), ...))
+REPORT_TABLES = {
+    "penalties": ("Player_Penalties", (
+        ("penalties", "penalties"), ("minor_penalties", "minorPenalties"), ("major_penalties", "majorPenalties"),
+        ("match_penalties", "matchPenalties"), ("misconduct_penalties", "misconductPenalties"),
+        ("game_misconduct_penalties", "gameMisconductPenalties"), ("penalties_drawn", "penaltiesDrawn"),
+        ("net_penalties", "netPenalties"), ("penalty_seconds_per_game", "penaltySecondsPerGame"),
+        ("penalties_drawn_per_60", "penaltiesDrawnPer60"), ("penalties_taken_per_60", "penaltiesTakenPer60"),
+    )),
+    "realtime": ("Player_Realtime", (
+        ("hits", "hits"), ("blocked_shots", "blockedShots"), ("giveaways", "giveaways"), ("takeaways", "takeaways"),
+        ("missed_shots", "missedShots"), ("first_goals", "firstGoals"), ("empty_net_goals", "emptyNetGoals"),
+        ("hits_per_60", "hitsPer60"), ("blocked_shots_per_60", "blockedShotsPer60"),
+        ("giveaways_per_60", "giveawaysPer60"), ("takeaways_per_60", "takeawaysPer60"),
+    )),
+    "timeonice": ("Player_Time_On_Ice", (
+        ("time_on_ice", "timeOnIce"), ("ev_time_on_ice", "evTimeOnIce"), ("pp_time_on_ice", "ppTimeOnIce"),
+        ("sh_time_on_ice", "shTimeOnIce"), ("shifts", "shifts"), ("time_on_ice_per_shift", "timeOnIcePerShift"),
+        ("ev_time_on_ice_per_game", "evTimeOnIcePerGame"), ("pp_time_on_ice_per_game", "ppTimeOnIcePerGame"),
+        ("sh_time_on_ice_per_game", "shTimeOnIcePerGame"),
+    )),
+}
+
+@contextmanager
+def load_pragmas(conn):
+    """
+    Switches the connection to faster settings for a bulk load and puts
+    synchronous back to FULL afterwards. WAL mode stays on since it is stored in the DB file.
+
+    Parameters
+    -----------------------
+    conn: Connection
+        The database connection object.
+
+    Returns
+    -----------------------
+    A context manager.
+    """
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
+    try:
+        yield conn
+    finally:
+        conn.execute("PRAGMA synchronous=FULL")
+
+def stage_players(players, team_dict):
+    """
+    Turns NHL API player dictionaries into Players table rows.
+    New team abbreviations are added to team_dict as they are seen.
+
+    Parameters
+    -----------------------
+    players: list
+        Player dictionaries from players_api.get_player_data.
+
+    team_dict: dict
+        Maps team abbreviation strings to team_id, updated in place.
+
+    Returns
+    -----------------------
+    rows: list of tuples
+        One tuple per player in PLAYER_COLUMNS order.
+    """
+    rows = []
+    for player in players:
+        if player['teamAbbrevs'] not in team_dict:
+            team_dict[player['teamAbbrevs']] = max(team_dict.values(), default=-1) + 1
+        rows.append((
+            player['playerId'], player['skaterFullName'], team_dict[player['teamAbbrevs']],
+            player['gamesPlayed'], player['points'], player['penaltyMinutes'], player['timeOnIcePerGame'],
+            player['goals'], player['assists'], player['plusMinus'], player['shootingPct']
+        ))
+    return rows
+
+def changed_player_rows(rows, cur):
+    """
+    Drops staged Players rows that are already stored with exactly the same values.
+
+    Parameters
+    -----------------------
+    rows: list of tuples
+        Rows from stage_players.
+
+    cur: Cursor
+        The database cursor object.
+
+    Returns
+    -----------------------
+    changed: list of tuples
+        The rows for new players or players whose stats changed.
+    """
+    stored = {}
+    columns = ", ".join(PLAYER_COLUMNS)
+    # Stay under SQLite's bound parameter limit
+    for i in range(0, len(rows), 500):
+        ids = [row[0] for row in rows[i:i + 500]]
+        cur.execute(f"SELECT {columns} FROM Players WHERE player_id IN ({', '.join('?' for _ in ids)})", ids)
+        stored.update((row[0], row) for row in cur.fetchall())
+    return [row for row in rows if stored.get(row[0]) != tuple(row)]
+
+def bulk_insert_players(rows, team_dict, cur, conn, upsert=False, checkpoint=None):
+    """
+    Writes staged Players rows and their NHL_Teams rows in one transaction.
+    Triggers list the written players in Players_Pending, and their Player_Teams,
+    Team_Summary and Players_Metrics rows are only brought up to date by
+    refresh_players, which an ingest calls once after its last page.
+
+    Parameters
+    -----------------------
+    rows: list of tuples
+        Rows from stage_players.
+
+    team_dict: dict
+        Maps team abbreviation strings to team_id.
+
+    cur: Cursor
+        The database cursor object.
+
+    conn: Connection
+        The database connection object.
+
+    upsert: bool
+        If True, players already in the table get their stats updated.
+        If False, existing players are left as they are.
+
+    checkpoint: tuple
+        Optional (source, season, offset, complete) saved with
+        save_checkpoint in the same transaction as the rows.
+
+    Returns
+    -----------------------
+    None
+    """
+    columns = ", ".join(PLAYER_COLUMNS)
+    marks = ", ".join("?" for _ in PLAYER_COLUMNS)
+    if upsert:
+        updates = ", ".join(f"{column} = excluded.{column}" for column in PLAYER_COLUMNS[1:])
+        query = f"INSERT INTO Players ({columns}) VALUES ({marks}) ON CONFLICT(player_id) DO UPDATE SET {updates}"
+    else:
+        query = f"INSERT OR IGNORE INTO Players ({columns}) VALUES ({marks})"
+    with load_pragmas(conn), conn:
+        cur.executemany(query, rows)
+        cur.executemany(
+            "INSERT OR IGNORE INTO NHL_Teams (team_id, name) VALUES (?, ?)",
+            [(id, name) for name, id in team_dict.items()]
+        )
+        schema.bump_generation(cur)
+        if checkpoint:
+            save_checkpoint(cur, *checkpoint)
+
+def stage_report_rows(players, report_types=tuple(REPORT_TABLES)):
+    """
+    Turns merged report rows into rows for each report's table. A player missing
+    from a report gets no row in its table.
+
+    Parameters
+    -----------------------
+    players: list of tuples
+        (player_id, {report type: API row}) from players_api.iter_merged_reports.
+
+    report_types: tuple
+        Keys of REPORT_TABLES to stage.
+
+    Returns
+    -----------------------
+    tables: dict
+        Maps each table name to (columns, rows), rows starting with player_id.
+    """
+    tables = {}
+    for report_type in report_types:
+        table, fields = REPORT_TABLES[report_type]
+        rows = [(player_id, *(reports[report_type].get(field) for _, field in fields))
+                for player_id, reports in players if report_type in reports]
+        tables[table] = (("player_id",) + tuple(column for column, _ in fields), rows)
+    return tables
+
+def bulk_insert_reports(tables, cur, conn, checkpoint=None):
+    """
+    Inserts or updates rows of the per-report player tables in one transaction.
+
+    Parameters
+    -----------------------
+    tables: dict
+        Maps a table name to (columns, rows) from stage_report_rows.
+
+    cur: Cursor
+        The database cursor object.
+
+    conn: Connection
+        The database connection object.
+
+    checkpoint: tuple
+        Optional (source, season, offset, complete) saved with
+        save_checkpoint in the same transaction as the rows.
+
+    Returns
+    -----------------------
+    None
+    """
+    with load_pragmas(conn), conn:
+        for table, (columns, rows) in tables.items():
+            updates = ", ".join(f"{column} = excluded.{column}" for column in columns[1:])
+            cur.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+                f"ON CONFLICT(player_id) DO UPDATE SET {updates}",
+                rows)
+        schema.bump_generation(cur)
+        if checkpoint:
+            save_checkpoint(cur, *checkpoint)
+
+def refresh_players(cur):
+    """
+    Brings Player_Teams, Team_Summary and Players_Metrics up to date for the players
+    listed in Players_Pending and clears the list, in a few set-based statements.
+    Does not commit so it shares the caller's transaction.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    Returns
+    -----------------------
+    Int:
+        Number of players refreshed.
+    """
+    cur.execute("SELECT COUNT(DISTINCT player_id) FROM Players_Pending")
+    pending = cur.fetchone()[0]
+    if not pending:
+        return 0
+    replace_player_teams(cur)
+    refresh_team_summary(cur)
+    metrics.refresh_metrics(cur, "Players", "Players_Pending")
+    cur.execute("DELETE FROM Players_Pending")
+    schema.bump_generation(cur)
+    return pending
+
+def replace_player_teams(cur):
+    """
+    Brings the Player_Teams rows of the players in Players_Pending in line with the
+    comma-joined team abbreviations of their NHL_Teams row. Only stints that changed
+    are deleted or inserted, so the Team_Summary_Dirty triggers only mark teams whose
+    players really moved. Players no longer in Players lose their rows.
+    Does not commit so it shares the caller's transaction.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    Returns
+    -----------------------
+    None
+    """
+    cur.execute("""
+        SELECT Players.player_id, NHL_Teams.name
+        FROM Players
+        JOIN NHL_Teams ON NHL_Teams.team_id = Players.team_id
+        WHERE Players.player_id IN (SELECT player_id FROM Players_Pending)
+    """)
+    staged = [(player_id, position, team) for player_id, names in cur.fetchall()
+              for position, team in enumerate(names.split(','))]
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS Staged_Teams (player_id INTEGER, position INTEGER, team TEXT, "
+                "PRIMARY KEY (player_id, position)) WITHOUT ROWID")
+    cur.execute("DELETE FROM Staged_Teams")
+    cur.executemany("INSERT OR IGNORE INTO Staged_Teams (player_id, position, team) VALUES (?, ?, ?)", staged)
+    cur.execute("""
+        DELETE FROM Player_Teams
+        WHERE player_id IN (SELECT player_id FROM Players_Pending)
+        AND NOT EXISTS (SELECT 1 FROM Staged_Teams WHERE Staged_Teams.player_id = Player_Teams.player_id
+                        AND Staged_Teams.position = Player_Teams.position AND Staged_Teams.team = Player_Teams.team)
+    """)
+    cur.execute("INSERT OR IGNORE INTO Player_Teams (player_id, position, team) SELECT player_id, position, team FROM Staged_Teams")
+
+def get_ncaa_team_ids(team_names, cur):
+    """
+    Makes sure every team name has a row in NCAA_Teams and returns their IDs
+    with one insert batch and one select.
+
+    Parameters
+    -----------------------
+    team_names: iterable
+        NCAA team names.
+
+    cur: Cursor
+        The database cursor object.
+
+    Returns
+    -----------------------
+    team_ids: dict
+        Maps team name to team_id.
+    """
+    team_names = list(dict.fromkeys(team_names))
+    cur.executemany("INSERT OR IGNORE INTO NCAA_Teams (name) VALUES (?)", [(name,) for name in team_names])
+    team_ids = {}
+    # Stay under SQLite's bound parameter limit
+    for i in range(0, len(team_names), 500):
+        chunk = team_names[i:i + 500]
+        cur.execute(f"SELECT name, team_id FROM NCAA_Teams WHERE name IN ({', '.join('?' for _ in chunk)})", chunk)
+        team_ids.update(cur.fetchall())
+    return team_ids
+
+def bulk_insert_ncaa_players(players, cur, conn, prune=False, pages=None):
+    """
+    Writes scraped NCAA players and their teams in one transaction. A player is
+    keyed on (name, team_id), so scraping a team again updates its rows in place
+    and keeps their player_id.
+
+    Parameters
+    -----------------------
+    players: list
+        Player dictionaries from PIM.scrape_players.
+
+    cur: Cursor
+        The database cursor object.
+
+    conn: Connection
+        The database connection object.
+
+    prune: bool
+        If True, players of these teams who are no longer on the scraped page are deleted.
+
+    pages: dict
+        Optional {team name: (season_url, content_hash)} saved to NCAA_Team_Pages
+        in the same transaction, so a page's hash is only kept once its rows are.
+
+    Returns
+    -----------------------
+    None
+    """
+    update = ", ".join(f"{column} = excluded.{column}" for column in NCAA_COLUMNS[2:])
+    with load_pragmas(conn), conn:
+        team_ids = get_ncaa_team_ids([player['Team'] for player in players] + list(pages or ()), cur)
+        rows = [
+            (player['Name'], team_ids[player['Team']], player['GP'], player['PTS'], player['PIM'], player['G'], player['A'])
+            for player in players
+        ]
+        if prune:
+            cur.execute("CREATE TEMP TABLE IF NOT EXISTS Scraped_Names (name TEXT, team_id INTEGER)")
+            cur.execute("DELETE FROM Scraped_Names")
+            cur.executemany("INSERT INTO Scraped_Names (name, team_id) VALUES (?, ?)", [row[:2] for row in rows])
+            cur.executemany(
+                "DELETE FROM NCAA_Players WHERE team_id = ? AND name NOT IN (SELECT name FROM Scraped_Names WHERE team_id = ?)",
+                [(team_id, team_id) for team_id in set(row[1] for row in rows)]
+            )
+        cur.executemany(
+            f"INSERT INTO NCAA_Players ({', '.join(NCAA_COLUMNS)}) VALUES ({', '.join('?' for _ in NCAA_COLUMNS)}) "
+            f"ON CONFLICT(name, team_id) DO UPDATE SET {update}",
+            rows
+        )
+        fetched_at = datetime.now(timezone.utc).isoformat()
+        cur.executemany(
+            "INSERT OR REPLACE INTO NCAA_Team_Pages (team_id, season_url, content_hash, fetched_at) VALUES (?, ?, ?, ?)",
+            [(team_ids[name], season_url, content_hash, fetched_at) for name, (season_url, content_hash) in (pages or {}).items()]
+        )
+        metrics.refresh_metrics(cur, "NCAA_Players", "NCAA_Players_Metrics_Dirty")
+        cur.execute("DELETE FROM NCAA_Players_Metrics_Dirty")
+        schema.bump_generation(cur)
+
+def get_team_page_hashes(cur):
+    """
+    Reads the content hash of every NCAA team page stored so far.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    Returns
+    -----------------------
+    hashes: dict
+        Maps team name to the hash of its last stored roster page.
+    """
+    cur.execute("SELECT NCAA_Teams.name, content_hash FROM NCAA_Team_Pages JOIN NCAA_Teams ON NCAA_Teams.team_id = NCAA_Team_Pages.team_id")
+    return dict(cur.fetchall())
+
+def bulk_update_salaries(salaries, cur, conn, contracts=None):
+    """
+    Sets the salary column for many players in one transaction, and optionally
+    replaces their rows in the Contracts table.
+
+    Parameters
+    -----------------------
+    salaries: list of tuples
+        (salary, player_id) pairs.
+
+    cur: Cursor
+        The database cursor object.
+
+    conn: Connection
+        The database connection object.
+
+    contracts: list of tuples
+        (player_id, status, position, cap_hit, details, fetched_at) rows. Every
+        Contracts row of the players listed here is replaced. None leaves Contracts alone.
+
+    Returns
+    -----------------------
+    None
+    """
+    with load_pragmas(conn), conn:
+        cur.executemany("UPDATE Players SET salary = ? WHERE player_id = ?", salaries)
+        if contracts is not None:
+            player_ids = {(row[0],) for row in contracts}
+            cur.executemany("DELETE FROM Contracts WHERE player_id = ?", player_ids)
+            cur.executemany(
+                "INSERT INTO Contracts (player_id, status, position, cap_hit, details, fetched_at) VALUES (?, ?, ?, ?, ?, ?)",
+                contracts)
+        refresh_team_summary(cur)
+        schema.bump_generation(cur)
+
+def refresh_team_summary(cur):
+    """
+    Recomputes the Team_Summary rows for teams marked in Team_Summary_Dirty and
+    clears the marks. Triggers set the marks when a player's goals, penalty minutes,
+    salary or teams change. Does not commit so it shares the caller's transaction.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    Returns
+    -----------------------
+    Int:
+        Number of teams recomputed.
+    """
+    cur.execute("SELECT COUNT(*) FROM Team_Summary_Dirty")
+    dirty = cur.fetchone()[0]
+    if not dirty:
+        return 0
+    for statement in schema.TEAM_SUMMARY_REFRESH:
+        cur.execute(statement)
+    return dirty
+
+def get_checkpoint(cur, source, season):
+    """
+    Looks up the saved checkpoint for a source and season.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    source: str
+        Name of the data source, like "nhl_skaters".
+
+    season: str
+        Season ID, like "20232024".
+
+    Returns
+    -----------------------
+    Tuple (last_offset, complete, fetched_at) or None:
+        None if nothing was saved yet. fetched_at is a UTC datetime.
+    """
+    cur.execute("SELECT last_offset, complete, fetched_at FROM Ingest_Checkpoint WHERE source = ? AND season = ?", (source, season))
+    row = cur.fetchone()
+    if not row:
+        return None
+    return row[0], bool(row[1]), datetime.fromisoformat(row[2])
+
+def save_checkpoint(cur, source, season, offset, complete):
+    """
+    Saves how many rows of a source and season are stored. Does not commit so it
+    can share a transaction with the rows it describes.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    source: str
+        Name of the data source, like "nhl_skaters".
+
+    season: str
+        Season ID, like "20232024".
+
+    offset: int
+        Number of rows from the start of the source that are committed.
+
+    complete: bool
+        True once the last page of the source was stored.
+
+    Returns
+    -----------------------
+    None
+    """
+    cur.execute(
+        "INSERT OR REPLACE INTO Ingest_Checkpoint (source, season, last_offset, complete, fetched_at) VALUES (?, ?, ?, ?, ?)",
+        (source, season, offset, int(complete), datetime.now(timezone.utc).isoformat())
+    )
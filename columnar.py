@@ -0,0 +1,55 @@
+import numpy as np
+
+# Column-wise query results. Rows are read straight from the cursor into one
+# structured NumPy array with np.fromiter, so no Python list of rows is built,
+# and each column is handed back as its own array. This saves memory rather than
+# time: sqlite3 turning each row into Python objects costs the same either way.
+
+def to_columns(rows, columns):
+    """
+    Turns row tuples into one NumPy array per column.
+
+    Parameters
+    -----------------------
+    rows: iterable of tuples
+        Query result rows, either a list or a cursor that has been executed.
+
+    columns: list of tuples
+        (name, dtype) for each column in row order. Use object for text columns.
+        Numeric columns can't hold NULL, so COALESCE them in the SQL if they might.
+
+    Returns
+    -----------------------
+    Dictionary {name: ndarray}:
+        One array per column, all the same length.
+    """
+    dtype = np.dtype([(name, column_type) for name, column_type in columns])
+    count = len(rows) if isinstance(rows, list) else -1
+    table = np.fromiter(rows, dtype=dtype, count=count)
+    return {name: table[name] for name, _ in columns}
+
+def fetch_columns(cur, query, params, columns):
+    """
+    Runs a query and returns the result as one NumPy array per column.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    query: str
+        The SELECT statement.
+
+    params: tuple
+        Parameters for the query.
+
+    columns: list of tuples
+        (name, dtype) for each selected column in order.
+
+    Returns
+    -----------------------
+    Dictionary {name: ndarray}:
+        One array per column.
+    """
+    cur.execute(query, params)
+    return to_columns(cur, columns)
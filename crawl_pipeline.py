@@ -0,0 +1,267 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import html_parsers
+
+# Staged crawl of the NCAA team pages, used by PIM.get_college_players.
+#   fetch  - threads download team and roster pages and put the HTML on a bounded queue
+#   parse  - a process pool pulls the season link or the roster rows out of the HTML
+#   write  - the calling thread batches parsed rosters into a few large inserts
+# Each stage only hands work on through a bounded queue, so when one falls behind
+# the stages before it wait instead of piling up pages in memory. A team page's
+# season link goes back to the fetch stage as a roster page to download.
+
+SITE = "https://www.hockeydb.com"
+
+QUEUE_SIZE = 32
+BATCH_SIZE = 500
+
+def parse_page(kind, text, team_name, label, parser):
+    """
+    Runs in a parse worker process: reads a team page's season link or a roster page's players.
+    The backend is passed in because a spawned worker imports html_parsers afresh
+    and would not see a backend the parent picked with html_parsers.configure.
+
+    Parameters
+    -----------------------
+    kind: str
+        "team" or "roster".
+
+    text: str
+        The page HTML.
+
+    team_name: str
+        The team the page is for.
+
+    label: str
+        The season label, like "2023-24", used for team pages.
+
+    parser: str
+        The html_parsers backend to use.
+
+    Returns
+    -----------------------
+    Tuple (result, seconds):
+        The season href (or None) for a team page, the list of player
+        dictionaries for a roster page, and how long parsing took.
+    """
+    start = time.perf_counter()
+    if kind == "team":
+        result = html_parsers.extract_season_link(text, label, parser)
+    else:
+        result = html_parsers.extract_players(text, team_name, parser)
+    return result, time.perf_counter() - start
+
+def page_hash(text):
+    """
+    Hashes a page's HTML so an unchanged page can be recognized without parsing it.
+
+    Parameters
+    -----------------------
+    text: str
+        The page HTML.
+
+    Returns
+    -----------------------
+    The SHA-256 hex digest of the text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def crawl(teams, label, fetch_text, write, known_hashes=None, fetch_workers=8, parse_workers=None,
+          queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, parser=None):
+    """
+    Fetches, parses and stores the rosters of a list of teams through the three stages.
+
+    Parameters
+    -----------------------
+    teams: list of tuples
+        (team_name, team_url) for each team.
+
+    label: str
+        The season label, like "2023-24".
+
+    fetch_text: function
+        Takes a URL and returns the page text or None, like PIM.get_page_text.
+        Called from the fetch threads.
+
+    write: function
+        Takes (players, pages) and stores them, like PIM.insert_player_data with
+        prune=True. players is a list of player dictionaries from several teams,
+        pages is {team name: (season_url, content_hash)}. Called on this thread only.
+
+    known_hashes: dict
+        {team name: content hash} of roster pages already stored. Pages with the
+        same hash are skipped before they reach the parse stage.
+
+    fetch_workers: int
+        Number of fetch threads.
+
+    parse_workers: int
+        Number of parse processes. None uses one per CPU.
+
+    queue_size: int
+        Pages waiting to be parsed, and parsed rosters waiting to be written, before the earlier stage waits.
+
+    batch_size: int
+        Players written per insert.
+
+    parser: str
+        html_parsers backend for the parse processes. None uses the one this
+        process has configured.
+
+    Returns
+    -----------------------
+    metrics: dict
+        {stage: {"items", "seconds", "max_queue"}} for fetch, parse and write.
+        seconds is the time spent working, added up over every thread or process of the stage.
+    """
+    known_hashes = known_hashes or {}
+    parse_workers = parse_workers or os.cpu_count() or 1
+    parser = parser or html_parsers.backend
+    parse_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    in_flight = threading.BoundedSemaphore(parse_workers * 2)
+    stop = threading.Event()
+    metrics = {stage: {"items": 0, "seconds": 0.0, "max_queue": 0} for stage in ("fetch", "parse", "write")}
+    metrics_lock = threading.Lock()
+
+    def record(stage, seconds):
+        with metrics_lock:
+            metrics[stage]["items"] += 1
+            metrics[stage]["seconds"] += seconds
+
+    def put(stage, stage_queue, item):
+        # Blocks while the stage is queue_size items behind, unless the crawl is stopping
+        while not stop.is_set():
+            try:
+                stage_queue.put(item, timeout=0.5)
+            except queue.Full:
+                continue
+            with metrics_lock:
+                metrics[stage]["max_queue"] = max(metrics[stage]["max_queue"], stage_queue.qsize())
+            return
+
+    def fetch(kind, team_name, url):
+        start = time.perf_counter()
+        try:
+            text = fetch_text(url)
+        except Exception as e:
+            print(f"Request failed for {url}: {e}")
+            text = None
+        record("fetch", time.perf_counter() - start)
+        if text is None:
+            put("write", write_queue, ("failed", team_name, url, None, None))
+            return
+        try:
+            content_hash = None
+            if kind == "roster":
+                content_hash = page_hash(text)
+                if known_hashes.get(team_name) == content_hash:
+                    put("write", write_queue, ("unchanged", team_name, url, None, content_hash))
+                    return
+            put("parse", parse_queue, (kind, team_name, url, text, content_hash))
+        except Exception as e:
+            # The pool would swallow it and leave the write stage waiting for this team
+            put("write", write_queue, ("error", team_name, url, e, None))
+
+    def parsed(future, kind, team_name, url, content_hash):
+        in_flight.release()
+        try:
+            result, seconds = future.result()
+        except Exception as e:
+            print(f"Parsing failed for {url}: {e}")
+            put("write", write_queue, ("failed", team_name, url, None, None))
+            return
+        record("parse", seconds)
+        if kind == "roster":
+            put("write", write_queue, ("players", team_name, url, result, content_hash))
+        elif result is None:
+            put("write", write_queue, ("no_season", team_name, url, None, None))
+        elif not stop.is_set():
+            fetch_pool.submit(fetch, "roster", team_name, SITE + result)
+
+    def dispatch():
+        error = None
+        try:
+            while not stop.is_set():
+                try:
+                    kind, team_name, url, text, content_hash = parse_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                # Blocks while every parse process already has two pages
+                while not in_flight.acquire(timeout=0.5):
+                    if stop.is_set():
+                        return
+                future = parse_pool.submit(parse_page, kind, text, team_name, label, parser)
+                future.add_done_callback(lambda future, kind=kind, team_name=team_name, url=url, content_hash=content_hash:
+                                         parsed(future, kind, team_name, url, content_hash))
+        except Exception as e:
+            # Handed to the write stage, which raises it on the calling thread
+            error = e
+        finally:
+            # Only stop ends the loop, so the write stage is still waiting and has to hear about it
+            if not stop.is_set():
+                put("write", write_queue, ("error", None, None, error or RuntimeError("parse dispatcher stopped"), None))
+
+    players, pages = [], {}
+
+    def flush():
+        if not pages:
+            return
+        start = time.perf_counter()
+        write(players, pages)
+        record("write", time.perf_counter() - start)
+        print(f"Data for {', '.join(pages)} added to the database.")
+        players.clear()
+        pages.clear()
+
+    began = time.perf_counter()
+    # spawn, since forking while the fetch threads hold locks is not safe
+    context = multiprocessing.get_context("spawn")
+    with ThreadPoolExecutor(max_workers=fetch_workers) as fetch_pool, \
+            ProcessPoolExecutor(max_workers=parse_workers, mp_context=context) as parse_pool:
+        dispatcher = threading.Thread(target=dispatch, daemon=True)
+        dispatcher.start()
+        try:
+            for team_name, team_url in teams:
+                fetch_pool.submit(fetch, "team", team_name, team_url)
+
+            # Write stage: every team ends in exactly one message on write_queue, and
+            # anything that would leave a team without one posts an error instead
+            for _ in range(len(teams)):
+                try:
+                    status, team_name, url, result, content_hash = write_queue.get(timeout=0.5)
+                except queue.Empty:
+                    # Nothing new for a while, write what is waiting
+                    flush()
+                    status, team_name, url, result, content_hash = write_queue.get()
+                if status == "error":
+                    raise RuntimeError(f"Crawl stopped at {team_name or 'the parse stage'}") from result
+                if status == "no_season":
+                    print(f"No active season found for {team_name}.")
+                elif status == "unchanged":
+                    print(f"Skipping {team_name} (page unchanged).")
+                elif status == "failed":
+                    print(f"Could not scrape {team_name}.")
+                elif not result:
+                    print(f"No player data found for {team_name}.")
+                else:
+                    players.extend(result)
+                    pages[team_name] = (url, content_hash)
+                    if len(players) >= batch_size:
+                        flush()
+            flush()
+        finally:
+            # Lets any thread still waiting on a queue give up, so the pools can shut down
+            stop.set()
+            dispatcher.join()
+    elapsed = time.perf_counter() - began
+
+    print(f"{'stage':<6} {'items':>6} {'items/s':>8} {'busy s':>8} {'max queue':>10}")
+    for stage, values in metrics.items():
+        print(f"{stage:<6} {values['items']:>6} {values['items'] / elapsed:>8.1f} {values['seconds']:>8.2f} {values['max_queue']:>10}")
+    return metrics
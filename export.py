@@ -0,0 +1,222 @@
+import csv
+
+# pyarrow is optional and slow to import, so it is only loaded by require_arrow
+# the first time Arrow or Parquet output is asked for
+pa = None
+ipc = None
+pq = None
+
+# Streaming export and import. Query results are pulled with fetchmany in
+# batches and written as they arrive, so memory stays flat no matter how many
+# rows there are. CSV is always available; Arrow IPC and Parquet need pyarrow.
+
+BATCH_SIZE = 1000
+
+def iter_query(cur, query, params=(), batch_size=BATCH_SIZE):
+    """
+    Runs a query and yields its rows a batch at a time.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    query: str
+        The SELECT statement.
+
+    params: tuple
+        Parameters for the query.
+
+    batch_size: int
+        Rows fetched from SQLite per fetchmany call.
+
+    Returns
+    -----------------------
+    Generator of tuples:
+        The result rows, one at a time.
+    """
+    cur.execute(query, params)
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+def batched(rows, batch_size=BATCH_SIZE):
+    """
+    Groups an iterable of rows into lists of at most batch_size rows.
+
+    Parameters
+    -----------------------
+    rows: iterable
+        Rows to group.
+
+    batch_size: int
+        Largest batch to yield.
+
+    Returns
+    -----------------------
+    Generator of lists:
+        The batches in order.
+    """
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def write_csv_rows(rows, filename, header):
+    """
+    Writes rows to a CSV file as they come from an iterable.
+
+    Parameters
+    -----------------------
+    rows: iterable
+        Rows to write, for example from iter_query.
+
+    filename: str
+        The CSV file to write.
+
+    header: list
+        Column names for the first line.
+
+    Returns
+    -----------------------
+    Int:
+        Number of rows written.
+    """
+    count = 0
+    with open(filename, 'w', newline='') as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow(header)
+        for row in rows:
+            csvwriter.writerow(row)
+            count += 1
+    return count
+
+def iter_csv(filename):
+    """
+    Yields the rows of a CSV file one at a time, header first.
+
+    Parameters
+    -----------------------
+    filename: str
+        The CSV file to read.
+
+    Returns
+    -----------------------
+    Generator of lists:
+        Each row of the file as a list of strings.
+    """
+    with open(filename, 'r', newline='') as csvfile:
+        yield from csv.reader(csvfile)
+
+def require_arrow():
+    """
+    Imports pyarrow on first use, or raises ImportError with a clear message if it is not installed.
+
+    Parameters
+    -----------------------
+    None
+
+    Returns
+    -----------------------
+    None
+    """
+    global pa, ipc, pq
+    if pa is not None:
+        return
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Arrow and Parquet export need pyarrow, install it with `pip install pyarrow`") from None
+    pa, ipc, pq = pyarrow, pyarrow.ipc, pyarrow.parquet
+
+def write_columnar(rows, filename, header, file_format="arrow", batch_size=BATCH_SIZE):
+    """
+    Writes rows to an Arrow IPC file or a Parquet file one record batch at a time.
+    Column types are taken from the first batch.
+
+    Parameters
+    -----------------------
+    rows: iterable
+        Rows to write, for example from iter_query.
+
+    filename: str
+        The file to write.
+
+    header: list
+        Column names in row order.
+
+    file_format: str
+        "arrow" for an Arrow IPC file that can be memory-mapped, or "parquet".
+
+    batch_size: int
+        Rows per record batch (Arrow) or row group (Parquet).
+
+    Returns
+    -----------------------
+    Int:
+        Number of rows written.
+    """
+    require_arrow()
+    writer = None
+    sink = None
+    count = 0
+    try:
+        for batch in batched(rows, batch_size):
+            columns = [list(column) for column in zip(*batch)]
+            if writer is None:
+                record_batch = pa.RecordBatch.from_arrays([pa.array(column) for column in columns], names=header)
+                schema = record_batch.schema
+                if file_format == "parquet":
+                    writer = pq.ParquetWriter(filename, schema)
+                else:
+                    sink = pa.OSFile(filename, 'wb')
+                    writer = ipc.new_file(sink, schema)
+            else:
+                record_batch = pa.RecordBatch.from_arrays(
+                    [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema)
+            if file_format == "parquet":
+                writer.write_batch(record_batch)
+            else:
+                writer.write(record_batch)
+            count += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+        if sink is not None:
+            sink.close()
+    if writer is None:
+        # No rows, still leave a valid file with the column names
+        schema = pa.schema([(name, pa.null()) for name in header])
+        if file_format == "parquet":
+            pq.write_table(schema.empty_table(), filename)
+        else:
+            with pa.OSFile(filename, 'wb') as sink, ipc.new_file(sink, schema):
+                pass
+    return count
+
+def read_arrow(filename):
+    """
+    Opens an Arrow IPC file through a memory map, so the columns are read straight
+    from the page cache instead of being parsed.
+
+    Parameters
+    -----------------------
+    filename: str
+        The Arrow IPC file written by write_columnar.
+
+    Returns
+    -----------------------
+    Table:
+        A pyarrow Table backed by the memory-mapped file.
+    """
+    require_arrow()
+    with pa.memory_map(filename, 'r') as source:
+        return ipc.open_file(source).read_all()
@@ -0,0 +1,195 @@
+import os
+import threading
+import requests
+import http_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Shared HTTP layer used by PIM.py and players_api.py so every request goes
+# through one pooled, keep-alive session instead of a new connection each time.
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+DEFAULT_TIMEOUT = 20
+
+_session = None
+_session_lock = threading.Lock()
+
+# On-disk response cache consulted by fetch. Set HTTP_OFFLINE=1 to serve only from cache.
+cache = http_cache.ResponseCache(offline=os.environ.get("HTTP_OFFLINE") == "1")
+
+def make_session(pool_size=16, retries=3, backoff=0.5):
+    """
+    Builds a requests Session with a connection pool, keep-alive and retries.
+
+    Parameters
+    -----------------------
+    pool_size: int
+        Number of connections kept open per host. Should be at least the number of crawl threads.
+
+    retries: int
+        How many times a failed connection or a 500/502/504 response is retried.
+        429 and 503 come back to the caller so rate_limit.RequestScheduler can pause the host.
+
+    backoff: float
+        Backoff factor between retries, the n-th retry waits backoff * 2 ** (n - 1) seconds.
+
+    Returns
+    -----------------------
+    Session:
+        The configured requests Session.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(500, 502, 504),
+        allowed_methods=("GET", "HEAD"),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def configure(pool_size=16, retries=3, backoff=0.5):
+    """
+    Replaces the shared session with one using the given pool and retry settings.
+
+    Parameters
+    -----------------------
+    pool_size: int
+        Number of connections kept open per host.
+
+    retries: int
+        How many times a failed request is retried.
+
+    backoff: float
+        Backoff factor between retries.
+
+    Returns
+    -----------------------
+    Session:
+        The new shared session.
+    """
+    global _session
+    with _session_lock:
+        old = _session
+        _session = make_session(pool_size, retries, backoff)
+    if old is not None:
+        old.close()
+    return _session
+
+def get_session():
+    """
+    Returns the shared session, creating it with the default settings on first use.
+
+    Parameters
+    -----------------------
+    None
+
+    Returns
+    -----------------------
+    Session:
+        The shared requests Session.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = make_session()
+    return _session
+
+def configure_cache(directory=http_cache.CACHE_DIR, ttls=None, max_bytes=http_cache.MAX_CACHE_BYTES, offline=False, enabled=True):
+    """
+    Replaces the shared response cache.
+
+    Parameters
+    -----------------------
+    directory: str
+        Folder the cache files are kept in.
+
+    ttls: dict
+        Maps a host to the seconds its responses stay fresh. Uses http_cache.SOURCE_TTLS if None.
+
+    max_bytes: int
+        Size limit for cached bodies before least recently used entries are evicted.
+
+    offline: bool
+        Serve only from the cache and never touch the network.
+
+    enabled: bool
+        False turns caching off so every fetch goes to the network.
+
+    Returns
+    -----------------------
+    ResponseCache:
+        The new shared cache, or None if caching is disabled.
+    """
+    global cache
+    cache = http_cache.ResponseCache(directory, ttls, max_bytes=max_bytes, offline=offline) if enabled else None
+    return cache
+
+def fetch(url, params=None, headers=None, timeout=DEFAULT_TIMEOUT, use_cache=True):
+    """
+    GETs a URL through the shared session and response cache. Does not raise on a bad status code,
+    callers check response.status_code or call raise_for_status themselves.
+
+    Parameters
+    -----------------------
+    url: str
+        The URL to request.
+
+    params: dict
+        Optional query string parameters.
+
+    headers: dict
+        Optional headers added on top of DEFAULT_HEADERS.
+
+    timeout: float
+        Seconds to wait for the server before giving up.
+
+    use_cache: bool
+        False skips the response cache for this request.
+
+    Returns
+    -----------------------
+    Response:
+        The requests Response object.
+    """
+    if use_cache and cache is not None:
+        return cache.get(get_session(), url, params, headers, timeout)
+    return get_session().get(url, params=params, headers=headers, timeout=timeout)
+
+def fetch_json(url, params=None, headers=None, timeout=DEFAULT_TIMEOUT):
+    """
+    GETs a URL through the shared session and parses the JSON body.
+
+    Parameters
+    -----------------------
+    url: str
+        The URL to request.
+
+    params: dict
+        Optional query string parameters.
+
+    headers: dict
+        Optional headers added on top of DEFAULT_HEADERS.
+
+    timeout: float
+        Seconds to wait for the server before giving up.
+
+    Returns
+    -----------------------
+    Dictionary:
+        The parsed JSON response. Raises requests.exceptions.HTTPError on a bad status code.
+    """
+    response = fetch(url, params, headers, timeout)
+    response.raise_for_status()
+    return response.json()
@@ -0,0 +1,418 @@
+import importlib.util
+import os
+from html.parser import HTMLParser
+
+# Extractors for the three kinds of hockeydb.com pages PIM.py reads: the NCAA
+# team list, a team's page with its season links and a season's roster stats.
+# Each backend pulls only those pieces out of the HTML instead of building and
+# searching a whole BeautifulSoup tree. Backends:
+#   "html.parser" - BeautifulSoup with Python's html.parser, the original code and the reference output
+#   "stdlib"      - a streaming html.parser.HTMLParser that keeps no tree and stops after the roster table
+#   "lxml"        - lxml.html with XPath, needs `pip install lxml`
+#   "selectolax"  - selectolax's lexbor parser with CSS selectors, needs `pip install selectolax`
+# All of them give the same output as "html.parser" on the pages checked by
+# benchmarks.py html_parsers. Set HTML_PARSER to pick one, by default the fastest installed one is used.
+
+PREFERENCE = ["selectolax", "lxml", "stdlib"]
+
+def player_from_cells(cells, team_name):
+    """
+    Turns the cell texts of a roster row into a player dictionary.
+
+    Parameters
+    -----------------------
+    cells: list of str
+        The stripped text of each cell in the row.
+
+    team_name: str
+        The team this data is for.
+
+    Returns
+    -----------------------
+    A player dictionary, or None if the row has too few cells to be a player.
+    """
+    if len(cells) < 8:  # Ensure sufficient columns
+        return None
+    return {
+        'Team': team_name,
+        'Name': cells[1],
+        'Position': cells[2],
+        'GP': int(cells[3] or 0),
+        'G': int(cells[4] or 0),
+        'A': int(cells[5] or 0),
+        'PTS': int(cells[6] or 0),
+        'PIM': int(cells[7] or 0)
+    }
+
+def players_from_rows(rows, team_name):
+    """
+    Turns the cell texts of a roster table into player dictionaries, skipping the header row.
+
+    Parameters
+    -----------------------
+    rows: list of lists
+        The stripped text of each cell, one list per row.
+
+    team_name: str
+        The team this data is for.
+
+    Returns
+    -----------------------
+    players_data: list
+        A list of player dictionaries with each player's stats.
+    """
+    players = []
+    for cells in rows[1:]:
+        player = player_from_cells(cells, team_name)
+        if player:
+            players.append(player)
+    return players
+
+# html.parser: BeautifulSoup, as PIM.py has always done it
+
+def _soup(text):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(text, 'html.parser')
+
+def _soup_players(text, team_name):
+    table = _soup(text).find('table')
+    if not table:
+        return []
+    rows = [[cell.get_text(strip=True) for cell in row.find_all('td')] for row in table.find_all('tr')]
+    return players_from_rows(rows, team_name)
+
+def _soup_season_link(text, label):
+    for row in _soup(text).find_all('tr'):
+        season_link = row.find('a', href=True)
+        if season_link and label in season_link.text.lower():  # Case-insensitive
+            return season_link['href']
+    return None
+
+def _soup_team_links(text):
+    team_links = []
+    for td in _soup(text).find_all('td', class_='tp'):
+        link_tag = td.find('a')
+        if link_tag and 'href' in link_tag.attrs:
+            team_links.append(link_tag['href'])
+    return team_links
+
+# stdlib: event-driven html.parser.HTMLParser subclasses that only track the
+# open <tr>, <td> and <a> tags they care about
+
+class _Done(Exception):
+    pass
+
+class _RosterParser(HTMLParser):
+    """
+    Collects the cell texts of every row in the first <table>. Like BeautifulSoup's
+    find_all, a row gets the cells of any table nested inside it too.
+    """
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self.open_rows = []
+        self.open_cells = []
+        self.depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            self.depth += 1
+        if not self.depth:
+            return
+        if tag == "tr":
+            row = []
+            self.rows.append(row)
+            self.open_rows.append((row, len(self.open_cells)))
+        elif tag == "td":
+            cell = []
+            for row, _ in self.open_rows:
+                row.append(cell)
+            self.open_cells.append(cell)
+
+    def handle_endtag(self, tag):
+        if not self.depth:
+            return
+        if tag == "td" and self.open_cells:
+            self.open_cells.pop()
+        elif tag == "tr" and self.open_rows:
+            # An end tag closes whatever was left open inside it
+            _, cells = self.open_rows.pop()
+            del self.open_cells[cells:]
+        elif tag == "table":
+            self.depth -= 1
+            if not self.depth:
+                raise _Done
+
+    def handle_data(self, data):
+        text = data.strip()
+        if text:
+            for cell in self.open_cells:
+                cell.append(text)
+
+class _RowLinkParser(HTMLParser):
+    """
+    Records, for every <tr>, the href and text of the first <a href> inside it.
+    """
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self.open_rows = []
+        self.open_links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            row = [None, None]
+            self.rows.append(row)
+            self.open_rows.append(row)
+        elif tag == "a":
+            attrs = dict(attrs)
+            if "href" not in attrs:
+                self.open_links.append(None)
+                return
+            texts = []
+            for row in self.open_rows:
+                if row[0] is None:
+                    row[0], row[1] = attrs["href"] or "", texts
+            self.open_links.append(texts)
+
+    def handle_endtag(self, tag):
+        if tag == "tr" and self.open_rows:
+            self.open_rows.pop()
+        elif tag == "a" and self.open_links:
+            self.open_links.pop()
+
+    def handle_data(self, data):
+        for texts in self.open_links:
+            if texts is not None:
+                texts.append(data)
+
+class _TeamLinkParser(HTMLParser):
+    """
+    Records the first <a> inside every <td class="tp"> and its href, if it has one.
+    """
+    def __init__(self):
+        super().__init__()
+        self.cells = []
+        self.open_cells = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "td":
+            attrs = dict(attrs)
+            cell = "tp" in (attrs.get("class") or "").split()
+            if cell:
+                cell = [False, None]
+                self.cells.append(cell)
+            self.open_cells.append(cell)
+        elif tag == "a":
+            for cell in self.open_cells:
+                if cell and not cell[0]:
+                    attrs = dict(attrs)
+                    cell[0], cell[1] = True, (attrs["href"] or "") if "href" in attrs else None
+
+    def handle_endtag(self, tag):
+        if tag == "td" and self.open_cells:
+            self.open_cells.pop()
+
+def _feed(parser, text):
+    try:
+        parser.feed(text)
+        parser.close()
+    except _Done:
+        pass
+    return parser
+
+def _stdlib_players(text, team_name):
+    rows = _feed(_RosterParser(), text).rows
+    return players_from_rows([["".join(cell) for cell in row] for row in rows], team_name)
+
+def _stdlib_season_link(text, label):
+    for href, texts in _feed(_RowLinkParser(), text).rows:
+        if href is not None and label in "".join(texts).lower():
+            return href
+    return None
+
+def _stdlib_team_links(text):
+    return [href for _, href in _feed(_TeamLinkParser(), text).cells if href is not None]
+
+# lxml
+
+def _lxml_document(text):
+    import lxml.html
+    return lxml.html.document_fromstring(text)
+
+def _lxml_players(text, team_name):
+    tables = _lxml_document(text).xpath("(//table)[1]")
+    if not tables:
+        return []
+    rows = [["".join(part.strip() for part in cell.xpath(".//text()")) for cell in row.iter("td")]
+            for row in tables[0].iter("tr")]
+    return players_from_rows(rows, team_name)
+
+def _lxml_season_link(text, label):
+    for row in _lxml_document(text).iter("tr"):
+        links = row.xpath(".//a[@href]")
+        if links and label in "".join(links[0].xpath(".//text()")).lower():
+            return links[0].get("href")
+    return None
+
+def _lxml_team_links(text):
+    team_links = []
+    for td in _lxml_document(text).xpath("//td[contains(concat(' ', normalize-space(@class), ' '), ' tp ')]"):
+        links = td.xpath(".//a")
+        if links and "href" in links[0].attrib:
+            team_links.append(links[0].get("href"))
+    return team_links
+
+# selectolax
+
+def _lexbor(text):
+    from selectolax.lexbor import LexborHTMLParser
+    return LexborHTMLParser(text)
+
+def _selectolax_players(text, team_name):
+    table = _lexbor(text).css_first("table")
+    if table is None:
+        return []
+    rows = [[cell.text(deep=True, separator="", strip=True) for cell in row.css("td")] for row in table.css("tr")]
+    return players_from_rows(rows, team_name)
+
+def _selectolax_season_link(text, label):
+    for row in _lexbor(text).css("tr"):
+        link = row.css_first("a[href]")
+        if link is not None and label in link.text(deep=True).lower():
+            return link.attributes["href"] or ""
+    return None
+
+def _selectolax_team_links(text):
+    team_links = []
+    for td in _lexbor(text).css("td.tp"):
+        link = td.css_first("a")
+        if link is not None and "href" in link.attributes:
+            team_links.append(link.attributes["href"] or "")
+    return team_links
+
+BACKENDS = {
+    "html.parser": {"players": _soup_players, "season_link": _soup_season_link, "team_links": _soup_team_links, "module": "bs4"},
+    "stdlib": {"players": _stdlib_players, "season_link": _stdlib_season_link, "team_links": _stdlib_team_links, "module": None},
+    "lxml": {"players": _lxml_players, "season_link": _lxml_season_link, "team_links": _lxml_team_links, "module": "lxml"},
+    "selectolax": {"players": _selectolax_players, "season_link": _selectolax_season_link, "team_links": _selectolax_team_links, "module": "selectolax"},
+}
+
+def available_backends():
+    """
+    Lists the backends whose library is installed.
+
+    Parameters
+    -----------------------
+    None
+
+    Returns
+    -----------------------
+    names: list of str
+    """
+    return [name for name, backend in BACKENDS.items()
+            if backend["module"] is None or importlib.util.find_spec(backend["module"]) is not None]
+
+def default_backend():
+    """
+    Picks the HTML_PARSER backend if set, otherwise the first installed one from PREFERENCE.
+    Raises ValueError if HTML_PARSER names no key of BACKENDS, like configure does.
+
+    Parameters
+    -----------------------
+    None
+
+    Returns
+    -----------------------
+    String:
+        The backend name.
+    """
+    name = os.environ.get("HTML_PARSER")
+    if name:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown HTML parser {name!r} in HTML_PARSER, choose from {', '.join(BACKENDS)}")
+        return name
+    available = available_backends()
+    return next(name for name in PREFERENCE if name in available)
+
+backend = default_backend()
+
+def configure(name):
+    """
+    Switches the backend used by extract_players, extract_season_link and extract_team_links.
+
+    Parameters
+    -----------------------
+    name: str
+        A key of BACKENDS.
+
+    Returns
+    -----------------------
+    None
+    """
+    global backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown HTML parser {name!r}, choose from {', '.join(BACKENDS)}")
+    backend = name
+
+def extract_players(text, team_name, parser=None):
+    """
+    Reads the player rows out of the first table of a team's season stats page.
+
+    Parameters
+    -----------------------
+    text: str
+        The page HTML.
+
+    team_name: str
+        The team this data is for.
+
+    parser: str
+        Backend to use instead of the configured one.
+
+    Returns
+    -----------------------
+    players_data: list
+        A list of player dictionaries with each player's stats.
+    """
+    return BACKENDS[parser or backend]["players"](text, team_name)
+
+def extract_season_link(text, label, parser=None):
+    """
+    Finds the first table row whose first link mentions the season label.
+
+    Parameters
+    -----------------------
+    text: str
+        The HTML of a team's page.
+
+    label: str
+        The season label, like "2023-24".
+
+    parser: str
+        Backend to use instead of the configured one.
+
+    Returns
+    -----------------------
+    The link's href as written in the page, or None.
+    """
+    return BACKENDS[parser or backend]["season_link"](text, label)
+
+def extract_team_links(text, parser=None):
+    """
+    Lists the link in every team cell (<td class="tp">) of the NCAA team list.
+
+    Parameters
+    -----------------------
+    text: str
+        The HTML of the team list page.
+
+    parser: str
+        Backend to use instead of the configured one.
+
+    Returns
+    -----------------------
+    hrefs: list of str
+        The links as written in the page.
+    """
+    return BACKENDS[parser or backend]["team_links"](text)
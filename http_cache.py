@@ -0,0 +1,307 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# On-disk cache for HTTP GET responses, used by fetcher.fetch.
+# Each response is stored under a hash of its URL and query parameters as two
+# files: <key>.body holds the raw bytes and <key>.json holds the URL, the
+# validators (ETag / Last-Modified) and when it was fetched. The body file's
+# mtime doubles as the last access time for LRU eviction.
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".http_cache")
+
+# Seconds a cached response is served without asking the server again
+SOURCE_TTLS = {
+    "nhle.com": 6 * 60 * 60,
+    "puckpedia.com": 24 * 60 * 60,
+    "hockeydb.com": 7 * 24 * 60 * 60,
+}
+DEFAULT_TTL = 60 * 60
+
+MAX_CACHE_BYTES = 200 * 1024 * 1024
+
+# Headers kept with a cached body
+STORED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+class ResponseCache:
+    """
+    Size-bounded on-disk cache of HTTP responses with TTL and conditional GET revalidation.
+
+    Parameters
+    -----------------------
+    directory: str
+        Folder the cache files are kept in.
+
+    ttls: dict
+        Maps a host (or parent domain) to the number of seconds its responses stay fresh.
+
+    default_ttl: int
+        Freshness in seconds for hosts not found in ttls.
+
+    max_bytes: int
+        Once the cached bodies add up to more than this, the least recently used ones are deleted.
+
+    offline: bool
+        If True, never touch the network. Cached responses are served no matter
+        how old they are and anything else comes back as a 504 response.
+    """
+    def __init__(self, directory=CACHE_DIR, ttls=None, default_ttl=DEFAULT_TTL, max_bytes=MAX_CACHE_BYTES, offline=False):
+        self.directory = directory
+        self.ttls = SOURCE_TTLS if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "stored": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def key(self, url, params=None):
+        """
+        Builds the cache key for a request.
+
+        Parameters
+        -----------------------
+        url: str
+            The request URL.
+
+        params: dict
+            Optional query string parameters.
+
+        Returns
+        -----------------------
+        String:
+            A sha256 hex digest of the URL and the sorted parameters.
+        """
+        items = sorted((str(k), str(v)) for k, v in (params or {}).items())
+        raw = url + "\n" + json.dumps(items)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, url):
+        """
+        Looks up how long responses from a URL's host stay fresh.
+
+        Parameters
+        -----------------------
+        url: str
+            The request URL.
+
+        Returns
+        -----------------------
+        Int:
+            TTL in seconds.
+        """
+        host = urlparse(url).netloc.split(":")[0]
+        for domain, ttl in self.ttls.items():
+            if host == domain or host.endswith("." + domain):
+                return ttl
+        return self.default_ttl
+
+    def lookup(self, url, params=None):
+        """
+        Returns the cached response for a request if it is still fresh, without touching the network.
+
+        Parameters
+        -----------------------
+        url: str
+            The request URL.
+
+        params: dict
+            Optional query string parameters.
+
+        Returns
+        -----------------------
+        Response:
+            The cached response with from_cache set to True, or None if there is
+            no fresh one. In offline mode any cached response counts as fresh.
+        """
+        key = self.key(url, params)
+        meta = self._read_meta(key)
+        if meta and (self.offline or time.time() - meta["fetched_at"] < self.ttl_for(url)):
+            response = self._cached_response(key, meta)
+            if response is not None:
+                self.stats["hits"] += 1
+                return response
+        return None
+
+    def get(self, session, url, params=None, headers=None, timeout=None):
+        """
+        Returns a response for a GET request, from the cache when it is fresh,
+        after a conditional GET when it is stale, or from the network otherwise.
+
+        Parameters
+        -----------------------
+        session: Session
+            The requests Session used when the network is needed.
+
+        url: str
+            The request URL.
+
+        params: dict
+            Optional query string parameters.
+
+        headers: dict
+            Optional extra request headers.
+
+        timeout: float
+            Seconds to wait for the server.
+
+        Returns
+        -----------------------
+        Response:
+            A requests Response. Responses served from disk have from_cache set to True.
+        """
+        response = self.lookup(url, params)
+        if response is not None:
+            return response
+        key = self.key(url, params)
+        meta = self._read_meta(key)
+        if meta and not os.path.exists(self._path(key, ".body")):
+            # Nothing to fall back on if the server answers 304
+            meta = None
+
+        if self.offline:
+            self.stats["misses"] += 1
+            return self._offline_miss(url)
+
+        request_headers = dict(headers or {})
+        if meta and meta.get("ETag"):
+            request_headers["If-None-Match"] = meta["ETag"]
+        if meta and meta.get("Last-Modified"):
+            request_headers["If-Modified-Since"] = meta["Last-Modified"]
+
+        response = session.get(url, params=params, headers=request_headers, timeout=timeout)
+        if response.status_code == 304 and meta:
+            cached = self._cached_response(key, meta)
+            if cached is not None:
+                meta["fetched_at"] = time.time()
+                self._write_json(self._path(key, ".json"), meta)
+                self.stats["revalidated"] += 1
+                return cached
+        self.stats["misses"] += 1
+        if response.status_code == 200:
+            self._store(key, url, response)
+        return response
+
+    def clear(self):
+        """
+        Deletes every cached response.
+
+        Parameters
+        -----------------------
+        None
+
+        Returns
+        -----------------------
+        None
+        """
+        with self._lock:
+            for path in self._body_files():
+                self._remove(path)
+            self._total_bytes = 0
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+    def _read_meta(self, key):
+        try:
+            with open(self._path(key, ".json"), "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_json(self, path, data):
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as file:
+            json.dump(data, file)
+        os.replace(tmp, path)
+
+    def _cached_response(self, key, meta):
+        body_path = self._path(key, ".body")
+        try:
+            with open(body_path, "rb") as file:
+                body = file.read()
+            os.utime(body_path)
+        except OSError:
+            return None
+        response = requests.Response()
+        response.status_code = 200
+        response._content = body
+        response.url = meta["url"]
+        response.headers = CaseInsensitiveDict({name: meta[name] for name in STORED_HEADERS if meta.get(name)})
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.from_cache = True
+        return response
+
+    def _offline_miss(self, url):
+        response = requests.Response()
+        response.status_code = 504
+        response.reason = "Not cached (offline mode)"
+        response._content = b""
+        response.url = url
+        response.from_cache = True
+        return response
+
+    def _store(self, key, url, response):
+        body = response.content
+        meta = {"url": url, "fetched_at": time.time(), "size": len(body)}
+        for name in STORED_HEADERS:
+            if response.headers.get(name):
+                meta[name] = response.headers[name]
+        os.makedirs(os.path.dirname(self._path(key, "")), exist_ok=True)
+        body_path = self._path(key, ".body")
+        with self._lock:
+            old_size = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+            tmp = f"{body_path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as file:
+                file.write(body)
+            os.replace(tmp, body_path)
+            self._write_json(self._path(key, ".json"), meta)
+            self.stats["stored"] += 1
+            if self._total_bytes is None:
+                self._total_bytes = sum(os.path.getsize(path) for path in self._body_files())
+            else:
+                self._total_bytes += len(body) - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _body_files(self):
+        if not os.path.isdir(self.directory):
+            return []
+        paths = []
+        for folder in os.listdir(self.directory):
+            folder_path = os.path.join(self.directory, folder)
+            if os.path.isdir(folder_path):
+                paths.extend(os.path.join(folder_path, name) for name in os.listdir(folder_path) if name.endswith(".body"))
+        return paths
+
+    def _evict(self):
+        # Oldest access first, stop once the cache is back under 90% of the limit
+        entries = []
+        for path in self._body_files():
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            self._remove(path)
+            total -= size
+            self.stats["evicted"] += 1
+        self._total_bytes = total
+
+    def _remove(self, body_path):
+        for path in (body_path, body_path[:-len(".body")] + ".json"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,319 @@
+import difflib
+import time
+import unicodedata
+from collections import Counter, defaultdict
+import seasons
+
+# Links NCAA_Players rows to NHL player_ids. NCAA and NHL rows share no key, and
+# comparing every NCAA name with every NHL name is quadratic, so names are first
+# normalized (accents, punctuation, suffixes, common nicknames) and looked up
+# through two indexes:
+#   exact    - the whole normalized name
+#   surname  - last names within one typo of each other, found through an index
+#              of every last name with each single letter left out, then scored
+#              on the full name. Reported as "surname" when the last names are
+#              equal and "fuzzy" when they are not.
+# Only NHL players first seen in or after the NCAA row's season are candidates,
+# since a player can't go back to college after playing in the NHL. The links
+# are kept in the Player_Links table of the NCAA season's database.
+
+SUFFIXES = {"jr", "sr", "ii", "iii", "iv"}
+
+# Short forms mapped to one spelling so "Alex" and "Alexander" compare equal
+NICKNAMES = {
+    "alex": "alexander", "alexandre": "alexander", "alexandr": "alexander", "aleksander": "alexander",
+    "matt": "matthew", "mathew": "matthew", "mike": "michael", "mikey": "michael", "mickey": "michael",
+    "nick": "nicholas", "nicolas": "nicholas", "nic": "nicholas", "chris": "christopher",
+    "jake": "jacob", "josh": "joshua", "joe": "joseph", "joey": "joseph", "will": "william",
+    "bill": "william", "billy": "william", "rob": "robert", "bob": "robert", "bobby": "robert",
+    "tom": "thomas", "tommy": "thomas", "dan": "daniel", "danny": "daniel", "dave": "david",
+    "jon": "jonathan", "zach": "zachary", "zack": "zachary", "zac": "zachary", "ben": "benjamin",
+    "sam": "samuel", "sammy": "samuel", "tony": "anthony", "andy": "andrew", "drew": "andrew",
+    "steve": "steven", "stephen": "steven", "jim": "james", "jimmy": "james", "greg": "gregory",
+    "jeff": "jeffrey", "ed": "edward", "eddie": "edward", "fred": "frederick", "freddy": "frederick",
+    "cam": "cameron", "charlie": "charles", "pat": "patrick", "tim": "timothy", "nate": "nathan",
+    "gabe": "gabriel", "theo": "theodore", "ollie": "oliver", "mitch": "mitchell", "vinnie": "vincent",
+}
+
+# A match past the exact index needs at least this similarity on the full name,
+# and to beat the next best candidate by MIN_MARGIN, or the NCAA row is left unlinked
+MIN_SCORE = 0.85
+MIN_MARGIN = 0.05
+
+# Past the exact index the first names must start with the same letter and be at
+# least this close too, so brothers and namesakes with the same last name
+# ("Ethan" and "Evan", "Kyler" and "Tyler") are not mixed up
+MIN_FIRST_NAME_SCORE = 0.8
+
+def normalize_name(name):
+    """
+    Puts a player name in the form used for matching: no accents or punctuation,
+    lower case, no Jr/Sr/II suffix and the first name's nickname spelled out.
+
+    Parameters
+    -----------------------
+    name: str
+        A player name like "Alex DeBrincat" or "Pierre-Luc Dubois".
+
+    Returns
+    -----------------------
+    String:
+        The normalized name, like "alexander debrincat" or "pierre luc dubois".
+    """
+    text = unicodedata.normalize("NFKD", name or "")
+    text = "".join(char for char in text if not unicodedata.combining(char)).lower()
+    text = text.replace("-", " ").replace(".", " ").replace("'", "")
+    text = "".join(char if "a" <= char <= "z" or char == " " else " " for char in text)
+    words = [word for word in text.split() if word not in SUFFIXES]
+    if words:
+        words[0] = NICKNAMES.get(words[0], words[0])
+    return " ".join(words)
+
+def deletion_keys(word):
+    """
+    Lists a word and every version of it with one letter left out. Two words
+    within one typo of each other share at least one of these keys.
+
+    Parameters
+    -----------------------
+    word: str
+        A normalized last name.
+
+    Returns
+    -----------------------
+    Set:
+        The keys, including the word itself.
+    """
+    return {word} | {word[:i] + word[i + 1:] for i in range(len(word))}
+
+def build_index(nhl_players):
+    """
+    Indexes NHL players by normalized name and by last name, with the last names
+    also reachable through their deletion_keys.
+
+    Parameters
+    -----------------------
+    nhl_players: iterable of tuples
+        (player_id, name, first_season) for each NHL player, where first_season
+        is the earliest season they show up in.
+
+    Returns
+    -----------------------
+    index: dict
+        "players" maps player_id to (normalized name, first_season), "by_name" and
+        "by_surname" map names to lists of player_ids, and "surname_keys" maps a
+        deletion key to the last names that have it.
+    """
+    index = {"players": {}, "by_name": defaultdict(list), "by_surname": defaultdict(list), "surname_keys": defaultdict(set)}
+    for player_id, name, first_season in nhl_players:
+        normalized = normalize_name(name)
+        if not normalized:
+            continue
+        known = index["players"].get(player_id)
+        if known:
+            # Seen in another season already, keep the earliest one
+            if first_season < known[1]:
+                index["players"][player_id] = (known[0], first_season)
+            continue
+        index["players"][player_id] = (normalized, first_season)
+        index["by_name"][normalized].append(player_id)
+        surname = normalized.rsplit(" ", 1)[-1]
+        if surname not in index["by_surname"]:
+            for key in deletion_keys(surname):
+                index["surname_keys"][key].add(surname)
+        index["by_surname"][surname].append(player_id)
+    return index
+
+def best_candidate(normalized, candidates, index):
+    """
+    Scores candidates on how much of the full name they share and picks the best one if it is clearly ahead.
+
+    Parameters
+    -----------------------
+    normalized: str
+        The normalized NCAA name.
+
+    candidates: iterable
+        NHL player_ids to score.
+
+    index: dict
+        The index from build_index.
+
+    Returns
+    -----------------------
+    Tuple (player_id, score) or None:
+        The best candidate, or None if no one reaches MIN_SCORE or two are too close to call.
+    """
+    matcher = difflib.SequenceMatcher(b=normalized, autojunk=False)
+    scored = []
+    for player_id in candidates:
+        matcher.set_seq1(index["players"][player_id][0])
+        scored.append((matcher.ratio(), player_id))
+    scored.sort(reverse=True)
+    if not scored or scored[0][0] < MIN_SCORE:
+        return None
+    if len(scored) > 1 and scored[0][0] - scored[1][0] < MIN_MARGIN:
+        return None
+    return scored[0][1], scored[0][0]
+
+def match_player(name, season, index):
+    """
+    Finds the NHL player an NCAA player became, if any.
+
+    Parameters
+    -----------------------
+    name: str
+        The NCAA player's name.
+
+    season: str
+        The season ID of the NCAA row. NHL players first seen before it are skipped.
+
+    index: dict
+        The index from build_index.
+
+    Returns
+    -----------------------
+    Tuple (player_id, score, method) or None:
+        The linked NHL player_id, its score and which index found it
+        ("exact", "surname" or "fuzzy"), or None if there is no confident match.
+    """
+    normalized = normalize_name(name)
+    if not normalized:
+        return None
+    players = index["players"]
+
+    def eligible(player_ids):
+        return [player_id for player_id in player_ids if players[player_id][1] >= season]
+
+    exact = eligible(index["by_name"].get(normalized, ()))
+    if len(exact) == 1:
+        return exact[0], 1.0, "exact"
+    if exact:
+        # Two NHL players with the same name, nothing to tell them apart
+        return None
+
+    first_name, surname = normalized.split(" ", 1)[0], normalized.rsplit(" ", 1)[-1]
+    first_matcher = difflib.SequenceMatcher(b=first_name, autojunk=False)
+    surnames = set()
+    for key in deletion_keys(surname):
+        surnames |= index["surname_keys"].get(key, set())
+    candidates = []
+    for other in surnames:
+        for player_id in eligible(index["by_surname"][other]):
+            other_first = players[player_id][0].split(" ", 1)[0]
+            first_matcher.set_seq1(other_first)
+            if other_first[0] == first_name[0] and first_matcher.ratio() >= MIN_FIRST_NAME_SCORE:
+                candidates.append(player_id)
+    found = best_candidate(normalized, candidates, index)
+    if found:
+        return found[0], found[1], "surname" if players[found[0]][0].endswith(" " + surname) else "fuzzy"
+    return None
+
+def resolve(ncaa_players, index):
+    """
+    Matches a batch of NCAA players against the NHL index.
+
+    Parameters
+    -----------------------
+    ncaa_players: iterable of tuples
+        (ncaa_player_id, name, season) for each NCAA row.
+
+    index: dict
+        The index from build_index.
+
+    Returns
+    -----------------------
+    links: list of tuples
+        (ncaa_player_id, nhl_player_id, score, method) for each NCAA player that was matched.
+    """
+    links = []
+    for ncaa_player_id, name, season in ncaa_players:
+        match = match_player(name, season, index)
+        if match:
+            links.append((ncaa_player_id, *match))
+    return links
+
+def evaluate(links, truth):
+    """
+    Measures links against known answers.
+
+    Parameters
+    -----------------------
+    links: list of tuples
+        (ncaa_player_id, nhl_player_id, ...) from resolve.
+
+    truth: dict
+        Maps ncaa_player_id to the right nhl_player_id for every NCAA player who made the NHL.
+
+    Returns
+    -----------------------
+    Tuple (precision, recall):
+        Share of links that are right, and share of true pairs that were found.
+    """
+    correct = sum(1 for link in links if truth.get(link[0]) == link[1])
+    precision = correct / len(links) if links else 1.0
+    recall = correct / len(truth) if truth else 1.0
+    return precision, recall
+
+def load_nhl_players(cur, season_ids, game_type="2"):
+    """
+    Reads every NHL player from the given season databases with the first season each one shows up in.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        A cursor on any database connection.
+
+    season_ids: list
+        Season IDs whose Players tables are read. Seasons without a database file are skipped.
+
+    game_type: str
+        "2" for the regular season, "3" for playoffs.
+
+    Returns
+    -----------------------
+    rows: list of tuples
+        (player_id, name, season) rows for build_index.
+    """
+    rows = []
+    for season in season_ids:
+        for player_id, name in seasons.query_seasons(cur, "SELECT player_id, name FROM {schema}.Players", (), [season], game_type):
+            rows.append((player_id, name, season))
+    return rows
+
+def link_players(cur, conn, season=seasons.CURRENT_SEASON, last_season=seasons.CURRENT_SEASON):
+    """
+    Links the NCAA players in the connected season database to NHL players from
+    that season through last_season, and replaces the season's Player_Links rows.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        Cursor on the NCAA season's database.
+
+    conn: Connection
+        The database connection object.
+
+    season: str
+        Season ID of the connected database.
+
+    last_season: str
+        Last NHL season to look for the players in.
+
+    Returns
+    -----------------------
+    links: list of tuples
+        (ncaa_player_id, nhl_player_id, score, method) for each linked player.
+    """
+    start = time.perf_counter()
+    index = build_index(load_nhl_players(cur, seasons.season_range(season, last_season)))
+    cur.execute("SELECT player_id, name FROM NCAA_Players")
+    ncaa_players = [(player_id, name, season) for player_id, name in cur.fetchall()]
+    links = resolve(ncaa_players, index)
+    with conn:
+        cur.execute("DELETE FROM Player_Links")
+        cur.executemany("INSERT INTO Player_Links (ncaa_player_id, nhl_player_id, score, method) VALUES (?, ?, ?, ?)", links)
+    methods = Counter(link[3] for link in links)
+    print(f"Linked {len(links)} of {len(ncaa_players)} NCAA players to {len(index['players'])} NHL players "
+          f"in {time.perf_counter() - start:.2f}s ({', '.join(f'{count} {method}' for method, count in methods.items()) or 'none'})")
+    return links
@@ -0,0 +1,76 @@
+# Per-player rates kept in a {table}_Metrics table next to Players and
+# NCAA_Players (schema migration 9), so threshold queries and histograms read
+# stored values instead of dividing in Python on every call. Migration 9 fills
+# the tables. Afterwards triggers put the player_id of every inserted, changed
+# or deleted row in NCAA_Players_Metrics_Dirty or Players_Pending, and the bulk
+# loaders pass those tables to refresh_metrics: for NCAA_Players in the same
+# transaction as the rows, for Players once per ingest. Readers never write to them.
+#
+# A rate whose divisor is 0 (no penalty minutes, no games, no ice time) is NULL.
+# NCAA_Players has no ice time, so its per-60 rates are always NULL.
+
+METRIC_COLUMNS = ("player_id", "games", "points", "penalty_min", "pts_per_pim", "points_per_game", "goals_per_game",
+                  "penalties_per_game", "points_per_60", "goals_per_60", "penalties_per_60")
+
+# Tables with metrics, and their ice time per game column in seconds if they have one
+SOURCES = {"Players": "avg_icetime", "NCAA_Players": None}
+
+def metrics_query(table):
+    """
+    Builds the SELECT that works out every column of METRIC_COLUMNS from a player table.
+
+    Parameters
+    -----------------------
+    table: str
+        "Players" or "NCAA_Players".
+
+    Returns
+    -----------------------
+    String:
+        A SELECT over {table} with no WHERE clause, its columns in METRIC_COLUMNS order.
+    """
+    games, points, penalty_min, goals = (f"COALESCE({column}, 0)" for column in ("games", "points", "penalty_min", "goals"))
+    ice_time = SOURCES[table]
+    ice_hours = f"({games} * COALESCE({ice_time}, 0) / 3600.0)" if ice_time else "0"
+
+    def rate(numerator, denominator):
+        return f"CASE WHEN {denominator} > 0 THEN CAST({numerator} AS REAL) / {denominator} END"
+
+    return (f"SELECT player_id, {games}, {points}, {penalty_min}, {rate(points, penalty_min)}, "
+            f"{rate(points, games)}, {rate(goals, games)}, {rate(penalty_min, games)}, "
+            f"{rate(points, ice_hours)}, {rate(goals, ice_hours)}, {rate(penalty_min, ice_hours)} FROM {table}")
+
+def refresh_metrics(cur, table, marks):
+    """
+    Recomputes the {table}_Metrics rows of the players listed in another table
+    with one statement. The marks are left in place for the caller to clear.
+    Does not commit so it shares the caller's transaction.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    table: str
+        "Players" or "NCAA_Players".
+
+    marks: str
+        Table whose player_id column lists the players to recompute, like
+        NCAA_Players_Metrics_Dirty. Passing table itself recomputes everyone.
+
+    Returns
+    -----------------------
+    Int:
+        Number of distinct players listed in marks.
+    """
+    cur.execute(f"SELECT COUNT(DISTINCT player_id) FROM {marks}")
+    marked = cur.fetchone()[0]
+    if not marked:
+        return 0
+
+    # Players that were deleted only have their mark left
+    cur.execute(f"DELETE FROM {table}_Metrics WHERE player_id IN (SELECT player_id FROM {marks}) "
+                f"AND player_id NOT IN (SELECT player_id FROM {table})")
+    cur.execute(f"INSERT OR REPLACE INTO {table}_Metrics ({', '.join(METRIC_COLUMNS)}) "
+                f"{metrics_query(table)} WHERE player_id IN (SELECT player_id FROM {marks})")
+    return marked
@@ -2,52 +2,310 @@
 import requests
 import sqlite3
 import os
+import json
+import time
+import heapq
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby, islice
+from operator import itemgetter
+from datetime import datetime, timedelta, timezone
 import PIM
+import rate_limit
+import bulk_loader
+import seasons
+import schema
 #import unittest
 from nhlpy.api.query.builder import QueryBuilder, QueryContext
-from nhlpy.nhl_client import NHLClient
 #from nhlpy.api.query.filters.draft import DraftQuery
 from nhlpy.api.query.filters.season import SeasonQuery
 from nhlpy.api.query.filters.game_type import GameTypeQuery
 #from nhlpy.api.query.filters.position import PositionQuery, PositionTypes
 
-def get_player_data():
+STATS_URL = "https://api.nhle.com/stats/rest/en/skater/"
+SEASON = seasons.CURRENT_SEASON
+PAGE_SIZE = 100
+
+# Pages of a report requested at the same time once the total row count is known
+PAGE_WORKERS = 8
+
+# Ingest_Checkpoint source name for the skater summary report
+SKATER_SOURCE = "nhl_skaters"
+# and for the penalties, realtime and timeonice reports
+REPORTS_SOURCE = "nhl_skater_reports"
+
+# A finished ingest is not downloaded again until it is this old
+REFRESH_HOURS = 6
+
+# Same default sort the nhlpy wrapper sends for the summary report
+SUMMARY_SORT = [
+    {"property": "points", "direction": "DESC"},
+    {"property": "gamesPlayed", "direction": "ASC"},
+    {"property": "playerId", "direction": "ASC"},
+]
+
+# Sort for ingests. Points change every game night, so with SUMMARY_SORT a
+# player can move across a page boundary between an interrupted run and its
+# resume and be skipped. New players get new, higher ids, so they land after
+# the saved offset.
+INGEST_SORT = [{"property": "playerId", "direction": "ASC"}]
+
+def get_stats_page(query_context, report_type="summary", start=0, limit=100, sort=SUMMARY_SORT):
+    """
+    Requests one page of skater stats from the NHL stats API.
+    Builds the same request as NHLClient.stats.skater_stats_with_query_context
+    but sends it at stats priority through the shared rate_limit scheduler.
+
+    Parameters
+    -----------------------
+    query_context: QueryContext
+        The filters built by nhlpy's QueryBuilder.
+
+    report_type: str
+        The stats report to request, like "summary".
+
+    start: int
+        Index of the first row to return.
+
+    limit: int
+        Maximum number of rows to return.
+
+    sort: list
+        Sort expression sent to the API.
+
+    Returns
+    -----------------------
+    Dictionary {'data': [...], 'total': int}:
+        The page of player rows and the total number of rows for the query.
+    """
+    params = {
+        "isAggregate": "false",
+        "isGame": "false",
+        "start": start,
+        "limit": limit,
+        "factCayenneExp": query_context.fact_query,
+        "sort": json.dumps(sort),
+        "cayenneExp": query_context.query_str,
+    }
+    response = rate_limit.get_scheduler().request(STATS_URL + report_type, "stats", params=params)
+    response.raise_for_status()
+    return response.json()
+
+def iter_report_pages(query_context, report_type="summary", start=0, workers=PAGE_WORKERS, sort=SUMMARY_SORT):
     """
-    Gets a dictionary containing all player stats from the 23/24 season from the NHL API.
-    Goes through a wrapper from https://github.com/coreyjs/nhl-api-py
+    Yields the pages of a stats report in order as they arrive. The first page
+    also tells us the total row count, so the next pages are requested ahead by
+    a thread pool, at most two per worker, while earlier ones are being used.
 
     Parameters
     -----------------------
-    none
+    query_context: QueryContext
+        The filters built by nhlpy's QueryBuilder.
+
+    report_type: str
+        The stats report to request, like "summary".
+
+    start: int
+        Row offset to start from.
+
+    workers: int
+        Number of pages requested at the same time. 1 requests them one by one.
+
+    sort: list
+        Sort expression sent to the API.
+
+    Yields
+    -----------------------
+    Tuple (offset, rows):
+        The row offset of the page and its rows, in the API's order.
+    """
+    began = time.perf_counter()
+    pages = 1
+    first = get_stats_page(query_context, report_type, start, PAGE_SIZE, sort)
+    total = first.get("total")
+    if total is None:
+        # No row count to plan with, keep asking until a short page comes back
+        yield start, first["data"]
+        rows, offset = first["data"], start + PAGE_SIZE
+        while len(rows) == PAGE_SIZE:
+            rows = get_stats_page(query_context, report_type, offset, PAGE_SIZE, sort)["data"]
+            pages += 1
+            if rows:
+                yield offset, rows
+            offset += PAGE_SIZE
+    else:
+        offsets = iter(range(start + PAGE_SIZE, total, PAGE_SIZE))
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            def request(offset):
+                return offset, pool.submit(get_stats_page, query_context, report_type, offset, PAGE_SIZE, sort)
+
+            ahead = deque(request(offset) for offset in islice(offsets, max(1, workers) * 2))
+            yield start, first["data"]
+            while ahead:
+                offset, future = ahead.popleft()
+                rows = future.result()["data"]
+                pages += 1
+                following = next(offsets, None)
+                if following is not None:
+                    ahead.append(request(following))
+                yield offset, rows
+    elapsed = time.perf_counter() - began
+    print(f"Fetched {pages} {report_type} pages in {elapsed:.2f}s ({pages / elapsed:.1f} pages/s).")
+
+def get_report_pages(query_context, report_type="summary", start=0, workers=PAGE_WORKERS, sort=SUMMARY_SORT):
+    """
+    Gets every row of a stats report in one list, see iter_report_pages.
 
     Returns
     -----------------------
-    Dictionary {'data':[{player_id, name, games, points, penalty_min, avg_icetime, goals, assists, plus_minus, shooting_perc}]}:
-        A dictionary containing a list of players and their stats for the season.
+    rows: list
+        The report rows from start to the end, in the API's order.
+    """
+    return [row for _, rows in iter_report_pages(query_context, report_type, start, workers, sort) for row in rows]
+
+def get_player_data(start=0, workers=PAGE_WORKERS, season=SEASON, game_type="2"):
+    """
+    Streams all player stats for a season from the NHL API, 23/24 by default, one page at a time.
+    Builds the query with the wrapper from https://github.com/coreyjs/nhl-api-py
+    Rows are sorted by playerId so the offsets stay put while a season is in
+    progress and an ingest can resume at a saved offset.
+
+    Parameters
+    -----------------------
+    start: int
+        Row offset to start from, used to resume an interrupted ingest.
+
+    workers: int
+        Number of pages requested at the same time.
+
+    season: str
+        Season ID, like "20232024".
+
+    game_type: str
+        "2" for the regular season, "3" for playoffs.
+
+    Yields
+    -----------------------
+    Tuple (offset, [{playerId, skaterFullName, teamAbbrevs, gamesPlayed, points, penaltyMinutes, ...}]):
+        The row offset of each page and its player dictionaries.
+    """
+    return iter_report_pages(build_query_context(season, game_type), "summary", start, workers, INGEST_SORT)
+
+def build_query_context(season=SEASON, game_type="2"):
+    """
+    Builds the nhlpy query for one season and game type.
+
+    Parameters
+    -----------------------
+    season: str
+        Season ID, like "20232024".
+
+    game_type: str
+        "2" for the regular season, "3" for playoffs.
+
+    Returns
+    -----------------------
+    QueryContext:
+        The filters for get_stats_page.
     """
-    client = NHLClient(verbose=True)
     filters = [
-        GameTypeQuery(game_type="2"),
-        SeasonQuery(season_start="20232024", season_end="20232024")
+        GameTypeQuery(game_type=game_type),
+        SeasonQuery(season_start=season, season_end=season)
     ]
     query_builder = QueryBuilder()
     query_context: QueryContext = query_builder.build(filters=filters)
-    start = 0
-    limit = 100
-    skater_stats = {"data": []}
-    while True:
-        response = client.stats.skater_stats_with_query_context(
-            report_type="summary",
-            query_context=query_context,
-            aggregate=False,
-            start=start,
-            limit=limit,
-        )
-        if not response["data"]:
-            break
-        skater_stats["data"].extend(response["data"])
-        start += limit
-    return skater_stats
+    return query_context
+
+def iter_merged_reports(query_context, report_types=tuple(bulk_loader.REPORT_TABLES), workers=PAGE_WORKERS, batch_size=PAGE_SIZE):
+    """
+    Streams several skater reports at once and joins them on playerId in one pass.
+    Every report is requested sorted by playerId with its own pages fetched
+    ahead, so the streams can be merged like sorted lists without holding any
+    report in memory.
+
+    Parameters
+    -----------------------
+    query_context: QueryContext
+        The filters from build_query_context.
+
+    report_types: tuple
+        Report types to join, like "penalties".
+
+    workers: int
+        Pages of each report requested at the same time.
+
+    batch_size: int
+        Players per yielded batch.
+
+    Yields
+    -----------------------
+    batch: list of tuples
+        (player_id, {report type: API row}) for up to batch_size players, in playerId order.
+    """
+    def report_rows(report_type):
+        for _, rows in iter_report_pages(query_context, report_type, 0, workers, INGEST_SORT):
+            for row in rows:
+                yield row["playerId"], report_type, row
+
+    streams = [report_rows(report_type) for report_type in report_types]
+    batch = []
+    for player_id, group in groupby(heapq.merge(*streams, key=itemgetter(0)), key=itemgetter(0)):
+        batch.append((player_id, {report_type: row for _, report_type, row in group}))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def ingest_reports(cur, conn, refresh_hours=REFRESH_HOURS, season=SEASON, game_type="2",
+                   report_types=tuple(bulk_loader.REPORT_TABLES), workers=PAGE_WORKERS):
+    """
+    Loads the penalties, realtime and timeonice reports of a season into their
+    tables, one transaction per batch of players. Skipped if a complete load is
+    newer than refresh_hours. An interrupted load starts over, every write is an upsert.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    conn: Connection
+        The database connection object for the season's database.
+
+    refresh_hours: float
+        How old a complete load can get before the reports are downloaded again.
+
+    season: str
+        Season ID, like "20232024".
+
+    game_type: str
+        "2" for the regular season, "3" for playoffs.
+
+    report_types: tuple
+        Keys of bulk_loader.REPORT_TABLES to load.
+
+    workers: int
+        Pages of each report requested at the same time.
+
+    Returns
+    -----------------------
+    Int:
+        Number of players with report rows stored.
+    """
+    schema.migrate(cur, conn)
+    checkpoint = bulk_loader.get_checkpoint(cur, REPORTS_SOURCE, season)
+    if checkpoint and checkpoint[1] and datetime.now(timezone.utc) - checkpoint[2] < timedelta(hours=refresh_hours):
+        print(f"Skater reports for {season} are up to date (fetched {checkpoint[2]:%Y-%m-%d %H:%M} UTC).")
+        return 0
+    stored = 0
+    for batch in iter_merged_reports(build_query_context(season, game_type), report_types, workers):
+        stored += len(batch)
+        bulk_loader.bulk_insert_reports(bulk_loader.stage_report_rows(batch, report_types), cur, conn,
+                                        checkpoint=(REPORTS_SOURCE, season, stored, False))
+    with conn:
+        bulk_loader.save_checkpoint(cur, REPORTS_SOURCE, season, stored, True)
+    print(f"{', '.join(report_types)} reports stored for {stored} players in {season}.")
+    return stored
 
 def set_up_database(db_name):
     """
@@ -68,15 +326,19 @@ def set_up_database(db_name):
     cur = conn.cursor()
     return cur, conn
 
-def set_up_player_table(data, cur, conn):
+def set_up_player_table(pages, cur, conn, season=SEASON):
     """
     Sets up the Players table in the database using the provided NHL Player data.
-    Calls the add_salary function to get salary data and add it to the DB from the Puckpedia api.
+    Only new players and players whose stats changed are written. Each page is
+    committed as soon as it arrives through bulk_loader, together with an
+    Ingest_Checkpoint row holding the offset after it, so an interrupted load
+    resumes at the first page that was not stored. Player_Teams, Team_Summary
+    and the metrics are refreshed once, after the last page.
 
     Parameters
     -----------------------
-    data: dictionary
-        dictionary of Player data in JSON format.
+    pages: iterable of tuples
+        (offset, players) pages of player dictionaries, like get_player_data yields.
 
     cur: Cursor
         The database cursor object.
@@ -84,38 +346,222 @@ def set_up_player_table(data, cur, conn):
     conn: Connection
         The database connection object.
 
+    season: str
+        Season ID the data is for, used as the checkpoint key.
+
+    Returns
+    -----------------------
+    Int:
+        Number of players inserted or updated.
+    """
+    schema.migrate(cur, conn)
+
+    # Reuse the stored team IDs so a later run maps abbreviations the same way
+    cur.execute("SELECT name, team_id FROM NHL_Teams")
+    team_dict = dict(cur.fetchall())
+
+    written = 0
+    end = None
+    for offset, players in pages:
+        rows = bulk_loader.stage_players(players, team_dict)
+        changed = bulk_loader.changed_player_rows(rows, cur)
+        end = offset + len(rows)
+        bulk_loader.bulk_insert_players(changed, team_dict, cur, conn, upsert=True,
+                                        checkpoint=(SKATER_SOURCE, season, end, False))
+        written += len(changed)
+    # Only reached once the last page is stored. Players left pending by an
+    # interrupted run are caught up here too.
+    with conn:
+        bulk_loader.refresh_players(cur)
+        if end is not None:
+            bulk_loader.save_checkpoint(cur, SKATER_SOURCE, season, end, True)
+    return written
+
+def ingest_players(cur, conn, refresh_hours=REFRESH_HOURS, season=SEASON, game_type="2"):
+    """
+    Loads a season's players into the Players table in a single pass.
+    Resumes from the saved checkpoint if the last ingest was interrupted and skips
+    the download entirely if a complete ingest is newer than refresh_hours.
+    For the current season, calls the add_salary function to get salary data and add it to the DB from the Puckpedia api.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    conn: Connection
+        The database connection object for the season's database.
+
+    refresh_hours: float
+        How old a complete ingest can get before the players are downloaded again.
+
+    season: str
+        Season ID, like "20232024".
+
+    game_type: str
+        "2" for the regular season, "3" for playoffs.
+
     Returns
     -----------------------
-    None
-    """
-    team_dict = {}
-    cur.execute(
-            "CREATE TABLE IF NOT EXISTS Players (player_id INTEGER PRIMARY KEY, name TEXT, team_id INTEGER, salary INTEGER, games INTEGER, points INTEGER, penalty_min INTEGER, avg_icetime INTEGER, goals INTEGER, assists INTEGER, plus_minus INTEGER, shooting_perc FLOAT)"
-    )
-    cur.execute(
-            "CREATE TABLE IF NOT EXISTS NHL_Teams (team_id INTEGER PRIMARY KEY, name TEXT)"
-    )
-
-    cur.execute(
-            "SELECT player_id FROM Players"
-    )
-    playerLen = len(cur.fetchall())
-    if playerLen < 100:
-        data['data'] = data['data'][playerLen:playerLen+25]
-
-    for player in data['data']:
-        if player['teamAbbrevs'] not in team_dict.keys():
-            team_dict[player['teamAbbrevs']] = len(team_dict)
-        cur.execute(
-            "INSERT OR IGNORE INTO Players (player_id, name, team_id, games, points, penalty_min, avg_icetime, goals, assists, plus_minus, shooting_perc) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", 
-            (player['playerId'],player['skaterFullName'], team_dict[player['teamAbbrevs']], player['gamesPlayed'],player['points'],player['penaltyMinutes'],player['timeOnIcePerGame'],player['goals'],player['assists'],player['plusMinus'],player['shootingPct'])
-        )
-    for name, id in team_dict.items():
-        cur.execute(
-                "INSERT OR IGNORE INTO NHL_Teams (team_id, name) VALUES (?, ?)", (id, name)
-            )
-    conn.commit()
-    add_salary(cur,conn)
+    Int:
+        Number of players inserted or updated.
+    """
+    schema.migrate(cur, conn)
+    checkpoint = bulk_loader.get_checkpoint(cur, SKATER_SOURCE, season)
+    start = 0
+    if checkpoint:
+        last_offset, complete, fetched_at = checkpoint
+        if complete and datetime.now(timezone.utc) - fetched_at < timedelta(hours=refresh_hours):
+            print(f"Players for {season} are up to date (fetched {fetched_at:%Y-%m-%d %H:%M} UTC).")
+            return 0
+        if not complete:
+            start = last_offset
+            print(f"Resuming player ingest for {season} at row {start}.")
+    written = set_up_player_table(get_player_data(start, season=season, game_type=game_type), cur, conn, season)
+    print(f"{written} new or changed players stored for {season}.")
+    # Puckpedia only has current cap hits, so older seasons keep no salary
+    if season == SEASON and game_type == "2":
+        add_salary(cur,conn)
+    return written
+
+def ingest_season(season, game_type="2", refresh_hours=REFRESH_HOURS, scheduler=None):
+    """
+    Loads one season and game type into its own database file, with the
+    penalties, realtime and timeonice reports. Regular seasons also get the NCAA
+    players for that season scraped into the same file.
+
+    Parameters
+    -----------------------
+    season: str
+        Season ID, like "20232024".
+
+    game_type: str
+        "2" for the regular season, "3" for playoffs.
+
+    refresh_hours: float
+        How old a complete ingest can get before the players are downloaded again.
+
+    scheduler: RequestScheduler
+        rate_limit scheduler for the NCAA pages. None uses the shared one.
+
+    Returns
+    -----------------------
+    Int:
+        Number of NHL players inserted or updated.
+    """
+    cur, conn = set_up_database(seasons.season_db_name(season, game_type))
+    try:
+        written = ingest_players(cur, conn, refresh_hours, season, game_type)
+        ingest_reports(cur, conn, refresh_hours, season, game_type)
+        if game_type == "2":
+            PIM.get_college_players(cur, conn, season=season, scheduler=scheduler)
+        return written
+    finally:
+        conn.close()
+
+def ingest_seasons(first_season=SEASON, last_season=SEASON, game_types=("2",), workers=4, refresh_hours=REFRESH_HOURS):
+    """
+    Loads a range of seasons and game types in parallel, one database file each.
+
+    Parameters
+    -----------------------
+    first_season: str
+        First season ID, like "20142015".
+
+    last_season: str
+        Last season ID, like "20232024".
+
+    game_types: tuple
+        Game types to load, "2" for the regular season and "3" for playoffs.
+
+    workers: int
+        Number of seasons loaded at the same time.
+
+    refresh_hours: float
+        How old a complete ingest can get before the players are downloaded again.
+
+    Returns
+    -----------------------
+    results: dict
+        Maps (season, game_type) to the number of NHL players written.
+    """
+    jobs = [(season, game_type) for season in seasons.season_range(first_season, last_season) for game_type in game_types]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {job: pool.submit(ingest_season, job[0], job[1], refresh_hours) for job in jobs}
+        results = {job: future.result() for job, future in futures.items()}
+    # Requests that were still throttled or failing after every retry
+    rate_limit.get_scheduler().report()
+    return results
+
+# Contract groups in a Puckpedia record, each a list of contracts. Only "current"
+# has been relied on so far, the others are stored when the feed has them
+CONTRACT_GROUPS = ("past", "current", "future")
+
+def salary_rows(records, player_ids, fetched_at=None):
+    """
+    Joins Puckpedia records to the players in the database and reads out the
+    current cap hits and every listed contract.
+
+    Parameters
+    -----------------------
+    records: list
+        The "data" list of the Puckpedia response.
+
+    player_ids: set
+        player_id of every row in Players.
+
+    fetched_at: str
+        Timestamp stored with the contracts. None uses the current UTC time.
+
+    Returns
+    -----------------------
+    Tuple (salaries, contracts, failures, unknown):
+        salaries is a list of (cap_hit, player_id) for bulk_loader.bulk_update_salaries,
+        contracts a list of (player_id, status, position, cap_hit, details, fetched_at) rows for the
+        Contracts table, failures a list of (record, reason) for records that could not
+        be read, where record is the nhl_id or the record's position in the feed, and
+        unknown the number of records for players not in the Players table.
+    """
+    fetched_at = fetched_at or datetime.now(timezone.utc).isoformat()
+    # Keyed on player_id so a player listed twice keeps the last record, like the UPDATEs used to
+    by_player = {}
+    failures = []
+    unknown = 0
+    for position, record in enumerate(records):
+        nhl_id = record.get('nhl_id')
+        if not nhl_id:
+            failures.append((position, "no nhl_id"))
+            continue
+        try:
+            player_id = int(nhl_id)
+        except (TypeError, ValueError):
+            failures.append((position, f"nhl_id {nhl_id!r} is not a number"))
+            continue
+        if player_id not in player_ids:
+            unknown += 1
+            continue
+        by_player[player_id] = record
+
+    salaries, contracts = [], []
+    for player_id, record in by_player.items():
+        for status in CONTRACT_GROUPS:
+            for number, contract in enumerate(record.get(status) or []):
+                cap_hit = contract.get('current_season_cap_hit', contract.get('cap_hit'))
+                try:
+                    cap_hit = int(cap_hit) if cap_hit not in (None, "") else None
+                except (TypeError, ValueError):
+                    cap_hit = None
+                contracts.append((player_id, status, number, cap_hit, json.dumps(contract), fetched_at))
+        current = record.get('current') or []
+        if not current:
+            failures.append((player_id, "no current contract"))
+            continue
+        cap_hit = current[0].get('current_season_cap_hit')
+        try:
+            salaries.append((int(cap_hit), player_id))
+        except (TypeError, ValueError):
+            failures.append((player_id, f"current_season_cap_hit {cap_hit!r} is not a number"))
+    return salaries, contracts, failures, unknown
 
 def add_salary(cur, conn):
     """
@@ -131,34 +577,29 @@ def add_salary(cur, conn):
 
     Returns
     -----------------------
-    Nothing
+    failures: list of tuples
+        (record, reason) for each Puckpedia record that could not be read,
+        or None if the request failed.
     """
     with open("puckAPI.txt", "r") as file:
         apikey = file.read()  # Reads the entire file
-    response = requests.get(apikey)
-    if response.status_code == 200:
-        # Parse the JSON response into a Python dict
-        data = response.json()
-
-        cur.execute(
-            "SELECT player_id FROM Players"
-        )
-        players = cur.fetchall()
-        players = [x[0] for x in players]
-
-        for player in data["data"]:
-            if player['nhl_id'] and int(player['nhl_id']) in players:
-                try:
-                    cur.execute(
-                        "UPDATE Players SET salary = ? WHERE player_id = ?", 
-                        (int(player['current'][0]['current_season_cap_hit']),
-                         int(player['nhl_id']))
-                    )
-                except:
-                    print("Failed to get contract data")
-        conn.commit()
-    else:
+    response = rate_limit.get_scheduler().request(apikey.strip(), "salary")
+    if response.status_code != 200:
         print(f"Request failed with status code {response.status_code}")
+        return None
+    # Parse the JSON response into a Python dict
+    data = response.json()
+
+    cur.execute("SELECT player_id FROM Players")
+    player_ids = {row[0] for row in cur.fetchall()}
+    salaries, contracts, failures, unknown = salary_rows(data["data"], player_ids)
+    bulk_loader.bulk_update_salaries(salaries, cur, conn, contracts)
+
+    print(f"Salaries set for {len(salaries)} players, {len(contracts)} contracts stored, "
+          f"{unknown} records for players not in this season, {len(failures)} failed")
+    for record, reason in failures:
+        print(f"Failed to get contract data for {record}: {reason}")
+    return failures
 
 def testpd():
     """Just a test function
@@ -171,7 +612,6 @@ def testpd():
     -----------------------
     Nothing
     """
-    client = NHLClient(verbose=True)
     filters = [
         GameTypeQuery(game_type="2"),
         SeasonQuery(season_start="20232024", season_end="20232024")
@@ -181,13 +621,7 @@ def testpd():
     start = 0
     limit = 1
     skater_stats = {"data": []}
-    response = client.stats.skater_stats_with_query_context(
-        report_type="summary",
-        query_context=query_context,
-        aggregate=False,
-        start=start,
-        limit=limit,
-    )
+    response = get_stats_page(query_context, "summary", start, limit)
     skater_stats["data"].extend(response["data"])
     start += limit
     print(skater_stats["data"])
@@ -195,7 +629,8 @@ def testpd():
 
 def get_data():
     """
-    Calls the set_up_player_table function and the PIM.get_college_players function.
+    Calls the ingest_season function for the current season, which loads NHL
+    players and the PIM.get_college_players scrape into the season's database.
 
     Parameters
     -----------------------
@@ -205,9 +640,8 @@ def get_data():
     -----------------------
     Nothing
     """
-    set_up_player_table(get_player_data(), *set_up_database('players2324.db'))
+    ingest_season(SEASON)
     #print(get_player_data())
-    PIM.get_college_players(*set_up_database('players2324.db'))
     #testpd()
 
 #def main():
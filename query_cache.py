@@ -0,0 +1,319 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+import columnar
+import schema
+import seasons
+
+# Cache for the analysis queries in Penalty_vs_Points_Graph, so running them
+# again with thresholds already seen skips SQLite and the column decoding.
+# Results are keyed on the SQL text, the parameters, the requested columns and
+# the generation of every database read (schema.get_generation), which
+# bulk_loader bumps in each write transaction. Once data is loaded the old
+# entries are never matched again and age out of the LRU.
+#
+# Entries live in memory and, if a directory is given, also as pickle files so
+# another process can reuse them. In-memory databases and ones without
+# DB_Generation are never cached.
+
+MAX_ENTRIES = 256
+
+class QueryCache:
+    """
+    LRU cache of query results decoded into NumPy columns.
+
+    Parameters
+    -----------------------
+    max_entries: int
+        Number of results kept in memory before the least recently used one is dropped.
+
+    directory: str
+        Optional folder for pickled results shared between runs. None keeps the cache in memory only.
+
+    max_files: int
+        Number of pickle files kept in directory before the least recently used ones are deleted.
+    """
+    def __init__(self, max_entries=MAX_ENTRIES, directory=None, max_files=4 * MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_files = max_files
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "uncached": 0, "evicted": 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, query, params, columns, generation):
+        """
+        Builds the cache key for a query.
+
+        Parameters
+        -----------------------
+        query: str
+            The SQL text.
+
+        params: tuple
+            Parameters for the query.
+
+        columns: list of tuples
+            (name, dtype) pairs the rows are decoded into.
+
+        generation: tuple
+            Generation of every database the query reads.
+
+        Returns
+        -----------------------
+        String:
+            A sha256 hex digest of everything above.
+        """
+        spec = [(name, str(dtype)) for name, dtype in columns]
+        blob = json.dumps([query, list(params), spec, list(generation)], default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Looks a result up in memory, then on disk.
+
+        Parameters
+        -----------------------
+        key: str
+            Key from QueryCache.key.
+
+        Returns
+        -----------------------
+        Dictionary {name: ndarray}:
+            The cached columns, or None on a miss.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._entries[key]
+        result = self._read_file(key)
+        if result is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["disk_hits"] += 1
+        self._remember(key, result)
+        return result
+
+    def put(self, key, result):
+        """
+        Stores a result. Its arrays are made read-only because every caller gets the same objects.
+
+        Parameters
+        -----------------------
+        key: str
+            Key from QueryCache.key.
+
+        result: dict
+            Columns from columnar.to_columns.
+
+        Returns
+        -----------------------
+        None
+        """
+        for array in result.values():
+            array.flags.writeable = False
+        self._remember(key, result)
+        if self.directory:
+            self._write_file(key, result)
+
+    def clear(self):
+        """
+        Drops every cached result, in memory and on disk.
+
+        Parameters
+        -----------------------
+        None
+
+        Returns
+        -----------------------
+        None
+        """
+        with self._lock:
+            self._entries.clear()
+        for path in self._files():
+            os.remove(path)
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pickle")
+
+    def _read_file(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                result = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        os.utime(self._path(key))
+        for array in result.values():
+            array.flags.writeable = False
+        return result
+
+    def _write_file(self, key, result):
+        os.makedirs(self.directory, exist_ok=True)
+        # Written under a temporary name first so readers never see half a file
+        temp = self._path(key) + f".{os.getpid()}.tmp"
+        with open(temp, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, self._path(key))
+        files = sorted(self._files(), key=os.path.getmtime)
+        for path in files[:max(0, len(files) - self.max_files)]:
+            os.remove(path)
+            self.stats["evicted"] += 1
+
+    def _files(self):
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".pickle")]
+
+# Shared cache used by fetch_columns. Set QUERY_CACHE_DIR to also keep results on disk.
+cache = QueryCache(directory=os.environ.get("QUERY_CACHE_DIR"))
+
+def configure(max_entries=MAX_ENTRIES, directory=None, enabled=True):
+    """
+    Replaces the shared query cache.
+
+    Parameters
+    -----------------------
+    max_entries: int
+        Number of results kept in memory.
+
+    directory: str
+        Optional folder for pickled results shared between runs.
+
+    enabled: bool
+        False turns caching off so every call runs its query.
+
+    Returns
+    -----------------------
+    QueryCache:
+        The new shared cache, or None if caching is disabled.
+    """
+    global cache
+    cache = QueryCache(max_entries, directory) if enabled else None
+    return cache
+
+def season_generations(season_ids, game_type="2"):
+    """
+    Reads the generation of each season database that exists.
+
+    Parameters
+    -----------------------
+    season_ids: list
+        Season IDs, like "20232024".
+
+    game_type: str
+        "2" for the regular season, "3" for playoffs.
+
+    Returns
+    -----------------------
+    Tuple:
+        (season, generation) pairs, or None if any of the databases has no generation yet.
+    """
+    generations = []
+    for season in season_ids:
+        path = seasons.season_db_path(season, game_type)
+        if not os.path.exists(path):
+            continue
+        conn = sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True)
+        try:
+            generation = schema.get_generation(conn.cursor())
+        finally:
+            conn.close()
+        if generation is None:
+            return None
+        generations.append((season, generation))
+    return tuple(generations)
+
+def main_generation(cur):
+    """
+    Reads the file path and generation of the main database.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    Returns
+    -----------------------
+    Tuple:
+        ("main", path, generation), or None for an in-memory database or one with no generation yet.
+    """
+    cur.execute("PRAGMA database_list")
+    path = next((file for _, name, file in cur.fetchall() if name == "main"), "")
+    generation = schema.get_generation(cur)
+    if not path or generation is None:
+        return None
+    return ("main", os.path.realpath(path), generation)
+
+def fetch_columns(cur, query, params, columns, season_ids=None, game_type="2"):
+    """
+    Runs a {schema} query like seasons.query_seasons does, or against the main
+    database if season_ids is None, and decodes the rows with columnar.to_columns.
+    The result comes from the shared cache when none of the databases changed
+    since the same call was last made.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    query: str
+        SELECT statement with a {schema} placeholder.
+
+    params: tuple
+        Parameters for the query.
+
+    columns: list of tuples
+        (name, dtype) pairs for columnar.to_columns.
+
+    season_ids: list
+        Optional season IDs to read from their own database files.
+
+    game_type: str
+        "2" for the regular season, "3" for playoffs. Used with season_ids.
+
+    Returns
+    -----------------------
+    Dictionary {name: ndarray}:
+        One array per column. Cached arrays are read-only.
+    """
+    def run():
+        if season_ids:
+            rows = seasons.query_seasons(cur, query, params, season_ids, game_type)
+        else:
+            rows = cur.execute(query.format(schema="main"), params)
+        return columnar.to_columns(rows, columns)
+
+    if cache is None:
+        return run()
+    if season_ids:
+        generation = season_generations(season_ids, game_type)
+        if generation is not None:
+            generation = ("seasons", game_type) + generation
+    else:
+        generation = main_generation(cur)
+    if generation is None:
+        cache.stats["uncached"] += 1
+        return run()
+
+    key = cache.key(query, params, columns, generation)
+    result = cache.get(key)
+    if result is None:
+        result = run()
+        cache.put(key, result)
+    return result
@@ -0,0 +1,458 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import requests
+import fetcher
+
+# Central scheduler for requests to the NHL stats API, Puckpedia and hockeydb.
+# Every request is queued with a priority and sent by a shared pool of worker
+# threads once its host's token bucket has a token and fewer than the host's
+# concurrency limit are already open. Across hosts the queued request with the
+# best priority goes first, so salary and skater stats requests are not stuck
+# behind a long NCAA crawl. A 429 or 503 pauses the host for its Retry-After,
+# halves its rate until requests go through again and puts the request back in
+# the queue; a request that keeps failing ends up in dead_letters so it can be
+# retried later instead of being lost.
+
+# Lower numbers are sent first
+PRIORITIES = {"salary": 0, "stats": 1, "ncaa": 2}
+
+# (requests per second, burst, requests open at once) for a host or parent domain
+HOST_LIMITS = {
+    "nhle.com": (20, 8, 8),
+    "puckpedia.com": (2, 1, 1),
+    "hockeydb.com": (4, 1, 4),
+}
+DEFAULT_LIMITS = (5, 5, 4)
+
+# Statuses that mean "slow down" rather than "this request is bad"
+RETRY_STATUSES = (429, 503)
+MAX_ATTEMPTS = 4
+# Pause before the n-th retry when the server gives no Retry-After: BACKOFF * 2 ** (n - 1) seconds
+BACKOFF = 0.5
+
+def retry_after_seconds(value, now=None):
+    """
+    Reads a Retry-After header, which is either a number of seconds or an HTTP date.
+
+    Parameters
+    -----------------------
+    value: str
+        The header value.
+
+    now: float
+        Current time.time(), for HTTP dates. None uses the clock.
+
+    Returns
+    -----------------------
+    Float:
+        Seconds to wait, or None if the header is missing or can't be read.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+    return max(0.0, when - (time.time() if now is None else now))
+
+class TokenBucket:
+    """
+    Token bucket for one host: tokens come back at rate per second up to burst,
+    and each request takes one. Not thread safe, RequestScheduler holds its lock.
+
+    Parameters
+    -----------------------
+    rate: float
+        Tokens added per second.
+
+    burst: int
+        Most tokens the bucket holds, the number of requests that can go out back to back.
+    """
+    def __init__(self, rate, burst):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """
+        Seconds until a request may go out.
+
+        Parameters
+        -----------------------
+        now: float
+            Current time.monotonic().
+
+        Returns
+        -----------------------
+        Float:
+            0 if a token is available now.
+        """
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        """
+        Uses up one token. Call only when wait_time is 0.
+
+        Parameters
+        -----------------------
+        now: float
+            Current time.monotonic().
+
+        Returns
+        -----------------------
+        None
+        """
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds, now):
+        """
+        Lets no request through for the given time and empties the bucket, so
+        requests start again one at a time afterwards.
+
+        Parameters
+        -----------------------
+        seconds: float
+            How long to pause.
+
+        now: float
+            Current time.monotonic().
+
+        Returns
+        -----------------------
+        None
+        """
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0.0
+        self.updated = max(now, self.paused_until)
+
+    def slow_down(self):
+        """
+        Halves the rate after the host said it was getting too many requests,
+        down to an eighth of the configured rate.
+
+        Parameters
+        -----------------------
+        None
+
+        Returns
+        -----------------------
+        None
+        """
+        self.rate = max(self.base_rate / 8, self.rate / 2)
+
+    def speed_up(self):
+        """
+        Brings the rate back toward the configured one by a hundredth of it, after a request went through.
+
+        Parameters
+        -----------------------
+        None
+
+        Returns
+        -----------------------
+        None
+        """
+        self.rate = min(self.base_rate, self.rate + self.base_rate / 100)
+
+class RequestScheduler:
+    """
+    Sends GET requests through fetcher.fetch with per-host token buckets,
+    priorities, Retry-After handling and a dead-letter list.
+
+    Parameters
+    -----------------------
+    limits: dict
+        Maps a host or parent domain to (rate, burst, concurrency). Uses HOST_LIMITS if None.
+
+    default_limits: tuple
+        (rate, burst, concurrency) for hosts not in limits.
+
+    workers: int
+        Threads sending requests, for all hosts together.
+
+    max_attempts: int
+        Tries per request before it goes to dead_letters.
+
+    backoff: float
+        Base pause after a 429 or 503 without a Retry-After header, or a connection error.
+    """
+    def __init__(self, limits=None, default_limits=DEFAULT_LIMITS, workers=16, max_attempts=MAX_ATTEMPTS, backoff=BACKOFF):
+        self.limits = HOST_LIMITS if limits is None else limits
+        self.default_limits = default_limits
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.dead_letters = []
+        self.stats = {"sent": 0, "cached": 0, "throttled": 0, "retried": 0, "failed": 0}
+        self._condition = threading.Condition()
+        self._queues = {}
+        self._buckets = {}
+        self._open = {}
+        self._order = itertools.count()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="request")
+        self._dispatcher = None
+
+    def limits_for(self, host):
+        """
+        Looks up the (rate, burst, concurrency) limits of a host.
+
+        Parameters
+        -----------------------
+        host: str
+            The host, with or without a port.
+
+        Returns
+        -----------------------
+        Tuple (rate, burst, concurrency)
+        """
+        name = host.split(":")[0]
+        for domain, limits in self.limits.items():
+            if name == domain or name.endswith("." + domain):
+                return limits
+        return self.default_limits
+
+    def submit(self, url, priority="stats", params=None, headers=None, timeout=fetcher.DEFAULT_TIMEOUT, use_cache=True):
+        """
+        Queues a GET request.
+
+        Parameters
+        -----------------------
+        url: str
+            The URL to request.
+
+        priority: str or int
+            A key of PRIORITIES or a number, lower goes first.
+
+        params: dict
+            Optional query string parameters.
+
+        headers: dict
+            Optional extra request headers.
+
+        timeout: float
+            Seconds to wait for the server.
+
+        use_cache: bool
+            False skips the response cache. A fresh cached response is returned
+            right away without using a token.
+
+        Returns
+        -----------------------
+        Future:
+            Resolves to the requests Response, the last one if every attempt was
+            throttled. Raises the request's exception if it never got a response.
+        """
+        future = Future()
+        cache = fetcher.cache if use_cache else None
+        if cache is not None:
+            response = cache.lookup(url, params)
+            if response is not None or cache.offline:
+                # Offline mode never touches the network, so there is nothing to pace
+                future.set_result(response if response is not None else fetcher.fetch(url, params, headers, timeout))
+                with self._condition:
+                    self.stats["cached"] += 1
+                return future
+        job = {"url": url, "params": params, "headers": headers, "timeout": timeout, "use_cache": use_cache,
+               "priority": PRIORITIES.get(priority, priority), "attempts": 0, "future": future}
+        host = urlparse(url).netloc
+        with self._condition:
+            self._push(host, job, next(self._order))
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name="request-dispatcher", daemon=True)
+                self._dispatcher.start()
+            self._condition.notify()
+        return future
+
+    def request(self, url, priority="stats", params=None, headers=None, timeout=fetcher.DEFAULT_TIMEOUT, use_cache=True):
+        """
+        Queues a GET request and waits for it, see submit.
+
+        Returns
+        -----------------------
+        Response:
+            The requests Response.
+        """
+        return self.submit(url, priority, params, headers, timeout, use_cache).result()
+
+    def retry_dead_letters(self, priority=None):
+        """
+        Queues every request in dead_letters again and empties the list.
+
+        Parameters
+        -----------------------
+        priority: str or int
+            Priority for the retries. None keeps each request's own.
+
+        Returns
+        -----------------------
+        futures: list of tuples
+            (url, Future) for each request.
+        """
+        with self._condition:
+            letters, self.dead_letters = self.dead_letters, []
+        return [(letter["url"], self.submit(letter["url"], letter["priority"] if priority is None else priority,
+                                            letter["params"], letter["headers"]))
+                for letter in letters]
+
+    def _push(self, host, job, order):
+        if host not in self._buckets:
+            rate, burst, _ = self.limits_for(host)
+            self._buckets[host] = TokenBucket(rate, burst)
+            self._queues[host] = []
+            self._open[host] = 0
+        heapq.heappush(self._queues[host], (job["priority"], order, job))
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    best, wait = None, None
+                    for host, waiting in self._queues.items():
+                        if not waiting or self._open[host] >= self.limits_for(host)[2]:
+                            continue
+                        delay = self._buckets[host].wait_time(now)
+                        if delay > 0:
+                            wait = delay if wait is None else min(wait, delay)
+                        elif best is None or waiting[0][:2] < self._queues[best][0][:2]:
+                            best = host
+                    if best is not None:
+                        break
+                    # Woken early by a new request or a finished one
+                    self._condition.wait(wait)
+                _, order, job = heapq.heappop(self._queues[best])
+                self._buckets[best].take(now)
+                self._open[best] += 1
+                self.stats["sent"] += 1
+            self._pool.submit(self._send, best, job, order)
+
+    def _send(self, host, job, order):
+        try:
+            response, error = None, None
+            try:
+                response = fetcher.fetch(job["url"], job["params"], job["headers"], job["timeout"], job["use_cache"])
+            except requests.exceptions.RequestException as e:
+                error = e
+            finally:
+                # Whatever happened the connection is free again, let the dispatcher use it
+                job["attempts"] += 1
+                with self._condition:
+                    self._open[host] -= 1
+                    self._condition.notify()
+            throttled = response is not None and response.status_code in RETRY_STATUSES
+            if not throttled and error is None:
+                with self._condition:
+                    self._buckets[host].speed_up()
+                job["future"].set_result(response)
+                return
+            with self._condition:
+                pause = self.backoff * 2 ** (job["attempts"] - 1)
+                if throttled:
+                    self.stats["throttled"] += 1
+                    given = retry_after_seconds(response.headers.get("Retry-After"))
+                    pause = pause if given is None else given
+                    self._buckets[host].pause(pause, time.monotonic())
+                    self._buckets[host].slow_down()
+                if job["attempts"] < self.max_attempts:
+                    self.stats["retried"] += 1
+                    if error is not None:
+                        # A connection error says nothing about the host's rate, just wait before this one
+                        threading.Timer(pause, self._requeue, (host, job, order)).start()
+                    else:
+                        self._push(host, job, order)
+                    self._condition.notify()
+                    return
+                self.stats["failed"] += 1
+                reason = f"HTTP {response.status_code}" if throttled else f"{type(error).__name__}: {error}"
+                self.dead_letters.append({"url": job["url"], "params": job["params"], "headers": job["headers"],
+                                          "priority": job["priority"], "attempts": job["attempts"], "reason": reason})
+            if throttled:
+                job["future"].set_result(response)
+            else:
+                job["future"].set_exception(error)
+        except Exception as e:
+            # Anything else, a bug in fetch or the cache for example, is not retried
+            # but has to reach the caller instead of leaving the future pending forever
+            job["future"].set_exception(e)
+
+    def _requeue(self, host, job, order):
+        with self._condition:
+            self._push(host, job, order)
+            self._condition.notify()
+
+    def report(self):
+        """
+        Prints the request counters and the dead letters.
+
+        Parameters
+        -----------------------
+        None
+
+        Returns
+        -----------------------
+        None
+        """
+        with self._condition:
+            stats, letters = dict(self.stats), list(self.dead_letters)
+        print(", ".join(f"{count} {name}" for name, count in stats.items()))
+        for letter in letters:
+            print(f"Gave up on {letter['url']} after {letter['attempts']} attempts: {letter['reason']}")
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def configure(limits=None, default_limits=DEFAULT_LIMITS, workers=16, max_attempts=MAX_ATTEMPTS, backoff=BACKOFF):
+    """
+    Replaces the shared scheduler, see RequestScheduler for the parameters.
+
+    Returns
+    -----------------------
+    RequestScheduler:
+        The new shared scheduler.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = RequestScheduler(limits, default_limits, workers, max_attempts, backoff)
+    return _scheduler
+
+def get_scheduler():
+    """
+    Returns the shared scheduler, creating it with the default limits on first use.
+
+    Parameters
+    -----------------------
+    None
+
+    Returns
+    -----------------------
+    RequestScheduler:
+        The scheduler every fetch in players_api.py and PIM.py goes through.
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RequestScheduler()
+    return _scheduler
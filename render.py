@@ -0,0 +1,126 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+import matplotlib.pyplot as plt
+
+# Headless chart rendering. Plotting functions draw on render.figure() and end
+# with render.finish(out_path): with a path the chart is saved to a file, with
+# None it is shown in a window like before. render_charts runs a list of charts
+# in worker processes on the Agg backend, so nothing needs a display.
+
+DEFAULT_SIZE = (6.4, 4.8)
+
+# Figures kept per size in this process and cleared for the next chart, instead
+# of building a new figure for every call
+_templates = {}
+
+def use_headless():
+    """
+    Switches matplotlib to the Agg backend, which draws to files without a display.
+
+    Parameters
+    -----------------------
+    None
+
+    Returns
+    -----------------------
+    None
+    """
+    matplotlib.use("Agg")
+    plt.switch_backend("Agg")
+
+def figure(size=DEFAULT_SIZE):
+    """
+    Returns a cleared figure of the given size and makes it the current figure.
+    A figure already made at that size in this process is reused.
+
+    Parameters
+    -----------------------
+    size: tuple
+        (width, height) in inches.
+
+    Returns
+    -----------------------
+    Figure:
+        The current matplotlib figure.
+    """
+    fig = _templates.get(size)
+    if fig is None or not plt.fignum_exists(fig.number):
+        fig = plt.figure(figsize=size)
+        _templates[size] = fig
+    else:
+        fig.clf()
+        plt.figure(fig.number)
+    return fig
+
+def finish(out_path=None):
+    """
+    Ends a chart: saves the current figure when out_path is given, otherwise shows it.
+
+    Parameters
+    -----------------------
+    out_path: str
+        File to save to, the extension (.png, .svg, ...) picks the format. None shows the chart.
+
+    Returns
+    -----------------------
+    None
+    """
+    if out_path:
+        plt.savefig(out_path)
+    else:
+        plt.show()
+
+def _render_one(name, function, args, out_path):
+    start = time.perf_counter()
+    function(*args, out_path=out_path)
+    return name, out_path, time.perf_counter() - start
+
+def render_charts(charts, out_dir, file_format="png", workers=None):
+    """
+    Renders charts to files in parallel worker processes on the Agg backend
+    and prints how long each one took.
+
+    Parameters
+    -----------------------
+    charts: list of tuples
+        (name, function, args) for each chart. function is a module-level plotting
+        function that takes out_path as a keyword argument, name is used for the file name.
+
+    out_dir: str
+        Folder the files are written to, created if missing.
+
+    file_format: str
+        "png" or "svg".
+
+    workers: int
+        Number of worker processes. None uses one per CPU, up to the number of charts.
+
+    Returns
+    -----------------------
+    timings: list of tuples
+        (name, path, seconds) for each chart, in the order they were given.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    use_headless()
+    workers = workers or min(len(charts), os.cpu_count() or 1) or 1
+    # fork keeps the parent's already imported modules, so the plotting functions
+    # don't have to be imported again in every worker
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=use_headless) as pool:
+        futures = [
+            pool.submit(_render_one, name, function, args, os.path.join(out_dir, f"{name}.{file_format}"))
+            for name, function, args in charts
+        ]
+        timings = [future.result() for future in futures]
+    total = time.perf_counter() - start
+
+    print(f"{'chart':<32} {'seconds':>8}")
+    for name, _, seconds in timings:
+        print(f"{name:<32} {seconds:>8.3f}")
+    print(f"{len(timings)} charts in {total:.2f}s with {workers} workers")
+    return timings
@@ -0,0 +1,472 @@
+import re
+import sys
+import sqlite3
+import metrics
+import seasons
+
+# Versioned schema for the season databases. Each entry in MIGRATIONS is a list
+# of statements, applied in order and recorded in PRAGMA user_version so every
+# database file only runs the ones it has not seen yet. Add new migrations to
+# the end of the list, never edit one that has shipped.
+
+# Recomputes the Team_Summary rows of the teams in Team_Summary_Dirty and clears
+# the marks. Run by bulk_loader.refresh_team_summary after every write and by migration 12.
+TEAM_SUMMARY_REFRESH = [
+    "DELETE FROM Team_Summary WHERE team IN (SELECT team FROM Team_Summary_Dirty)",
+    """INSERT INTO Team_Summary (team, goals, penalties, salary, goals_per_million, penalties_per_million, first_seen)
+    SELECT Player_Teams.team, SUM(goals), SUM(penalty_min), SUM(salary),
+        CASE WHEN SUM(salary) > 0 THEN SUM(goals) / (SUM(salary) / 1000000.0) ELSE 0 END,
+        CASE WHEN SUM(salary) > 0 THEN SUM(penalty_min) / (SUM(salary) / 1000000.0) ELSE 0 END,
+        MIN(Players.player_id * 16 + Player_Teams.position)
+    FROM Player_Teams
+    JOIN Players ON Players.player_id = Player_Teams.player_id
+    WHERE salary AND Player_Teams.team IN (SELECT team FROM Team_Summary_Dirty)
+    GROUP BY Player_Teams.team""",
+    "DELETE FROM Team_Summary_Dirty",
+]
+
+MIGRATIONS = [
+    # 1: base tables, as created by the original set_up_player_table and set_up_ncaa_table
+    [
+        "CREATE TABLE IF NOT EXISTS Players (player_id INTEGER PRIMARY KEY, name TEXT, team_id INTEGER, salary INTEGER, games INTEGER, points INTEGER, penalty_min INTEGER, avg_icetime INTEGER, goals INTEGER, assists INTEGER, plus_minus INTEGER, shooting_perc FLOAT)",
+        "CREATE TABLE IF NOT EXISTS NHL_Teams (team_id INTEGER PRIMARY KEY, name TEXT)",
+        "CREATE TABLE IF NOT EXISTS NCAA_Teams (team_id INTEGER PRIMARY KEY, name TEXT UNIQUE)",
+        """CREATE TABLE IF NOT EXISTS NCAA_Players (
+            player_id INTEGER PRIMARY KEY,
+            name TEXT,
+            team_id INTEGER,
+            games INTEGER,
+            points INTEGER,
+            penalty_min INTEGER,
+            goals INTEGER,
+            assists INTEGER,
+            FOREIGN KEY(team_id) REFERENCES NCAA_Teams(team_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS Ingest_Checkpoint (
+            source TEXT,
+            season TEXT,
+            last_offset INTEGER,
+            complete INTEGER,
+            fetched_at TEXT,
+            PRIMARY KEY (source, season)
+        )""",
+    ],
+    # 2: covering indexes for the threshold queries in Penalty_vs_Points_Graph
+    # and the team join in NHL_team_success.get_info
+    [
+        "CREATE INDEX IF NOT EXISTS idx_players_games_points_pens ON Players (games, points, penalty_min, name)",
+        "CREATE INDEX IF NOT EXISTS idx_ncaa_players_games_points_pens ON NCAA_Players (games, points, penalty_min, name)",
+        "CREATE INDEX IF NOT EXISTS idx_players_team ON Players (team_id, goals, penalty_min, salary)",
+        "ANALYZE",
+    ],
+    # 3: one row per entry in a player's comma-joined NHL_Teams name like "MTL,WPG"
+    # so team totals can be a GROUP BY. Keyed on position, not team, because the API
+    # repeats a team the player went back to ("WSH,PIT,WSH") and the team totals
+    # have always counted that stint twice.
+    [
+        """CREATE TABLE IF NOT EXISTS Player_Teams (
+            player_id INTEGER,
+            position INTEGER,
+            team TEXT,
+            PRIMARY KEY (player_id, position)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_player_teams_team ON Player_Teams (team, player_id)",
+        """INSERT OR IGNORE INTO Player_Teams (player_id, team, position)
+        WITH RECURSIVE split(player_id, team, position, rest) AS (
+            SELECT Players.player_id, '', -1, NHL_Teams.name || ','
+            FROM Players JOIN NHL_Teams ON Players.team_id = NHL_Teams.team_id
+            UNION ALL
+            SELECT player_id, substr(rest, 1, instr(rest, ',') - 1), position + 1, substr(rest, instr(rest, ',') + 1)
+            FROM split WHERE rest <> ''
+        )
+        SELECT player_id, team, position FROM split WHERE position >= 0""",
+    ],
+    # 4: materialized team totals. Triggers mark a team dirty whenever one of its
+    # players' rows change, and bulk_loader.refresh_team_summary recomputes only
+    # the dirty teams. first_seen keeps the order teams first show up in Players.
+    # Inside a trigger SQLite uses the conflict policy of the outer statement, so
+    # INSERT OR IGNORE would still fail under the Players UPSERT; a mark is only
+    # inserted when it is missing instead.
+    [
+        """CREATE TABLE IF NOT EXISTS Team_Summary (
+            team TEXT PRIMARY KEY,
+            goals INTEGER,
+            penalties INTEGER,
+            salary INTEGER,
+            goals_per_million FLOAT,
+            penalties_per_million FLOAT,
+            first_seen INTEGER
+        )""",
+        "CREATE TABLE IF NOT EXISTS Team_Summary_Dirty (team TEXT PRIMARY KEY) WITHOUT ROWID",
+        """CREATE TRIGGER IF NOT EXISTS player_teams_insert_dirty AFTER INSERT ON Player_Teams BEGIN
+            INSERT INTO Team_Summary_Dirty (team) SELECT NEW.team
+            WHERE NOT EXISTS (SELECT 1 FROM Team_Summary_Dirty WHERE team = NEW.team);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS player_teams_delete_dirty AFTER DELETE ON Player_Teams BEGIN
+            INSERT INTO Team_Summary_Dirty (team) SELECT OLD.team
+            WHERE NOT EXISTS (SELECT 1 FROM Team_Summary_Dirty WHERE team = OLD.team);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS players_update_dirty AFTER UPDATE OF goals, penalty_min, salary ON Players BEGIN
+            INSERT INTO Team_Summary_Dirty (team) SELECT DISTINCT team FROM Player_Teams
+            WHERE player_id = NEW.player_id AND NOT EXISTS (SELECT 1 FROM Team_Summary_Dirty WHERE team = Player_Teams.team);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS players_delete_dirty AFTER DELETE ON Players BEGIN
+            INSERT INTO Team_Summary_Dirty (team) SELECT DISTINCT team FROM Player_Teams
+            WHERE player_id = OLD.player_id AND NOT EXISTS (SELECT 1 FROM Team_Summary_Dirty WHERE team = Player_Teams.team);
+        END""",
+        "INSERT OR IGNORE INTO Team_Summary_Dirty (team) SELECT DISTINCT team FROM Player_Teams",
+    ],
+    # 5: NCAA players linked to the NHL player_id they became, filled by identity.link_players
+    [
+        """CREATE TABLE IF NOT EXISTS Player_Links (
+            ncaa_player_id INTEGER PRIMARY KEY,
+            nhl_player_id INTEGER,
+            score FLOAT,
+            method TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_player_links_nhl ON Player_Links (nhl_player_id)",
+    ],
+    # 6: (name, team_id) is the natural key of an NCAA player. Re-scrapes used to
+    # add a second copy of a team's players, so the copies are removed first,
+    # keeping the oldest player_id that Player_Links may point to. NCAA_Team_Pages
+    # keeps a hash of each team's roster page so unchanged pages aren't parsed again.
+    [
+        """DELETE FROM Player_Links WHERE ncaa_player_id IN (
+            SELECT player_id FROM NCAA_Players
+            WHERE player_id NOT IN (SELECT MIN(player_id) FROM NCAA_Players GROUP BY name, team_id)
+        )""",
+        "DELETE FROM NCAA_Players WHERE player_id NOT IN (SELECT MIN(player_id) FROM NCAA_Players GROUP BY name, team_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_ncaa_players_name_team ON NCAA_Players (name, team_id)",
+        """CREATE TABLE IF NOT EXISTS NCAA_Team_Pages (
+            team_id INTEGER PRIMARY KEY,
+            season_url TEXT,
+            content_hash TEXT,
+            fetched_at TEXT
+        )""",
+    ],
+    # 7: every contract the Puckpedia feed lists for a player, past, current and
+    # future, while Players.salary keeps only the current cap hit
+    [
+        """CREATE TABLE IF NOT EXISTS Contracts (
+            player_id INTEGER,
+            status TEXT,
+            position INTEGER,
+            cap_hit INTEGER,
+            details TEXT,
+            fetched_at TEXT,
+            PRIMARY KEY (player_id, status, position)
+        ) WITHOUT ROWID""",
+    ],
+    # 8: the penalties, realtime and timeonice skater reports, one table each keyed
+    # on player_id next to Players instead of more columns on it, so queries on
+    # the Players columns read no more pages than before. Player_Stats_Wide puts
+    # every column back together for analysis.
+    [
+        """CREATE TABLE IF NOT EXISTS Player_Penalties (
+            player_id INTEGER PRIMARY KEY,
+            penalties INTEGER,
+            minor_penalties INTEGER,
+            major_penalties INTEGER,
+            match_penalties INTEGER,
+            misconduct_penalties INTEGER,
+            game_misconduct_penalties INTEGER,
+            penalties_drawn INTEGER,
+            net_penalties INTEGER,
+            penalty_seconds_per_game FLOAT,
+            penalties_drawn_per_60 FLOAT,
+            penalties_taken_per_60 FLOAT
+        ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS Player_Realtime (
+            player_id INTEGER PRIMARY KEY,
+            hits INTEGER,
+            blocked_shots INTEGER,
+            giveaways INTEGER,
+            takeaways INTEGER,
+            missed_shots INTEGER,
+            first_goals INTEGER,
+            empty_net_goals INTEGER,
+            hits_per_60 FLOAT,
+            blocked_shots_per_60 FLOAT,
+            giveaways_per_60 FLOAT,
+            takeaways_per_60 FLOAT
+        ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS Player_Time_On_Ice (
+            player_id INTEGER PRIMARY KEY,
+            time_on_ice INTEGER,
+            ev_time_on_ice INTEGER,
+            pp_time_on_ice INTEGER,
+            sh_time_on_ice INTEGER,
+            shifts INTEGER,
+            time_on_ice_per_shift FLOAT,
+            ev_time_on_ice_per_game FLOAT,
+            pp_time_on_ice_per_game FLOAT,
+            sh_time_on_ice_per_game FLOAT
+        ) WITHOUT ROWID""",
+        """CREATE VIEW IF NOT EXISTS Player_Stats_Wide AS
+        SELECT Players.*,
+            penalties, minor_penalties, major_penalties, match_penalties, misconduct_penalties,
+            game_misconduct_penalties, penalties_drawn, net_penalties, penalty_seconds_per_game,
+            penalties_drawn_per_60, penalties_taken_per_60,
+            hits, blocked_shots, giveaways, takeaways, missed_shots, first_goals, empty_net_goals,
+            hits_per_60, blocked_shots_per_60, giveaways_per_60, takeaways_per_60,
+            time_on_ice, ev_time_on_ice, pp_time_on_ice, sh_time_on_ice, shifts, time_on_ice_per_shift,
+            ev_time_on_ice_per_game, pp_time_on_ice_per_game, sh_time_on_ice_per_game
+        FROM Players
+        LEFT JOIN Player_Penalties ON Player_Penalties.player_id = Players.player_id
+        LEFT JOIN Player_Realtime ON Player_Realtime.player_id = Players.player_id
+        LEFT JOIN Player_Time_On_Ice ON Player_Time_On_Ice.player_id = Players.player_id""",
+    ],
+    # 9: per-game, per-60 and points per penalty minute rates, filled here and
+    # kept current by metrics.refresh_metrics for the NCAA players the triggers
+    # mark dirty and the Players in Players_Pending (migration 11). The index
+    # covers the threshold query in get_pts_per_penalty_minute. The marks are
+    # inserted only when missing rather than with INSERT OR IGNORE, because
+    # inside a trigger SQLite uses the conflict policy of the outer statement.
+    [
+        """CREATE TABLE IF NOT EXISTS Players_Metrics (
+            player_id INTEGER PRIMARY KEY,
+            games INTEGER,
+            points INTEGER,
+            penalty_min INTEGER,
+            pts_per_pim FLOAT,
+            points_per_game FLOAT,
+            goals_per_game FLOAT,
+            penalties_per_game FLOAT,
+            points_per_60 FLOAT,
+            goals_per_60 FLOAT,
+            penalties_per_60 FLOAT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_players_metrics_thresholds ON Players_Metrics (games, points, penalty_min, pts_per_pim)",
+        f"INSERT OR REPLACE INTO Players_Metrics ({', '.join(metrics.METRIC_COLUMNS)}) {metrics.metrics_query('Players')}",
+        """CREATE TABLE IF NOT EXISTS NCAA_Players_Metrics (
+            player_id INTEGER PRIMARY KEY,
+            games INTEGER,
+            points INTEGER,
+            penalty_min INTEGER,
+            pts_per_pim FLOAT,
+            points_per_game FLOAT,
+            goals_per_game FLOAT,
+            penalties_per_game FLOAT,
+            points_per_60 FLOAT,
+            goals_per_60 FLOAT,
+            penalties_per_60 FLOAT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_ncaa_players_metrics_thresholds ON NCAA_Players_Metrics (games, points, penalty_min, pts_per_pim)",
+        "CREATE TABLE IF NOT EXISTS NCAA_Players_Metrics_Dirty (player_id INTEGER PRIMARY KEY) WITHOUT ROWID",
+        """CREATE TRIGGER IF NOT EXISTS ncaa_players_insert_metrics_dirty AFTER INSERT ON NCAA_Players BEGIN
+            INSERT INTO NCAA_Players_Metrics_Dirty (player_id) SELECT NEW.player_id WHERE NEW.player_id NOT IN (SELECT player_id FROM NCAA_Players_Metrics_Dirty);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS ncaa_players_update_metrics_dirty AFTER UPDATE OF games, points, penalty_min, goals ON NCAA_Players BEGIN
+            INSERT INTO NCAA_Players_Metrics_Dirty (player_id) SELECT NEW.player_id WHERE NEW.player_id NOT IN (SELECT player_id FROM NCAA_Players_Metrics_Dirty);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS ncaa_players_delete_metrics_dirty AFTER DELETE ON NCAA_Players BEGIN
+            INSERT INTO NCAA_Players_Metrics_Dirty (player_id) SELECT OLD.player_id WHERE OLD.player_id NOT IN (SELECT player_id FROM NCAA_Players_Metrics_Dirty);
+        END""",
+        f"INSERT OR REPLACE INTO NCAA_Players_Metrics ({', '.join(metrics.METRIC_COLUMNS)}) {metrics.metrics_query('NCAA_Players')}",
+    ],
+    # 10: a counter bumped by every bulk_loader write and migration, part of the
+    # query_cache key so cached query results are dropped once the data changes
+    [
+        "CREATE TABLE IF NOT EXISTS DB_Generation (id INTEGER PRIMARY KEY CHECK (id = 0), generation INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO DB_Generation (id, generation) VALUES (0, 0)",
+    ],
+    # 11: players whose Player_Teams and Players_Metrics rows are behind their
+    # Players row. bulk_loader.refresh_players catches them up once per ingest,
+    # so bulk_insert_players only writes the rows it was given. The table has no
+    # key: the triggers append without a lookup or a conflict to resolve, and a
+    # player written twice is simply listed twice.
+    [
+        "CREATE TABLE IF NOT EXISTS Players_Pending (player_id INTEGER)",
+        """CREATE TRIGGER IF NOT EXISTS players_insert_pending AFTER INSERT ON Players BEGIN
+            INSERT INTO Players_Pending (player_id) VALUES (NEW.player_id);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS players_update_pending AFTER UPDATE OF team_id, games, points, penalty_min, goals, avg_icetime ON Players BEGIN
+            INSERT INTO Players_Pending (player_id) VALUES (NEW.player_id);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS players_delete_pending AFTER DELETE ON Players BEGIN
+            INSERT INTO Players_Pending (player_id) VALUES (OLD.player_id);
+        END""",
+    ],
+    # 12: Team_Summary is only refreshed by the writers now, so readers can use
+    # a read-only connection. Catch up the teams migration 4 and earlier
+    # versions left marked.
+    TEAM_SUMMARY_REFRESH,
+]
+
+# The analytic queries the indexes above are for, with sample parameters.
+# check_query_plans fails if any of them goes back to scanning a whole table.
+ANALYTIC_QUERIES = {
+    "get_player_points_pens (Players)": (
+        "SELECT name, points, penalty_min, games FROM Players WHERE games >= ? AND (points >= ? OR penalty_min >= ?)",
+        (41, 30, 40), ["Players"]),
+    "get_player_points_pens (NCAA_Players)": (
+        "SELECT name, points, penalty_min, games FROM NCAA_Players WHERE games >= ? AND (points >= ? OR penalty_min >= ?)",
+        (16, 12, 15), ["NCAA_Players"]),
+    "get_pts_per_penalty_minute (Players)": (
+        "SELECT pts_per_pim FROM Players_Metrics WHERE games >= ? AND points >= ? AND penalty_min >= ? AND pts_per_pim IS NOT NULL",
+        (10, 5, 5), ["Players_Metrics"]),
+    "get_pts_per_penalty_minute (NCAA_Players)": (
+        "SELECT pts_per_pim FROM NCAA_Players_Metrics WHERE games >= ? AND points >= ? AND penalty_min >= ? AND pts_per_pim IS NOT NULL",
+        (5, 2, 2), ["NCAA_Players_Metrics"]),
+    "refresh_team_summary": (
+        "SELECT Player_Teams.team, SUM(goals), SUM(penalty_min), SUM(salary) FROM Player_Teams JOIN Players ON Players.player_id = Player_Teams.player_id WHERE salary AND Player_Teams.team IN (SELECT team FROM Team_Summary_Dirty) GROUP BY Player_Teams.team",
+        (), ["Players", "Player_Teams"]),
+    "get_info": (
+        "SELECT NHL_Teams.name, goals, penalty_min, salary FROM Players JOIN NHL_Teams ON Players.team_id = NHL_Teams.team_id",
+        (), ["Players"]),
+}
+
+# Schema version that added DB_Generation
+GENERATION_VERSION = 10
+
+def migrate(cur, conn):
+    """
+    Brings a database up to the latest schema version.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    conn: Connection
+        The database connection object.
+
+    Returns
+    -----------------------
+    Int:
+        The schema version after migrating.
+    """
+    cur.execute("PRAGMA user_version")
+    version = cur.fetchone()[0]
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        with conn:
+            for statement in statements:
+                cur.execute(statement)
+            cur.execute(f"PRAGMA user_version = {number}")
+            if number >= GENERATION_VERSION:
+                bump_generation(cur)
+    return len(MIGRATIONS)
+
+def bump_generation(cur):
+    """
+    Adds one to the database generation so results cached by query_cache for
+    the old data are no longer used. Call it in the same transaction as the write.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    Returns
+    -----------------------
+    None
+    """
+    cur.execute("UPDATE DB_Generation SET generation = generation + 1 WHERE id = 0")
+
+def get_generation(cur, schema="main"):
+    """
+    Reads the database generation.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    schema: str
+        Schema name of the database, "main" or an attached one.
+
+    Returns
+    -----------------------
+    Int:
+        The generation, or None if the database is older than schema version 10.
+    """
+    try:
+        cur.execute(f"SELECT generation FROM {schema}.DB_Generation WHERE id = 0")
+    except sqlite3.OperationalError:
+        return None
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def full_scans(cur, query, params=(), tables=None):
+    """
+    Runs EXPLAIN QUERY PLAN and lists the tables SQLite would read row by row without an index.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    query: str
+        The SELECT statement to check.
+
+    params: tuple
+        Parameters for the query.
+
+    tables: list
+        Only report scans of these tables. If None, every table is checked.
+
+    Returns
+    -----------------------
+    scans: list
+        The plan lines that are full table scans.
+    """
+    cur.execute("EXPLAIN QUERY PLAN " + query, params)
+    scans = []
+    for row in cur.fetchall():
+        detail = row[-1]
+        match = re.match(r"SCAN (?:\w+\.)?(\w+)", detail)
+        if match and "INDEX" not in detail and (tables is None or match.group(1) in tables):
+            scans.append(detail)
+    return scans
+
+def assert_no_full_scan(cur, query, params=(), tables=None):
+    """
+    Raises AssertionError if the query plan scans a whole table instead of using an index.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    query: str
+        The SELECT statement to check.
+
+    params: tuple
+        Parameters for the query.
+
+    tables: list
+        Only fail on scans of these tables. If None, every table is checked.
+
+    Returns
+    -----------------------
+    None
+    """
+    scans = full_scans(cur, query, params, tables)
+    assert not scans, f"Full table scan in plan for {query!r}: {scans}"
+
+def check_query_plans(cur):
+    """
+    Checks every query in ANALYTIC_QUERIES against the connected database.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        The database cursor object.
+
+    Returns
+    -----------------------
+    None
+    """
+    for name, (query, params, tables) in ANALYTIC_QUERIES.items():
+        scans = full_scans(cur, query, params, tables)
+        assert not scans, f"{name} regressed to a full table scan: {scans}"
+        print(f"ok  {name}")
+
+if __name__ == "__main__":
+    # Migrate a season database and check its query plans, the current season by default
+    path = sys.argv[1] if len(sys.argv) > 1 else seasons.season_db_path()
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    print(f"{path}: schema version {migrate(cur, conn)}")
+    check_query_plans(cur)
+    conn.close()
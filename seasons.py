@@ -0,0 +1,135 @@
+import os
+
+# Helpers for storing each season in its own database file. A season's regular
+# season lives in players<yy><yy>.db (players2324.db for 2023-24) and its playoffs
+# in players<yy><yy>_playoffs.db, so a query only opens the seasons it needs.
+
+CURRENT_SEASON = "20232024"
+
+GAME_TYPES = {"2": "regular", "3": "playoffs"}
+
+# SQLite's default limit on databases attached to one connection
+MAX_ATTACHED = 10
+
+def season_range(first_season, last_season):
+    """
+    Lists every season ID from first_season to last_season.
+
+    Parameters
+    -----------------------
+    first_season: str
+        First season ID, like "20142015".
+
+    last_season: str
+        Last season ID, like "20232024".
+
+    Returns
+    -----------------------
+    seasons: list
+        Season ID strings in order.
+    """
+    return [f"{year}{year + 1}" for year in range(int(first_season[:4]), int(last_season[:4]) + 1)]
+
+def season_db_name(season=CURRENT_SEASON, game_type="2"):
+    """
+    Gives the database file name for a season and game type.
+
+    Parameters
+    -----------------------
+    season: str
+        Season ID, like "20232024".
+
+    game_type: str
+        "2" for the regular season, "3" for playoffs.
+
+    Returns
+    -----------------------
+    String:
+        The file name, like "players2324.db".
+    """
+    name = f"players{season[2:4]}{season[6:8]}"
+    if game_type != "2":
+        name += "_" + GAME_TYPES[game_type]
+    return name + ".db"
+
+def season_db_path(season=CURRENT_SEASON, game_type="2"):
+    """
+    Gives the full path of a season's database file next to this module.
+
+    Parameters
+    -----------------------
+    season: str
+        Season ID, like "20232024".
+
+    game_type: str
+        "2" for the regular season, "3" for playoffs.
+
+    Returns
+    -----------------------
+    String:
+        Absolute path of the database file.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), season_db_name(season, game_type))
+
+def hockeydb_label(season):
+    """
+    Turns a season ID into the label hockeydb.com uses for it.
+
+    Parameters
+    -----------------------
+    season: str
+        Season ID, like "20232024".
+
+    Returns
+    -----------------------
+    String:
+        The label, like "2023-24".
+    """
+    return f"{season[:4]}-{season[6:8]}"
+
+def query_seasons(cur, query, params, seasons, game_type="2"):
+    """
+    Runs a query against several season databases and returns all of their rows.
+    The query uses {schema} in front of table names, for example
+    "SELECT name FROM {schema}.Players WHERE games >= ?". Each season's file is
+    attached under its own schema name and the per-season queries are joined with
+    UNION ALL, in groups small enough for SQLite's attach limit. Seasons that have
+    no database file yet are skipped.
+
+    Parameters
+    -----------------------
+    cur: Cursor
+        A cursor on any database connection.
+
+    query: str
+        SELECT statement with a {schema} placeholder.
+
+    params: tuple
+        Parameters for one copy of the query, repeated for each season.
+
+    seasons: list
+        Season IDs to read.
+
+    game_type: str
+        "2" for the regular season, "3" for playoffs.
+
+    Returns
+    -----------------------
+    rows: list of tuples
+        The rows from every season, in season order.
+    """
+    available = [season for season in seasons if os.path.exists(season_db_path(season, game_type))]
+    rows = []
+    for i in range(0, len(available), MAX_ATTACHED - 1):
+        group = available[i:i + MAX_ATTACHED - 1]
+        schemas = [f"s{season}_{game_type}" for season in group]
+        for season, schema in zip(group, schemas):
+            cur.execute(f"ATTACH DATABASE ? AS {schema}", (season_db_path(season, game_type),))
+        try:
+            union = " UNION ALL ".join(query.format(schema=schema) for schema in schemas)
+            cur.execute(union, tuple(params) * len(schemas))
+            rows.extend(cur.fetchall())
+        finally:
+            for schema in schemas:
+                cur.execute(f"DETACH DATABASE {schema}")
+    return rows
@@ -0,0 +1,235 @@
+import numpy as np
+import query_cache
+
+# Evaluates the threshold filters of Penalty_vs_Points_Graph for a whole grid of
+# (min_gp, min_pts, min_pen) values from one read of the table, instead of one
+# query per combination.
+#
+# Every player falls into one cell per axis: the number of grid thresholds its
+# value reaches. Summing the players' moments (n, x, y, x², y², xy with x the
+# penalty minutes and y the points) per cell and then taking suffix sums along
+# each axis gives, at [i + 1, j + 1, k + 1], the moments of the players with
+# games >= min_gp[i] AND points >= min_pts[j] AND penalty_min >= min_pen[k].
+# Index 0 of an axis has no threshold, so the OR in get_player_points_pens is
+#     S[i+1, j+1, 0] + S[i+1, 0, k+1] - S[i+1, j+1, k+1]
+# and the regression line and r follow from the moments. Counts and sums stay
+# integers so nothing is lost to rounding before the final division.
+
+COLUMNS = [("games", np.int64), ("points", np.int64), ("penalty_min", np.int64)]
+
+def load_columns(table, cur, season_ids=None, game_type="2"):
+    """
+    Reads the games, points and penalty minutes of every player in a table.
+
+    Parameters
+    -----------------------
+    table: str
+        "Players" or "NCAA_Players".
+
+    cur: Cursor
+        The database cursor object.
+
+    season_ids: list
+        Optional season IDs to read from their own database files. If None, only the connected database is read.
+
+    game_type: str
+        "2" for the regular season, "3" for playoffs. Used with season_ids.
+
+    Returns
+    -----------------------
+    Dictionary {name: ndarray}:
+        Integer arrays "games", "points" and "penalty_min". Missing values are 0.
+    """
+    query = f"SELECT COALESCE(games, 0), COALESCE(points, 0), COALESCE(penalty_min, 0) FROM {{schema}}.{table}"
+    return query_cache.fetch_columns(cur, query, (), COLUMNS, season_ids, game_type)
+
+def suffix_moments(cells, shape, weights):
+    """
+    Adds up weights per grid cell and turns the totals into suffix sums along every axis.
+
+    Parameters
+    -----------------------
+    cells: tuple of ndarray
+        Cell index of each player on each axis.
+
+    shape: tuple
+        Number of cells on each axis.
+
+    weights: list of ndarray
+        One array per moment, one value per player.
+
+    Returns
+    -----------------------
+    list of ndarray:
+        One array of the given shape per moment. Entry [a, b, c] is the sum of
+        the moment over the players in cells at or above (a, b, c). Integer
+        weights give exact int64 sums.
+    """
+    flat = np.ravel_multi_index(cells, shape)
+    size = int(np.prod(shape))
+    totals = []
+    for weight in weights:
+        total = np.bincount(flat, weights=weight, minlength=size)
+        # bincount sums in float64, which is exact for integer sums below 2 ** 53
+        totals.append(np.rint(total).astype(np.int64) if weight.dtype.kind in "iub" else total)
+    moments = []
+    for total in totals:
+        total = total.reshape(shape)
+        for axis in range(total.ndim):
+            total = np.flip(np.cumsum(np.flip(total, axis), axis=axis), axis)
+        moments.append(total)
+    return moments
+
+def threshold_cells(values, thresholds):
+    """
+    Counts how many thresholds each value reaches.
+
+    Parameters
+    -----------------------
+    values: ndarray
+        Integer values, one per player.
+
+    thresholds: ndarray
+        Sorted, distinct integer thresholds.
+
+    Returns
+    -----------------------
+    ndarray:
+        For each value, the number of thresholds less than or equal to it.
+    """
+    if not len(values):
+        return np.zeros(0, dtype=np.intp)
+    # Stats cover a small range of integers, so a table indexed by value is much
+    # faster than a binary search per player
+    low = int(values.min())
+    table = np.searchsorted(thresholds, np.arange(low, int(values.max()) + 1), side="right")
+    return table[values - low]
+
+def sweep(columns, min_gp, min_pts, min_pen):
+    """
+    Works out the result of both threshold queries for every combination of the given thresholds.
+
+    Parameters
+    -----------------------
+    columns: dict
+        Integer arrays "games", "points" and "penalty_min", for example from load_columns.
+
+    min_gp: list
+        Minimum games played values.
+
+    min_pts: list
+        Minimum points values.
+
+    min_pen: list
+        Minimum penalty minutes values.
+
+    Returns
+    -----------------------
+    Dictionary {name: ndarray}:
+        Arrays of shape (len(min_gp), len(min_pts), len(min_pen)), in the order the thresholds were given.
+        For the players get_player_points_pens returns (games >= min_gp AND (points >= min_pts OR penalty_min >= min_pen)):
+        "count", and "slope", "intercept" and "r" of the points against penalty minutes line np.polyfit would fit.
+        For the players get_pts_per_penalty_minute returns (games, points and penalty minutes all over their minimum,
+        penalty minutes above 0): "ratio_count" and "ratio_mean", their mean points per penalty minute.
+        Values that are undefined for too few players are NaN.
+    """
+    games, points, pens = (np.asarray(columns[name], dtype=np.int64) for name in ("games", "points", "penalty_min"))
+    axes, inverse, cells = [], [], []
+    for values, thresholds in ((games, min_gp), (points, min_pts), (pens, min_pen)):
+        unique, order = np.unique(np.asarray(thresholds, dtype=np.int64), return_inverse=True)
+        axes.append(unique)
+        inverse.append(order)
+        cells.append(threshold_cells(values, unique))
+    shape = tuple(len(unique) + 1 for unique in axes)
+
+    has_pens = pens > 0
+    ratios = np.divide(points, pens, out=np.zeros(len(pens)), where=has_pens)
+    n, sx, sy, sxx, syy, sxy, ratio_n, ratio_sum = suffix_moments(
+        tuple(cells), shape,
+        [np.ones_like(pens), pens, points, pens * pens, points * points, pens * points, has_pens.astype(np.int64), ratios])
+
+    # Only the thresholded corners are returned, index 0 is "no threshold" on that axis
+    def both(moment):
+        return moment[1:, 1:, 1:]
+
+    def either(moment):
+        return moment[1:, 1:, :1] + moment[1:, :1, 1:] - moment[1:, 1:, 1:]
+
+    count = either(n)
+    x, y, xx, yy, xy = (either(moment) for moment in (sx, sy, sxx, syy, sxy))
+    cov = count * xy - x * y
+    var_x = count * xx - x * x
+    var_y = count * yy - y * y
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(var_x > 0, cov / var_x, np.nan)
+        intercept = (y - slope * x) / count
+        r = np.where((var_x > 0) & (var_y > 0), cov / np.sqrt(var_x.astype(np.float64) * var_y), np.nan)
+        ratio_count = both(ratio_n)
+        ratio_mean = np.where(ratio_count > 0, both(ratio_sum) / ratio_count, np.nan)
+
+    results = {"count": count, "slope": slope, "intercept": intercept, "r": r, "ratio_count": ratio_count, "ratio_mean": ratio_mean}
+    gp_order, pts_order, pen_order = inverse
+    return {name: values[gp_order][:, pts_order][:, :, pen_order] for name, values in results.items()}
+
+def sweep_table(table, min_gp, min_pts, min_pen, cur, season_ids=None, game_type="2"):
+    """
+    Reads a table once and sweeps it over the threshold grid.
+
+    Parameters
+    -----------------------
+    table: str
+        "Players" or "NCAA_Players".
+
+    min_gp: list
+        Minimum games played values.
+
+    min_pts: list
+        Minimum points values.
+
+    min_pen: list
+        Minimum penalty minutes values.
+
+    cur: Cursor
+        The database cursor object.
+
+    season_ids: list
+        Optional season IDs to read from their own database files.
+
+    game_type: str
+        "2" for the regular season, "3" for playoffs. Used with season_ids.
+
+    Returns
+    -----------------------
+    Dictionary {name: ndarray}:
+        The arrays from sweep.
+    """
+    return sweep(load_columns(table, cur, season_ids, game_type), min_gp, min_pts, min_pen)
+
+def iter_grid(results, min_gp, min_pts, min_pen):
+    """
+    Flattens sweep results into one row per threshold combination.
+
+    Parameters
+    -----------------------
+    results: dict
+        Arrays from sweep.
+
+    min_gp: list
+        The minimum games played values given to sweep.
+
+    min_pts: list
+        The minimum points values given to sweep.
+
+    min_pen: list
+        The minimum penalty minutes values given to sweep.
+
+    Yields
+    -----------------------
+    Tuple:
+        (min_gp, min_pts, min_pen, count, slope, intercept, r, ratio_count, ratio_mean)
+    """
+    for i, gp in enumerate(min_gp):
+        for j, pts in enumerate(min_pts):
+            for k, pen in enumerate(min_pen):
+                yield (gp, pts, pen) + tuple(results[name][i, j, k].item()
+                                             for name in ("count", "slope", "intercept", "r", "ratio_count", "ratio_mean"))